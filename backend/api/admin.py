@@ -1,7 +1,7 @@
 from django.contrib import admin
 from .models import (
     Aluno, Nota, HorarioAula, Frequencia, DadoFinanceiro, 
-    Matricula, DisciplinaMatriculada, ChatHistorico
+    Matricula, DisciplinaMatriculada, ChatHistorico, UsoLLM
 )
 
 @admin.register(Aluno)
@@ -52,3 +52,9 @@ class ChatHistoricoAdmin(admin.ModelAdmin):
     search_fields = ('aluno__nome', 'pergunta', 'resposta')
     list_filter = ('timestamp',)
     readonly_fields = ('timestamp',)
+
+@admin.register(UsoLLM)
+class UsoLLMAdmin(admin.ModelAdmin):
+    list_display = ('aluno', 'inicio', 'fim', 'tokens_prompt', 'tokens_resposta', 'tempo_computo', 'requisicoes')
+    search_fields = ('aluno__nome',)
+    list_filter = ('fim',)
@@ -0,0 +1,160 @@
+"""
+Gravação e reprodução das chamadas ao serviço LLM.
+
+Os comandos de teste e os testes do backend usam llm_session() no lugar de
+requests. O modo é definido pela variável LLM_CLIENT_MODE:
+
+- live (padrão): requisições normais ao serviço LLM;
+- record: requisições normais, gravando cada par requisição/resposta e a
+  latência observada no arquivo LLM_CASSETTE;
+- replay: nenhuma requisição de rede; as respostas vêm do arquivo
+  LLM_CASSETTE, de forma determinística.
+
+No modo replay, LLM_REPLAY_SPEED controla a reprodução das latências
+gravadas: 0 (padrão) responde imediatamente, 1 reproduz o tempo real.
+"""
+import datetime
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+DEFAULT_LLM_URL = 'http://llm:8080'
+CASSETTE_VERSION = 1
+
+
+def llm_base_url():
+    """URL base do serviço LLM"""
+    return os.environ.get('LLM_SERVICE_URL', DEFAULT_LLM_URL).rstrip('/')
+
+
+def interaction_key(method, url, body):
+    """Chave de correspondência: método, caminho e corpo JSON normalizado"""
+    if isinstance(body, bytes):
+        body = body.decode('utf-8')
+    try:
+        body = json.dumps(json.loads(body), sort_keys=True, ensure_ascii=False) if body else ''
+    except ValueError:
+        pass
+    return f"{method.upper()} {urlsplit(url).path} {body}"
+
+
+class Cassette:
+    """Arquivo JSON com as interações gravadas"""
+
+    def __init__(self, path):
+        self.path = path
+        self.interactions = []
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                self.interactions = json.load(f).get('interactions', [])
+
+    def append(self, interaction):
+        with self._lock:
+            self.interactions.append(interaction)
+            self.save()
+
+    def save(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump({'version': CASSETTE_VERSION, 'interactions': self.interactions}, f, ensure_ascii=False, indent=2)
+
+
+class RecordingAdapter(HTTPAdapter):
+    """Adaptador HTTP que grava cada requisição e resposta no cassette"""
+
+    def __init__(self, cassette, **kwargs):
+        super().__init__(**kwargs)
+        self.cassette = cassette
+
+    def send(self, request, **kwargs):
+        started = time.monotonic()
+        response = super().send(request, **kwargs)
+        content = response.content
+        self.cassette.append({
+            'request': {
+                'method': request.method,
+                'path': urlsplit(request.url).path,
+                'body': request.body.decode('utf-8') if isinstance(request.body, bytes) else request.body,
+            },
+            'response': {
+                'status': response.status_code,
+                'headers': {'Content-Type': response.headers.get('Content-Type', 'application/json')},
+                'body': content.decode('utf-8', errors='replace'),
+            },
+            'elapsed_ms': (time.monotonic() - started) * 1000,
+        })
+        return response
+
+
+class ReplayAdapter(BaseAdapter):
+    """
+    Adaptador que responde a partir do cassette, sem acesso à rede.
+
+    Requisições idênticas recebem as respostas na ordem em que foram gravadas;
+    esgotadas as gravações, a última é repetida.
+    """
+
+    def __init__(self, cassette, speed=0.0):
+        super().__init__()
+        self.speed = speed
+        self._lock = threading.Lock()
+        self._queues = defaultdict(list)
+        self._served = defaultdict(int)
+        for interaction in cassette.interactions:
+            req = interaction['request']
+            self._queues[interaction_key(req['method'], req['path'], req.get('body'))].append(interaction)
+
+    def send(self, request, **kwargs):
+        key = interaction_key(request.method, request.url, request.body)
+        with self._lock:
+            recorded = self._queues.get(key)
+            if not recorded:
+                raise requests.exceptions.ConnectionError(f'Nenhuma gravação para {key}', request=request)
+            interaction = recorded[min(self._served[key], len(recorded) - 1)]
+            self._served[key] += 1
+        if self.speed > 0:
+            time.sleep(interaction.get('elapsed_ms', 0) / 1000 * self.speed)
+
+        response = requests.Response()
+        response.status_code = interaction['response']['status']
+        response.headers = CaseInsensitiveDict(interaction['response'].get('headers', {}))
+        response._content = interaction['response']['body'].encode('utf-8')
+        response.encoding = 'utf-8'
+        response.url = request.url
+        response.request = request
+        response.elapsed = datetime.timedelta(milliseconds=interaction.get('elapsed_ms', 0))
+        return response
+
+    def close(self):
+        pass
+
+
+def llm_session(mode=None, cassette_path=None):
+    """
+    Cria uma sessão requests para o serviço LLM no modo configurado.
+
+    Args:
+        mode: 'live', 'record' ou 'replay' (padrão: LLM_CLIENT_MODE ou 'live').
+        cassette_path: Arquivo de gravações (padrão: LLM_CASSETTE).
+    """
+    mode = mode or os.environ.get('LLM_CLIENT_MODE', 'live')
+    cassette_path = cassette_path or os.environ.get('LLM_CASSETTE', 'llm_cassette.json')
+    session = requests.Session()
+    session.llm_mode = mode
+    if mode == 'record':
+        adapter = RecordingAdapter(Cassette(cassette_path))
+    elif mode == 'replay':
+        adapter = ReplayAdapter(Cassette(cassette_path), speed=float(os.environ.get('LLM_REPLAY_SPEED', '0')))
+    else:
+        return session
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
@@ -0,0 +1,86 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory
+import json
+import os
+import platform
+import statistics
+import time
+from api.models import Aluno
+from api.views import AlunoViewSet, NotaViewSet, HorarioAulaViewSet
+
+# Endpoints consultados pelo serviço LLM: (nome, view, kwargs da rota, query string)
+ENDPOINTS = [
+    ('alunos/detalhes', AlunoViewSet.as_view({'get': 'detalhes'}), lambda aluno_id: {'pk': aluno_id}, lambda aluno_id: {}),
+    ('notas/por_aluno', NotaViewSet.as_view({'get': 'por_aluno'}), lambda aluno_id: {}, lambda aluno_id: {'aluno_id': aluno_id}),
+    ('horarios', HorarioAulaViewSet.as_view({'get': 'list'}), lambda aluno_id: {}, lambda aluno_id: {'aluno': aluno_id}),
+]
+
+
+class Command(BaseCommand):
+    help = 'Mede latência e número de consultas SQL dos endpoints usados pelo serviço LLM'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--alunos', type=str, default=None,
+                            help='IDs dos alunos separados por vírgula (padrão: os 5 primeiros)')
+        parser.add_argument('--repeticoes', type=int, default=20, help='Repetições medidas por endpoint e aluno')
+        parser.add_argument('--aquecimento', type=int, default=2, help='Repetições de aquecimento descartadas')
+        parser.add_argument('--saida', type=str, default=None,
+                            help='Arquivo JSON de resultados (formato aceito por benchmarks.history)')
+
+    def handle(self, *args, **options):
+        if options.get('alunos'):
+            alunos = [int(a) for a in options['alunos'].split(',') if a.strip()]
+        else:
+            alunos = list(Aluno.objects.order_by('id').values_list('id', flat=True)[:5])
+        if not alunos:
+            self.stdout.write(self.style.ERROR('Nenhum aluno encontrado. Execute populate_db primeiro.'))
+            return
+
+        factory = APIRequestFactory()
+        series = []
+        for nome, view, rota, consulta in ENDPOINTS:
+            for aluno_id in alunos:
+                latencias = []
+                consultas = []
+                for i in range(options['aquecimento'] + options['repeticoes']):
+                    request = factory.get('/', consulta(aluno_id))
+                    with CaptureQueriesContext(connection) as contexto:
+                        inicio = time.perf_counter()
+                        response = view(request, **rota(aluno_id))
+                        response.render()
+                        duracao_ms = (time.perf_counter() - inicio) * 1000
+                    if response.status_code != 200:
+                        self.stdout.write(self.style.WARNING(
+                            f'{nome} (aluno {aluno_id}) retornou {response.status_code}'))
+                        break
+                    if i >= options['aquecimento']:
+                        latencias.append(duracao_ms)
+                        consultas.append(len(contexto.captured_queries))
+                if not latencias:
+                    continue
+                series.append({'metric': f'{nome}/latencia/aluno_{aluno_id}', 'unit': 'ms',
+                               'direction': 'lower', 'samples': latencias})
+                series.append({'metric': f'{nome}/consultas/aluno_{aluno_id}', 'unit': 'consultas',
+                               'direction': 'lower', 'samples': consultas})
+                self.stdout.write(f'{nome:<18} aluno {aluno_id:<5} '
+                                  f'mediana {statistics.median(latencias):8.2f} ms  '
+                                  f'{max(consultas):3d} consultas')
+
+        resultado = {
+            'suite': 'backend_api',
+            'created_at': timezone.now().isoformat(),
+            'host': platform.node(),
+            'profile': connection.vendor,
+            'model': '-',
+            'series': series,
+        }
+        caminho = options.get('saida')
+        if not caminho:
+            os.makedirs('relatorios_llm', exist_ok=True)
+            caminho = f"relatorios_llm/bench_backend_{timezone.now().strftime('%Y%m%d_%H%M%S')}.json"
+        with open(caminho, 'w', encoding='utf-8') as arquivo:
+            json.dump(resultado, arquivo, ensure_ascii=False, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'Resultados salvos em: {caminho}'))
@@ -1,11 +1,11 @@
 from django.core.management.base import BaseCommand
-import requests
 import json
 from django.conf import settings
 import re
 import time
 import datetime
 from django.utils import timezone
+from api.llm_replay import llm_base_url, llm_session
 from api.models import Aluno, Nota, HorarioAula, ChatHistorico
 from .testes_prontos import TESTES_CONSULTAS, CAPACIDADES_LLMS
 import pandas as pd
@@ -28,7 +28,8 @@ class Command(BaseCommand):
         self.verbose = options.get('verbose', False)
         self.gerar_relatorio = options.get('gerar_relatorio', False)
         self.resultados = []
-        self.llm_url = "http://llm:8080/api/query"
+        self.llm_url = f"{llm_base_url()}/api/query"
+        self.session = llm_session()
         
         # Define ou obtém o aluno para teste
         aluno_id = options.get('aluno_id')
@@ -213,9 +214,10 @@ class Command(BaseCommand):
             }
             
             # Adicionar tempo de espera entre as consultas para não sobrecarregar o serviço
-            time.sleep(0.5)
+            if self.session.llm_mode != 'replay':
+                time.sleep(0.5)
             
-            response = requests.post(self.llm_url, json=payload)
+            response = self.session.post(self.llm_url, json=payload)
             
             if response.status_code == 200:
                 return response.json().get("answer", "")
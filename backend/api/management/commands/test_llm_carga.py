@@ -0,0 +1,280 @@
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.utils import timezone
+import requests
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from api.models import Aluno
+from .testes_prontos import TESTES_CONSULTAS
+
+
+def percentil(valores, p):
+    """Calcula o percentil p (0-100) com interpolação linear"""
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    posicao = (len(ordenados) - 1) * p / 100
+    inferior = int(posicao)
+    superior = min(inferior + 1, len(ordenados) - 1)
+    return ordenados[inferior] + (ordenados[superior] - ordenados[inferior]) * (posicao - inferior)
+
+
+def resumo_percentis(valores):
+    """Retorna p50/p90/p99 de uma lista de valores em milissegundos"""
+    return {
+        'p50': percentil(valores, 50),
+        'p90': percentil(valores, 90),
+        'p99': percentil(valores, 99),
+    }
+
+
+class Command(BaseCommand):
+    help = 'Gera carga concorrente no serviço LLM e mede latência (p50/p90/p99), TTFT, tokens/s, erros e descarte'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', type=str, default=os.environ.get('LLM_SERVICE_URL', 'http://llm:8080'), help='URL base do serviço LLM')
+        parser.add_argument('--concorrencia', type=int, default=4, help='Número máximo de requisições simultâneas')
+        parser.add_argument('--taxa', type=float, default=0, help='Taxa de chegada em requisições/s (Poisson, laço aberto). 0 = laço fechado')
+        parser.add_argument('--total', type=int, default=50, help='Número total de requisições')
+        parser.add_argument('--duracao', type=float, default=None, help='Duração máxima do teste em segundos')
+        parser.add_argument('--modo', type=str, default='query', choices=['query', 'stream', 'misto'], help='Endpoint exercitado: /api/query, /api/query/stream ou ambos')
+        parser.add_argument('--alunos', type=str, help='Mistura de alunos no formato "id[:peso],..." (padrão: até 20 alunos do banco, peso igual)')
+        parser.add_argument('--timeout', type=float, default=30, help='Timeout de cada requisição em segundos (o frontend usa 30)')
+        parser.add_argument('--seed', type=int, default=42, help='Semente para a escolha de perguntas, alunos e chegadas')
+        parser.add_argument('--saida', type=str, help='Arquivo JSON de resultados (padrão: relatorios_llm/carga_<timestamp>.json)')
+
+    def handle(self, *args, **options):
+        self.url = options['url'].rstrip('/')
+        self.timeout = options['timeout']
+        self.rng = random.Random(options['seed'])
+        self.lock = threading.Lock()
+        self.amostras = []
+
+        alunos, pesos = self.montar_mistura_alunos(options.get('alunos'))
+        if not alunos:
+            self.stdout.write(self.style.ERROR('Nenhum aluno encontrado no banco de dados'))
+            return
+
+        perguntas = [t.get('pergunta', t.get('pergunta_inicial')) for t in TESTES_CONSULTAS]
+        requisicoes = []
+        for _ in range(options['total']):
+            modo = options['modo']
+            if modo == 'misto':
+                modo = self.rng.choice(['query', 'stream'])
+            requisicoes.append({
+                'aluno_id': self.rng.choices(alunos, weights=pesos)[0],
+                'pergunta': self.rng.choice(perguntas),
+                'modo': modo,
+            })
+
+        self.stdout.write(self.style.WARNING(
+            f"Gerando {len(requisicoes)} requisições em {self.url} "
+            f"(concorrência {options['concorrencia']}, "
+            f"{'laço aberto a ' + str(options['taxa']) + ' req/s' if options['taxa'] > 0 else 'laço fechado'})"
+        ))
+
+        metricas_antes = self.obter_metricas()
+        inicio = time.monotonic()
+        limite = inicio + options['duracao'] if options['duracao'] else None
+
+        if options['taxa'] > 0:
+            self.executar_laco_aberto(requisicoes, options['concorrencia'], options['taxa'], limite)
+        else:
+            self.executar_laco_fechado(requisicoes, options['concorrencia'], limite)
+
+        duracao = time.monotonic() - inicio
+        metricas_depois = self.obter_metricas()
+
+        resultado = self.consolidar(options, duracao, metricas_antes, metricas_depois)
+        self.exibir_resumo(resultado)
+        self.salvar_resultado(resultado, options.get('saida'))
+
+    def montar_mistura_alunos(self, especificacao):
+        """Interpreta --alunos ou usa os primeiros alunos do banco com peso igual"""
+        if especificacao:
+            alunos, pesos = [], []
+            for item in especificacao.split(','):
+                aluno_id, _, peso = item.strip().partition(':')
+                alunos.append(int(aluno_id))
+                pesos.append(float(peso) if peso else 1.0)
+            return alunos, pesos
+        alunos = list(Aluno.objects.values_list('id', flat=True)[:20])
+        return alunos, [1.0] * len(alunos)
+
+    def executar_laco_fechado(self, requisicoes, concorrencia, limite):
+        """Cada trabalhador envia a próxima requisição assim que recebe a resposta anterior"""
+        fila = iter(requisicoes)
+
+        def trabalhador():
+            while limite is None or time.monotonic() < limite:
+                with self.lock:
+                    requisicao = next(fila, None)
+                if requisicao is None:
+                    return
+                self.enviar(requisicao, time.monotonic())
+
+        threads = [threading.Thread(target=trabalhador) for _ in range(concorrencia)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def executar_laco_aberto(self, requisicoes, concorrencia, taxa, limite):
+        """
+        Requisições chegam em um processo de Poisson, independente das respostas.
+        A latência é medida a partir do instante programado de chegada, então o
+        tempo de espera por um trabalhador livre também é contabilizado.
+        """
+        with ThreadPoolExecutor(max_workers=concorrencia) as executor:
+            chegada = time.monotonic()
+            for requisicao in requisicoes:
+                chegada += self.rng.expovariate(taxa)
+                if limite is not None and chegada >= limite:
+                    break
+                espera = chegada - time.monotonic()
+                if espera > 0:
+                    time.sleep(espera)
+                executor.submit(self.enviar, requisicao, chegada)
+
+    def enviar(self, requisicao, instante_chegada):
+        """Envia uma requisição e registra a amostra de latência"""
+        payload = {'question': requisicao['pergunta'], 'student_id': requisicao['aluno_id']}
+        amostra = {'modo': requisicao['modo'], 'aluno_id': requisicao['aluno_id'], 'status': None,
+                   'latencia_ms': None, 'ttft_ms': None, 'tokens': None, 'tokens_por_s': None, 'erro': None}
+        try:
+            if requisicao['modo'] == 'stream':
+                self.enviar_stream(payload, instante_chegada, amostra)
+            else:
+                response = requests.post(f"{self.url}/api/query", json=payload, timeout=self.timeout)
+                amostra['status'] = response.status_code
+                if response.status_code != 200:
+                    amostra['erro'] = response.text[:200]
+        except requests.exceptions.Timeout:
+            amostra['status'] = 'timeout'
+            amostra['erro'] = 'timeout'
+        except Exception as e:
+            amostra['status'] = 'exception'
+            amostra['erro'] = str(e)
+        amostra['latencia_ms'] = (time.monotonic() - instante_chegada) * 1000
+        with self.lock:
+            self.amostras.append(amostra)
+
+    def enviar_stream(self, payload, instante_chegada, amostra):
+        """Consome o endpoint SSE, medindo o tempo até o primeiro token e a taxa de decode"""
+        primeiro_token = None
+        tokens = 0
+        with requests.post(f"{self.url}/api/query/stream", json=payload, timeout=self.timeout, stream=True) as response:
+            amostra['status'] = response.status_code
+            if response.status_code != 200:
+                amostra['erro'] = response.text[:200]
+                return
+            for linha in response.iter_lines(decode_unicode=True):
+                if not linha or not linha.startswith('data: '):
+                    continue
+                evento = json.loads(linha[len('data: '):])
+                if 'token' in evento:
+                    tokens += 1
+                    if primeiro_token is None:
+                        primeiro_token = time.monotonic()
+                elif 'error' in evento:
+                    amostra['status'] = 'erro_stream'
+                    amostra['erro'] = evento.get('reason') or evento['error']
+        fim = time.monotonic()
+        amostra['tokens'] = tokens
+        if primeiro_token is not None:
+            amostra['ttft_ms'] = (primeiro_token - instante_chegada) * 1000
+            if tokens > 1 and fim > primeiro_token:
+                amostra['tokens_por_s'] = (tokens - 1) / (fim - primeiro_token)
+
+    def obter_metricas(self):
+        """Lê os contadores do endpoint /metrics do serviço LLM, se disponível"""
+        try:
+            response = requests.get(f"{self.url}/metrics", timeout=5)
+            if response.status_code == 200:
+                return response.json().get('counters', {})
+        except Exception:
+            pass
+        return None
+
+    def consolidar(self, options, duracao, metricas_antes, metricas_depois):
+        """Agrega as amostras em um resultado serializável em JSON"""
+        total = len(self.amostras)
+        sucesso = [a for a in self.amostras if a['status'] == 200]
+        # 429/503 indicam requisições descartadas pelo serviço (carga acima da capacidade)
+        descartadas = [a for a in self.amostras if a['status'] in (429, 503)]
+        erros = [a for a in self.amostras if a['status'] not in (200, 429, 503)]
+        stream_ok = [a for a in sucesso if a['modo'] == 'stream']
+
+        # Cache medido: respostas pré-geradas do serviço LLM (pregen), entre as consultas
+        # em prosa sem contexto extra; faltas incluem as respostas desatualizadas. Sem
+        # pré-geração ativa (LLM_PREGEN=0) o serviço não conta nada e a taxa fica None
+        taxa_cache = None
+        if metricas_antes is not None and metricas_depois is not None:
+            def delta(nome):
+                return metricas_depois.get(nome, 0) - metricas_antes.get(nome, 0)
+            hits = delta('pregen_hits')
+            misses = delta('pregen_misses') + delta('pregen_outdated')
+            if hits + misses > 0:
+                taxa_cache = hits / (hits + misses)
+
+        return {
+            'suite': 'carga_llm',
+            'data': timezone.now().isoformat(),
+            'configuracao': {
+                'url': self.url,
+                'concorrencia': options['concorrencia'],
+                'taxa': options['taxa'],
+                'laco': 'aberto' if options['taxa'] > 0 else 'fechado',
+                'total': options['total'],
+                'duracao_max': options['duracao'],
+                'modo': options['modo'],
+                'alunos': options.get('alunos'),
+                'timeout': self.timeout,
+                'seed': options['seed'],
+            },
+            'duracao_s': duracao,
+            'requisicoes': total,
+            'sucesso': len(sucesso),
+            'vazao_rps': len(sucesso) / duracao if duracao > 0 else None,
+            'taxa_erro': len(erros) / total if total else None,
+            'taxa_descarte': len(descartadas) / total if total else None,
+            'latencia_ms': resumo_percentis([a['latencia_ms'] for a in sucesso]),
+            'ttft_ms': resumo_percentis([a['ttft_ms'] for a in stream_ok if a['ttft_ms'] is not None]),
+            'tokens_por_s': resumo_percentis([a['tokens_por_s'] for a in stream_ok if a['tokens_por_s'] is not None]),
+            'taxa_acerto_cache': taxa_cache,
+            'metricas_servico': {
+                name: metricas_depois[name] - (metricas_antes or {}).get(name, 0)
+                for name in (metricas_depois or {})
+            },
+            'amostras': self.amostras,
+        }
+
+    def exibir_resumo(self, resultado):
+        """Exibe o resumo do teste de carga"""
+        def formatar(valores):
+            return ' / '.join('-' if valores[p] is None else f"{valores[p]:.0f}" for p in ('p50', 'p90', 'p99'))
+
+        self.stdout.write(f"Requisições: {resultado['requisicoes']} em {resultado['duracao_s']:.1f}s "
+                          f"({resultado['sucesso']} com sucesso)")
+        self.stdout.write(f"Latência p50/p90/p99 (ms): {formatar(resultado['latencia_ms'])}")
+        self.stdout.write(f"TTFT p50/p90/p99 (ms): {formatar(resultado['ttft_ms'])}")
+        self.stdout.write(f"Tokens/s p50/p90/p99: {formatar(resultado['tokens_por_s'])}")
+        self.stdout.write(f"Taxa de erro: {(resultado['taxa_erro'] or 0) * 100:.1f}% | "
+                          f"Taxa de descarte: {(resultado['taxa_descarte'] or 0) * 100:.1f}%")
+        if resultado['taxa_acerto_cache'] is not None:
+            self.stdout.write(f"Taxa de acerto das respostas pré-geradas: {resultado['taxa_acerto_cache'] * 100:.1f}%")
+
+    def salvar_resultado(self, resultado, caminho):
+        """Salva o resultado em JSON"""
+        if not caminho:
+            relatorio_dir = os.path.join(settings.BASE_DIR, 'relatorios_llm')
+            os.makedirs(relatorio_dir, exist_ok=True)
+            timestamp = timezone.now().strftime('%Y%m%d_%H%M%S')
+            caminho = os.path.join(relatorio_dir, f'carga_{timestamp}.json')
+        with open(caminho, 'w', encoding='utf-8') as arquivo:
+            json.dump(resultado, arquivo, ensure_ascii=False, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'Resultados salvos em: {caminho}'))
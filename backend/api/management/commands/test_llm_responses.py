@@ -1,9 +1,9 @@
 from django.core.management.base import BaseCommand
-import requests
 import json
 from django.conf import settings
 import re
 import time
+from api.llm_replay import llm_base_url, llm_session
 from api.models import Aluno, Nota, HorarioAula, ChatHistorico
 
 class Command(BaseCommand):
@@ -16,7 +16,8 @@ class Command(BaseCommand):
     
     def handle(self, *args, **options):
         self.verbose = options.get('verbose', False)
-        self.llm_url = "http://llm:8080/api/query"
+        self.llm_url = f"{llm_base_url()}/api/query"
+        self.session = llm_session()
         
         # Define ou obtém o aluno para teste
         aluno_id = options.get('aluno_id')
@@ -232,7 +233,7 @@ class Command(BaseCommand):
                 "student_id": self.aluno.id
             }
             
-            response = requests.post(self.llm_url, json=payload)
+            response = self.session.post(self.llm_url, json=payload)
             
             if response.status_code == 200:
                 return response.json().get("answer", "")
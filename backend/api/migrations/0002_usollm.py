@@ -0,0 +1,33 @@
+# Generated by Django 4.2.20 on 2026-10-19 12:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UsoLLM',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('inicio', models.DateTimeField()),
+                ('fim', models.DateTimeField()),
+                ('tokens_prompt', models.PositiveIntegerField(default=0)),
+                ('tokens_resposta', models.PositiveIntegerField(default=0)),
+                ('tempo_computo', models.FloatField(default=0)),
+                ('requisicoes', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('aluno', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='uso_llm', to='api.aluno')),
+            ],
+            options={
+                'verbose_name': 'Uso do LLM',
+                'verbose_name_plural': 'Usos do LLM',
+                'ordering': ['-fim'],
+            },
+        ),
+    ]
@@ -218,3 +218,28 @@ class ChatHistorico(models.Model):
         verbose_name = "Histórico de Chat"
         verbose_name_plural = "Históricos de Chat"
         ordering = ['-timestamp']
+
+
+class UsoLLM(models.Model):
+    """
+    Modelo para armazenar o uso do serviço LLM por aluno em um intervalo
+    (tokens do prompt e da resposta e tempo de computação), enviado
+    periodicamente pelo serviço LLM.
+    """
+    aluno = models.ForeignKey(Aluno, on_delete=models.CASCADE, related_name='uso_llm')
+    inicio = models.DateTimeField()
+    fim = models.DateTimeField()
+    tokens_prompt = models.PositiveIntegerField(default=0)
+    tokens_resposta = models.PositiveIntegerField(default=0)
+    tempo_computo = models.FloatField(default=0)  # Segundos com o modelo ocupado
+    requisicoes = models.PositiveIntegerField(default=0)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.aluno.nome} - {self.fim} - {self.tokens_prompt + self.tokens_resposta} tokens"
+
+    class Meta:
+        verbose_name = "Uso do LLM"
+        verbose_name_plural = "Usos do LLM"
+        ordering = ['-fim']
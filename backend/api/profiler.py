@@ -0,0 +1,75 @@
+"""
+Profiler por amostragem sob demanda.
+
+Enquanto um perfil está em andamento, uma thread lê periodicamente as pilhas
+de todas as threads do processo (sys._current_frames) e conta cada pilha no
+formato 'collapsed' (frames separados por ';' seguidos da contagem), aceito
+diretamente por flamegraph.pl, speedscope e inferno. Fora desse intervalo
+nada é executado, então o custo com o profiler desligado é nulo.
+
+Versão reduzida do profiler do serviço LLM (llm/app/profiler.py), que roda
+em outra imagem: aqui só há a amostragem das pilhas Python, sem o py-spy,
+porque o tempo do backend fica em código Python (views, ORM, serializers).
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+MAX_DURATION = 120.0
+MAX_RATE = 1000
+
+# Frames no topo de threads bloqueadas esperando trabalho (não consomem CPU)
+IDLE_FUNCTIONS = {'wait', 'select', 'poll', 'accept', '_worker', 'get', 'dequeue'}
+
+_lock = threading.Lock()
+
+class ProfilerBusy(Exception):
+    """Já existe um perfil em andamento neste processo."""
+
+def _collapse(frame) -> str:
+    """Pilha da raiz até o frame atual, no formato collapsed."""
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+        frame = frame.f_back
+    return ';'.join(reversed(stack))
+
+def _sample_python(duration: float, rate: int, include_idle: bool) -> Counter:
+    interval = 1.0 / rate
+    own = threading.get_ident()
+    names = {}
+    stacks: Counter = Counter()
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        started = time.monotonic()
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own:
+                continue
+            if not include_idle and frame.f_code.co_name in IDLE_FUNCTIONS:
+                continue
+            if thread_id not in names:
+                names = {t.ident: t.name for t in threading.enumerate()}
+            stacks[f'{names.get(thread_id, thread_id)};{_collapse(frame)}'] += 1
+        time.sleep(max(0.0, interval - (time.monotonic() - started)))
+    return stacks
+
+def profile(duration: float = 10.0, rate: int = 100, include_idle: bool = False) -> str:
+    """
+    Amostra o processo por duration segundos a rate amostras/s e retorna as
+    pilhas no formato collapsed. Bloqueia durante a amostragem.
+
+    Raises:
+        ProfilerBusy: Se outro perfil estiver em andamento.
+    """
+    duration = min(max(duration, 0.1), MAX_DURATION)
+    rate = min(max(rate, 1), MAX_RATE)
+    if not _lock.acquire(blocking=False):
+        raise ProfilerBusy()
+    try:
+        stacks = _sample_python(duration, rate, include_idle)
+        return ''.join(f'{stack} {count}\n' for stack, count in stacks.most_common())
+    finally:
+        _lock.release()
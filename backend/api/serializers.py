@@ -1,7 +1,7 @@
 from rest_framework import serializers
 from .models import (
     Aluno, Nota, HorarioAula, Frequencia, DadoFinanceiro, 
-    Matricula, DisciplinaMatriculada, ChatHistorico
+    Matricula, DisciplinaMatriculada, ChatHistorico, UsoLLM
 )
 
 class AlunoSerializer(serializers.ModelSerializer):
@@ -62,6 +62,13 @@ class ChatHistoricoSerializer(serializers.ModelSerializer):
         model = ChatHistorico
         fields = '__all__'
         
+class UsoLLMSerializer(serializers.ModelSerializer):
+    aluno_nome = serializers.CharField(source='aluno.nome', read_only=True)
+    
+    class Meta:
+        model = UsoLLM
+        fields = '__all__'
+        
 class AlunoDetalhadoSerializer(serializers.ModelSerializer):
     """
     Serializer para exibir detalhes completos de um aluno, incluindo dados relacionados
@@ -1,14 +1,25 @@
+from django.contrib.auth.models import User
 from django.test import TestCase
 from django.urls import reverse
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
 import json
-from datetime import date, datetime
+import os
+import tempfile
+import threading
+from datetime import date, datetime, timezone
+from unittest import mock
+
+import requests
+from requests.adapters import HTTPAdapter
 
 from .models import (
     Aluno, Nota, HorarioAula, Frequencia, DadoFinanceiro, 
-    Matricula, DisciplinaMatriculada, ChatHistorico
+    Matricula, DisciplinaMatriculada, ChatHistorico, UsoLLM
 )
+from .llm_replay import llm_session
+
+FIXTURE_CASSETTE = os.path.join(os.path.dirname(__file__), 'fixtures', 'llm_cassette.json')
 
 class ModelTestCase(TestCase):
     """Testes para os modelos do sistema"""
@@ -284,6 +295,41 @@ class APITestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
 
+
+class PorAlunoFiltroTestCase(TestCase):
+    """Testes dos filtros dos endpoints por_aluno usados pelo serviço LLM"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.aluno = Aluno.objects.create(
+            nome="Aluno Filtro",
+            email="filtro@example.com",
+            matricula="20240010",
+            curso="Ciência da Computação",
+            semestre=3,
+            data_nascimento=date(2002, 5, 10),
+            endereco="Rua Filtro, 10"
+        )
+        for disciplina, nota_final, dia in (("Cálculo I", 6.5, "SEG"), ("Física I", 8.0, "QUA")):
+            Nota.objects.create(aluno=self.aluno, disciplina=disciplina, nota_prova=nota_final,
+                                nota_trabalho=nota_final, nota_final=nota_final,
+                                data_avaliacao=date(2024, 4, 10), semestre="2024.1")
+            HorarioAula.objects.create(aluno=self.aluno, disciplina=disciplina, dia_semana=dia,
+                                       horario_inicio="08:00:00", horario_fim="10:00:00", sala="Sala 1",
+                                       professor="Prof. Lima", semestre="2024.1")
+
+    def test_notas_por_disciplina(self):
+        """Testar filtro de notas por parte do nome da disciplina"""
+        response = self.client.get(reverse('nota-por-aluno'), {'aluno_id': self.aluno.id, 'disciplina': 'cálculo'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([n['disciplina'] for n in response.data], ["Cálculo I"])
+
+    def test_horarios_por_dia(self):
+        """Testar filtro de horários por dia da semana"""
+        response = self.client.get(reverse('horarioaula-por-aluno'), {'aluno_id': self.aluno.id, 'dia_semana': 'qua'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([h['disciplina'] for h in response.data], ["Física I"])
+
 class LLMResponseTestCase(APITestCase):
     """Testes específicos para respostas do LLM"""
     
@@ -440,3 +486,195 @@ class LLMResponseTestCase(APITestCase):
         self.assertIn("Inteligência Artificial", resposta2)
         self.assertIn("8.8", resposta2)
         self.assertTrue("segunda-feira" in resposta2.lower() or "SEG" in resposta2)
+
+
+class LLMReplayTestCase(TestCase):
+    """Testes da gravação e reprodução das chamadas ao serviço LLM"""
+
+    llm_url = "http://llm:8080/api/query"
+
+    def test_replay_returns_recorded_answer(self):
+        """Testar resposta reproduzida do cassette, sem acesso à rede"""
+        session = llm_session('replay', FIXTURE_CASSETTE)
+        with mock.patch.object(HTTPAdapter, 'send', side_effect=AssertionError("acesso à rede")):
+            response = session.post(self.llm_url, json={
+                "student_id": 1,
+                "question": "Qual é a minha nota em Inteligência Artificial?",
+            })
+
+        self.assertEqual(response.status_code, 200)
+        resposta = response.json()["answer"]
+        self.assertIn("8.8", resposta)
+        self.assertIn("Inteligência Artificial", resposta)
+
+    def test_replay_serves_repeated_requests_in_order(self):
+        """Testar que requisições idênticas recebem as respostas na ordem gravada"""
+        payload = {"question": "Quais são minhas notas neste semestre?", "student_id": 1}
+        respostas = []
+        for _ in range(2):
+            session = llm_session('replay', FIXTURE_CASSETTE)
+            respostas.append([session.post(self.llm_url, json=payload).json()["answer"] for _ in range(3)])
+
+        self.assertEqual(respostas[0], respostas[1])
+        self.assertNotEqual(respostas[0][0], respostas[0][1])
+        self.assertEqual(respostas[0][1], respostas[0][2])
+
+    def test_replay_without_recording_fails(self):
+        """Testar erro de conexão para requisição não gravada"""
+        session = llm_session('replay', FIXTURE_CASSETTE)
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            session.post(self.llm_url, json={"question": "Pergunta nova", "student_id": 1})
+
+    def test_record_then_replay(self):
+        """Testar que uma interação gravada é reproduzida igual"""
+        live = requests.Response()
+        live.status_code = 200
+        live.headers['Content-Type'] = 'application/json'
+        live._content = json.dumps({"answer": "Sua frequência é 92%."}).encode('utf-8')
+        payload = {"question": "Qual a minha frequência?", "student_id": 7}
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'cassette.json')
+            with mock.patch.object(HTTPAdapter, 'send', return_value=live):
+                recorded = llm_session('record', path).post(self.llm_url, json=payload)
+            with open(path, encoding='utf-8') as f:
+                interactions = json.load(f)["interactions"]
+            replayed = llm_session('replay', path).post("http://outro-host:9000/api/query", json=payload)
+
+        self.assertEqual(len(interactions), 1)
+        self.assertEqual(interactions[0]["request"]["path"], "/api/query")
+        self.assertEqual(replayed.status_code, recorded.status_code)
+        self.assertEqual(replayed.json(), recorded.json())
+
+
+class ProfilerTestCase(TestCase):
+    """Testes do endpoint administrativo de profiling"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.url = reverse('perfil-processo')
+
+    def test_profile_requires_admin(self):
+        """Testar que apenas administradores acessam o profiler"""
+        response = self.client.get(self.url, {'segundos': 0.1})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.force_authenticate(User.objects.create_user('aluno', password='senha'))
+        response = self.client.get(self.url, {'segundos': 0.1})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_profile_returns_collapsed_stacks(self):
+        """Testar que o perfil retorna pilhas no formato collapsed"""
+        self.client.force_authenticate(User.objects.create_superuser('admin', 'admin@example.com', 'senha'))
+        # A thread da requisição não se amostra; outra thread fica esperando durante o perfil
+        parar = threading.Event()
+        thread = threading.Thread(target=parar.wait, name='espera')
+        thread.start()
+        try:
+            response = self.client.get(self.url, {'segundos': 0.2, 'taxa': 200, 'ocioso': 1})
+        finally:
+            parar.set()
+            thread.join()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('attachment', response['Content-Disposition'])
+        linhas = response.content.decode('utf-8').splitlines()
+        self.assertTrue(linhas)
+        for linha in linhas:
+            pilha, contagem = linha.rsplit(' ', 1)
+            self.assertIn(';', pilha)
+            self.assertGreater(int(contagem), 0)
+
+
+class UsoLLMTestCase(TestCase):
+    """Testes do registro de uso do serviço LLM por aluno"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.aluno = Aluno.objects.create(
+            nome="Aluno Uso",
+            email="uso@example.com",
+            matricula="20240011",
+            curso="Engenharia de Software",
+            semestre=2,
+            data_nascimento=date(2003, 8, 20),
+            endereco="Rua Uso, 11"
+        )
+        self.registro = {
+            "aluno": self.aluno.id,
+            "inicio": "2024-05-01T10:00:00+00:00",
+            "fim": "2024-05-01T10:01:00+00:00",
+            "tokens_prompt": 900,
+            "tokens_resposta": 120,
+            "tempo_computo": 4.5,
+            "requisicoes": 3,
+        }
+
+    def test_registrar_lote(self):
+        """Testar registro em lote, ignorando alunos inexistentes"""
+        response = self.client.post(reverse('usollm-registrar'),
+                                    [self.registro, {**self.registro, "aluno": 999999}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data, {"registrados": 1, "ignorados": 1})
+        self.assertEqual(UsoLLM.objects.get().tokens_resposta, 120)
+
+    def test_registrar_ignora_aluno_malformado(self):
+        """Testar que registros com aluno que não é um id inteiro são ignorados, sem erro 500"""
+        malformados = [{**self.registro, "aluno": [self.aluno.id]}, {**self.registro, "aluno": {"id": 1}},
+                       {**self.registro, "aluno": str(self.aluno.id)}, "registro"]
+        response = self.client.post(reverse('usollm-registrar'), [self.registro] + malformados, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data, {"registrados": 1, "ignorados": 4})
+        self.assertEqual(UsoLLM.objects.count(), 1)
+
+    def test_registrar_exige_lista(self):
+        """Testar que o registro exige uma lista"""
+        response = self.client.post(reverse('usollm-registrar'), self.registro, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_por_aluno_totais(self):
+        """Testar os totais de uso do aluno"""
+        for _ in range(2):
+            self.client.post(reverse('usollm-registrar'), [self.registro], format='json')
+        response = self.client.get(reverse('usollm-por-aluno'), {'aluno_id': self.aluno.id})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["totais"]["tokens_prompt"], 1800)
+        self.assertEqual(response.data["totais"]["requisicoes"], 6)
+        self.assertEqual(len(response.data["registros"]), 2)
+
+
+class AlunosAtivosTestCase(TestCase):
+    """Testes da listagem de alunos ativos no chat"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.alunos = [
+            Aluno.objects.create(
+                nome=f"Aluno Ativo {i}",
+                email=f"ativo{i}@example.com",
+                matricula=f"2024002{i}",
+                curso="Ciência da Computação",
+                semestre=1,
+                data_nascimento=date(2004, 1, 1),
+                endereco=f"Rua Ativo, {i}"
+            )
+            for i in range(3)
+        ]
+        for aluno, perguntas in zip(self.alunos, [1, 3, 0]):
+            for _ in range(perguntas):
+                ChatHistorico.objects.create(aluno=aluno, pergunta="Quais são minhas notas?", resposta="...")
+
+    def test_ordena_por_perguntas(self):
+        """Testar que só alunos com perguntas aparecem, dos mais ativos aos menos"""
+        response = self.client.get(reverse('aluno-ativos'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([a["id"] for a in response.data], [self.alunos[1].id, self.alunos[0].id])
+        self.assertEqual(response.data[0]["perguntas"], 3)
+
+    def test_janela_e_limite(self):
+        """Testar o filtro por dias e o limite de alunos"""
+        ChatHistorico.objects.filter(aluno=self.alunos[1]).update(timestamp=datetime(2020, 1, 1, tzinfo=timezone.utc))
+        response = self.client.get(reverse('aluno-ativos'), {'dias': 7, 'limite': 5})
+        self.assertEqual([a["id"] for a in response.data], [self.alunos[0].id])
+        response = self.client.get(reverse('aluno-ativos'), {'limite': 'x'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -11,7 +11,9 @@ router.register(r'financeiro', views.DadoFinanceiroViewSet)
 router.register(r'matriculas', views.MatriculaViewSet)
 router.register(r'disciplinas-matriculadas', views.DisciplinaMatriculadaViewSet)
 router.register(r'chat-historico', views.ChatHistoricoViewSet)
+router.register(r'uso-llm', views.UsoLLMViewSet)
 
 urlpatterns = [
     path('', include(router.urls)),
+    path('admin/profile/', views.perfil_processo, name='perfil-processo'),
 ] 
\ No newline at end of file
@@ -1,16 +1,24 @@
+from datetime import timedelta
+
+from django.db.models import Count, Sum
+from django.http import HttpResponse
 from django.shortcuts import render
+from django.utils import timezone
 from rest_framework import viewsets, filters
-from rest_framework.decorators import action
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
 from .models import (
     Aluno, Nota, HorarioAula, Frequencia, DadoFinanceiro, 
-    Matricula, DisciplinaMatriculada, ChatHistorico
+    Matricula, DisciplinaMatriculada, ChatHistorico, UsoLLM
 )
+from . import profiler
 from .serializers import (
     AlunoSerializer, NotaSerializer, HorarioAulaSerializer, 
     FrequenciaSerializer, DadoFinanceiroSerializer, MatriculaSerializer, 
-    DisciplinaMatriculadaSerializer, ChatHistoricoSerializer, AlunoDetalhadoSerializer
+    DisciplinaMatriculadaSerializer, ChatHistoricoSerializer, AlunoDetalhadoSerializer,
+    UsoLLMSerializer
 )
 
 
@@ -33,6 +41,24 @@ class AlunoViewSet(viewsets.ModelViewSet):
         aluno = self.get_object()
         serializer = AlunoDetalhadoSerializer(aluno)
         return Response(serializer.data)
+    
+    @action(detail=False, methods=['get'])
+    def ativos(self, request):
+        """
+        Endpoint para listar os alunos que usaram o chat nos últimos `dias` dias
+        (padrão 7), dos que mais perguntaram para os que menos perguntaram, até
+        `limite` alunos. Usado pelo serviço LLM para pré-gerar respostas.
+        """
+        try:
+            dias = int(request.query_params.get('dias', 7))
+            limite = int(request.query_params.get('limite', 500))
+        except ValueError:
+            return Response({"error": "Parâmetros dias e limite devem ser inteiros"}, status=400)
+        desde = timezone.now() - timedelta(days=dias)
+        alunos = (Aluno.objects.filter(historico_chat__timestamp__gte=desde)
+                  .annotate(perguntas=Count('historico_chat'))
+                  .order_by('-perguntas', 'id')[:limite])
+        return Response([{"id": a.id, "nome": a.nome, "perguntas": a.perguntas} for a in alunos])
 
 
 class NotaViewSet(viewsets.ModelViewSet):
@@ -49,11 +75,18 @@ class NotaViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def por_aluno(self, request):
         """
-        Endpoint para filtrar notas por aluno usando query parameter
+        Endpoint para filtrar notas por aluno usando query parameter.
+        Aceita também disciplina (parte do nome) e semestre.
         """
         aluno_id = request.query_params.get('aluno_id', None)
         if aluno_id:
             notas = Nota.objects.filter(aluno__id=aluno_id)
+            disciplina = request.query_params.get('disciplina')
+            if disciplina:
+                notas = notas.filter(disciplina__icontains=disciplina)
+            semestre = request.query_params.get('semestre')
+            if semestre:
+                notas = notas.filter(semestre=semestre)
             serializer = self.get_serializer(notas, many=True)
             return Response(serializer.data)
         return Response({"error": "Parâmetro aluno_id é necessário"}, status=400)
@@ -73,11 +106,18 @@ class HorarioAulaViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def por_aluno(self, request):
         """
-        Endpoint para filtrar horários por aluno usando query parameter
+        Endpoint para filtrar horários por aluno usando query parameter.
+        Aceita também disciplina (parte do nome) e dia_semana (SEG, TER...).
         """
         aluno_id = request.query_params.get('aluno_id', None)
         if aluno_id:
             horarios = HorarioAula.objects.filter(aluno__id=aluno_id)
+            disciplina = request.query_params.get('disciplina')
+            if disciplina:
+                horarios = horarios.filter(disciplina__icontains=disciplina)
+            dia_semana = request.query_params.get('dia_semana')
+            if dia_semana:
+                horarios = horarios.filter(dia_semana=dia_semana.upper())
             serializer = self.get_serializer(horarios, many=True)
             return Response(serializer.data)
         return Response({"error": "Parâmetro aluno_id é necessário"}, status=400)
@@ -97,11 +137,15 @@ class FrequenciaViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def por_aluno(self, request):
         """
-        Endpoint para filtrar frequências por aluno usando query parameter
+        Endpoint para filtrar frequências por aluno usando query parameter.
+        Aceita também disciplina (parte do nome).
         """
         aluno_id = request.query_params.get('aluno_id', None)
         if aluno_id:
             frequencias = Frequencia.objects.filter(aluno__id=aluno_id)
+            disciplina = request.query_params.get('disciplina')
+            if disciplina:
+                frequencias = frequencias.filter(disciplina__icontains=disciplina)
             serializer = self.get_serializer(frequencias, many=True)
             return Response(serializer.data)
         return Response({"error": "Parâmetro aluno_id é necessário"}, status=400)
@@ -121,11 +165,15 @@ class DadoFinanceiroViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def por_aluno(self, request):
         """
-        Endpoint para filtrar dados financeiros por aluno usando query parameter
+        Endpoint para filtrar dados financeiros por aluno usando query parameter.
+        Aceita também status_pagamento (PAGO, PENDENTE, ATRASADO).
         """
         aluno_id = request.query_params.get('aluno_id', None)
         if aluno_id:
             dados = DadoFinanceiro.objects.filter(aluno__id=aluno_id)
+            status_pagamento = request.query_params.get('status_pagamento')
+            if status_pagamento:
+                dados = dados.filter(status_pagamento=status_pagamento.upper())
             serializer = self.get_serializer(dados, many=True)
             return Response(serializer.data)
         return Response({"error": "Parâmetro aluno_id é necessário"}, status=400)
@@ -201,3 +249,75 @@ class ChatHistoricoViewSet(viewsets.ModelViewSet):
             serializer = self.get_serializer(historico, many=True)
             return Response(serializer.data)
         return Response({"error": "Parâmetro aluno_id é necessário"}, status=400)
+
+
+
+class UsoLLMViewSet(viewsets.ModelViewSet):
+    """
+    API endpoint para visualizar o uso do serviço LLM por aluno
+    """
+    queryset = UsoLLM.objects.all()
+    serializer_class = UsoLLMSerializer
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
+    filterset_fields = ['aluno']
+    ordering_fields = ['fim', 'tokens_resposta', 'tempo_computo']
+    
+    @action(detail=False, methods=['get'])
+    def por_aluno(self, request):
+        """
+        Endpoint para filtrar o uso por aluno usando query parameter.
+        Retorna os registros e os totais.
+        """
+        aluno_id = request.query_params.get('aluno_id', None)
+        if aluno_id:
+            usos = UsoLLM.objects.filter(aluno__id=aluno_id)
+            totais = usos.aggregate(
+                tokens_prompt=Sum('tokens_prompt'), tokens_resposta=Sum('tokens_resposta'),
+                tempo_computo=Sum('tempo_computo'), requisicoes=Sum('requisicoes')
+            )
+            serializer = self.get_serializer(usos, many=True)
+            return Response({"totais": {k: v or 0 for k, v in totais.items()}, "registros": serializer.data})
+        return Response({"error": "Parâmetro aluno_id é necessário"}, status=400)
+    
+    @action(detail=False, methods=['post'])
+    def registrar(self, request):
+        """
+        Endpoint para o serviço LLM registrar o uso acumulado de vários alunos
+        de uma vez. Registros de alunos inexistentes ou sem um id de aluno
+        inteiro são ignorados, para que um aluno removido não bloqueie o envio
+        dos demais.
+        """
+        if not isinstance(request.data, list):
+            return Response({"error": "Envie uma lista de registros de uso"}, status=400)
+        validos = [r for r in request.data
+                   if isinstance(r, dict) and isinstance(r.get('aluno'), int) and not isinstance(r.get('aluno'), bool)]
+        existentes = set(Aluno.objects.filter(id__in={r['aluno'] for r in validos}).values_list('id', flat=True))
+        registros = [r for r in validos if r['aluno'] in existentes]
+        serializer = self.get_serializer(data=registros, many=True)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response({"registrados": len(registros), "ignorados": len(request.data) - len(registros)}, status=201)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def perfil_processo(request):
+    """
+    Endpoint administrativo de profiling sob demanda. Amostra as pilhas do
+    processo por `segundos` e retorna um arquivo collapsed (flamegraph.pl,
+    speedscope). `ocioso=1` inclui as threads paradas esperando trabalho.
+    """
+    try:
+        segundos = float(request.query_params.get('segundos', 10))
+        taxa = int(request.query_params.get('taxa', 100))
+    except ValueError:
+        return Response({"error": "Parâmetros segundos e taxa devem ser numéricos"}, status=400)
+    ocioso = request.query_params.get('ocioso') in ('1', 'true')
+    try:
+        collapsed = profiler.profile(segundos, taxa, ocioso)
+    except profiler.ProfilerBusy:
+        return Response({"error": "Já existe um perfil em andamento"}, status=409)
+    response = HttpResponse(collapsed, content_type='text/plain; charset=utf-8')
+    nome = f"backend-profile-{timezone.now().strftime('%Y%m%d-%H%M%S')}.folded"
+    response['Content-Disposition'] = f'attachment; filename="{nome}"'
+    return response
@@ -0,0 +1,254 @@
+"""
+Chamadas GET ao backend com vários endpoints, requisições de reserva
+(hedging), disjuntor por endpoint e dados antigos para falha total.
+
+- Ordem: cada chamada vai primeiro ao endpoint disponível com a menor
+  mediana de latência recente (endpoints ainda sem medições vêm antes, na
+  ordem de BACKEND_URLS, para serem medidos).
+- Reserva: se a resposta não chegar no percentil BACKEND_HEDGE_PERCENTILE
+  das latências recentes do endpoint (BACKEND_HEDGE_DELAY_MS enquanto houver
+  poucas medições), a mesma chamada vai ao próximo endpoint; vale a primeira
+  resposta. Falhas rápidas (conexão, 5xx, JSON inválido) disparam o próximo
+  endpoint na hora. Cada endpoint recebe no máximo uma tentativa por chamada:
+  com um único endpoint disponível não há reserva (repetir a chamada no
+  endpoint que já está demorando só dobraria a carga dele).
+- Disjuntor: após BACKEND_BREAKER_FAILURES falhas seguidas, o endpoint fica
+  fora por BACKEND_BREAKER_OPEN_S segundos; depois, uma única chamada de
+  teste decide se ele volta ou fica fora por outro período.
+- Dados antigos: a última resposta válida de cada caminho fica guardada (até
+  BACKEND_STALE_TTL_S segundos) e é usada quando todos os endpoints falham.
+
+Respostas 4xx são definitivas (o backend respondeu) e não contam como falha.
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Deque, Dict, Hashable, List, Optional, Tuple
+
+import requests
+
+from . import metrics
+
+class BackendError(Exception):
+    """Nenhum endpoint respondeu; reason: "status", "timeout", "invalid", "error" ou "circuito"."""
+
+    def __init__(self, reason: str, detail: str = ""):
+        super().__init__(f"{reason}: {detail}" if detail else reason)
+        self.reason = reason
+
+class Endpoint:
+    """Um endpoint do backend: latências recentes e estado do disjuntor."""
+
+    def __init__(self, url: str, window: int = 200):
+        self.url = url.rstrip("/")
+        self.latencies: Deque[float] = deque(maxlen=window)
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False
+
+    def percentile(self, pct: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "fechado"
+        return "meio-aberto" if self.probing else "aberto"
+
+class BackendPool:
+    """Distribui as chamadas GET entre os endpoints do backend (ver o docstring do módulo)."""
+
+    def __init__(self, urls: List[str], hedge_percentile: float = 95, hedge_delay_s: float = 0.3,
+                 hedge_min_samples: int = 20, breaker_failures: int = 5, breaker_open_s: float = 30,
+                 stale_ttl_s: float = 3600, stale_max: int = 2000, max_workers: int = 32):
+        self.hedge_percentile = hedge_percentile
+        self.hedge_delay_s = hedge_delay_s
+        self.hedge_min_samples = hedge_min_samples
+        self.breaker_failures = breaker_failures
+        self.breaker_open_s = breaker_open_s
+        self.stale_ttl_s = stale_ttl_s
+        self.stale_max = stale_max
+        self._lock = threading.Lock()
+        self._stale: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        # Threads próprias: reservas e endpoints travados não ocupam o executor padrão (usado pela geração)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="backend")
+        self.set_urls(urls)
+
+    @classmethod
+    def from_env(cls, urls: List[str]) -> "BackendPool":
+        return cls(urls,
+                   hedge_percentile=float(os.getenv("BACKEND_HEDGE_PERCENTILE", "95")),
+                   hedge_delay_s=float(os.getenv("BACKEND_HEDGE_DELAY_MS", "300")) / 1000,
+                   breaker_failures=int(os.getenv("BACKEND_BREAKER_FAILURES", "5")),
+                   breaker_open_s=float(os.getenv("BACKEND_BREAKER_OPEN_S", "30")),
+                   stale_ttl_s=float(os.getenv("BACKEND_STALE_TTL_S", "3600")),
+                   max_workers=int(os.getenv("BACKEND_MAX_WORKERS", "32")))
+
+    def set_urls(self, urls: List[str]) -> None:
+        """Substitui os endpoints (URLs repetidas são ignoradas); zera medições e disjuntores."""
+        unique = list(dict.fromkeys(u.rstrip("/") for u in urls if u))
+        if not unique:
+            raise ValueError("Informe ao menos uma URL do backend")
+        self.endpoints = [Endpoint(url) for url in unique]
+
+    @property
+    def primary(self) -> str:
+        """URL do primeiro endpoint na ordem atual (para chamadas que não podem ser repetidas)."""
+        ordered = self._ordered(time.monotonic())
+        return (ordered[0] if ordered else self.endpoints[0]).url
+
+    @property
+    def open_breakers(self) -> int:
+        return sum(1 for e in self.endpoints if e.opened_at is not None)
+
+    def describe(self) -> List[Dict[str, Any]]:
+        """Estado de cada endpoint, para as métricas."""
+        def ms(value):
+            return round(value * 1000, 1) if value is not None else None
+        return [{"url": e.url, "state": e.state, "p50_ms": ms(e.percentile(50)),
+                 "p95_ms": ms(e.percentile(self.hedge_percentile)), "failures": e.failures} for e in self.endpoints]
+
+    def _ordered(self, now: float) -> List[Endpoint]:
+        with self._lock:
+            available = [e for e in self.endpoints if e.opened_at is None
+                         or (now - e.opened_at >= self.breaker_open_s and not e.probing)]
+        # sorted é estável: empates (sem medições) mantêm a ordem de BACKEND_URLS
+        return sorted(available, key=lambda e: e.percentile(50) or 0.0)
+
+    def _hedge_delay(self, endpoint: Endpoint) -> float:
+        if len(endpoint.latencies) < self.hedge_min_samples:
+            return self.hedge_delay_s
+        return endpoint.percentile(self.hedge_percentile)
+
+    def _record(self, endpoint: Endpoint, ok: bool, latency: float) -> None:
+        with self._lock:
+            endpoint.probing = False
+            if ok:
+                endpoint.latencies.append(latency)
+                endpoint.failures = 0
+                if endpoint.opened_at is not None:
+                    endpoint.opened_at = None
+                    metrics.increment("backend_breaker_closed")
+                return
+            endpoint.failures += 1
+            if endpoint.opened_at is not None or endpoint.failures >= self.breaker_failures:
+                # Abre o disjuntor (ou reabre após a chamada de teste falhar)
+                if endpoint.opened_at is None:
+                    metrics.increment("backend_breaker_opened")
+                endpoint.opened_at = time.monotonic()
+
+    def _request(self, endpoint: Endpoint, path: str, params: Optional[Dict[str, Any]],
+                 headers: Optional[Dict[str, str]], timeout: float, started: float) -> Tuple[int, Any, int]:
+        """
+        Executa o GET (em uma thread) e retorna (status, JSON ou None, bytes). A latência
+        é medida desde o envio ao executor, como a espera que decide a reserva.
+        """
+        try:
+            response = requests.get(f"{endpoint.url}{path}", params=params, headers=headers, timeout=timeout)
+            if response.status_code >= 500:
+                raise BackendError("status", f"{endpoint.url}: Status {response.status_code}")
+            data = response.json() if response.status_code == 200 else None
+        except BackendError:
+            self._record(endpoint, False, 0)
+            raise
+        except requests.exceptions.Timeout as e:
+            self._record(endpoint, False, 0)
+            raise BackendError("timeout", f"{endpoint.url}: {e}") from e
+        except ValueError as e:
+            # Corpo truncado ou JSON inválido
+            self._record(endpoint, False, 0)
+            raise BackendError("invalid", f"{endpoint.url}: {e}") from e
+        except Exception as e:
+            self._record(endpoint, False, 0)
+            raise BackendError("error", f"{endpoint.url}: {e}") from e
+        self._record(endpoint, True, time.perf_counter() - started)
+        return response.status_code, data, len(response.content)
+
+    async def get(self, path: str, params: Optional[Dict[str, Any]] = None,
+                  headers: Optional[Dict[str, str]] = None, timeout: float = 10) -> Tuple[int, Any]:
+        """
+        GET com reserva entre os endpoints; retorna (status, JSON) da primeira resposta válida.
+
+        Raises:
+            BackendError: Se todos os endpoints falharem ou estiverem com o disjuntor aberto.
+        """
+        attempts = self._ordered(time.monotonic())
+        if not attempts:
+            metrics.increment("backend_circuit_rejected")
+            raise BackendError("circuito", "todos os endpoints com o disjuntor aberto")
+        loop = asyncio.get_running_loop()
+        pending: Dict[asyncio.Future, int] = {}
+
+        def launch(index: int) -> None:
+            endpoint = attempts[index]
+            with self._lock:
+                if endpoint.opened_at is not None:
+                    endpoint.probing = True
+            future = loop.run_in_executor(self._executor, self._request, endpoint, path, params, headers, timeout,
+                                          time.perf_counter())
+            # Reservas perdedoras terminam sozinhas; o resultado delas só alimenta as medições
+            future.add_done_callback(lambda f: f.cancelled() or f.exception())
+            pending[future] = index
+
+        launch(0)
+        launched = 1
+        error: Optional[BackendError] = None
+        while pending:
+            hedge_in = self._hedge_delay(attempts[launched - 1]) if launched < len(attempts) else None
+            done, _ = await asyncio.wait(pending, timeout=hedge_in, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                metrics.increment("backend_hedged")
+                launch(launched)
+                launched += 1
+                continue
+            for future in done:
+                index = pending.pop(future)
+                try:
+                    status, data, size = future.result()
+                except BackendError as e:
+                    error = e
+                    continue
+                if index > 0:
+                    metrics.increment("backend_hedge_wins")
+                metrics.increment("fetch_bytes", size)
+                return status, data
+            if not pending and launched < len(attempts):
+                # Falha rápida: o próximo endpoint não espera o atraso da reserva
+                metrics.increment("backend_failover")
+                launch(launched)
+                launched += 1
+        raise error
+
+    async def get_json(self, path: str, params: Optional[Dict[str, Any]] = None,
+                       headers: Optional[Dict[str, str]] = None, timeout: float = 10) -> Any:
+        """
+        JSON da chamada (None para respostas 4xx). Se todos os endpoints falharem,
+        retorna a última resposta válida do mesmo caminho, se ainda dentro de BACKEND_STALE_TTL_S.
+
+        Raises:
+            BackendError: Se todos os endpoints falharem e não houver dados guardados.
+        """
+        key = (path, tuple(sorted((params or {}).items())))
+        try:
+            status, data = await self.get(path, params, headers, timeout)
+        except BackendError:
+            with self._lock:
+                stale = self._stale.get(key)
+            if stale is None or time.monotonic() - stale[0] > self.stale_ttl_s:
+                metrics.increment("fetch_stale_missing")
+                raise
+            metrics.increment("fetch_stale")
+            return stale[1]
+        if status == 200:
+            with self._lock:
+                self._stale[key] = (time.monotonic(), data)
+                self._stale.move_to_end(key)
+                while len(self._stale) > self.stale_max:
+                    self._stale.popitem(last=False)
+        return data
@@ -0,0 +1,56 @@
+"""
+Cascata de modelos (LLM_CASCADE_MODEL_PATH).
+
+Um modelo GGUF pequeno responde primeiro; a resposta só é repassada ao
+modelo principal quando algum sinal indica baixa confiança:
+
+- logprob: média dos log-probs dos tokens gerados abaixo do limite;
+- recusa: o modelo disse que não sabe ou não tem a informação;
+- fundamentacao: a resposta cita números (notas, horários, valores) que
+  não aparecem nos dados do aluno enviados no prompt.
+
+Os dois modelos ficam carregados e compartilham o mesmo slot de geração.
+"""
+import re
+from typing import List, Optional
+
+REFUSAL_RE = re.compile(
+    r"não (sei|tenho (essa|esta|acesso|informaç)|consigo|possuo|encontrei|há informaç)|"
+    r"como (um )?(modelo|assistente) de (linguagem|ia)|desculpe",
+    re.IGNORECASE,
+)
+# Números citados na resposta: notas (7.5, 8,25), horários (08:00) e valores (1250.00)
+_NUMBER_RE = re.compile(r"\d+(?:[.,:]\d+)+")
+
+def mean_logprob(token_logprobs: List[Optional[float]]) -> Optional[float]:
+    """Média dos log-probs dos tokens gerados (None se não houver)."""
+    values = [lp for lp in token_logprobs if lp is not None]
+    return sum(values) / len(values) if values else None
+
+def _canonical(number: str) -> str:
+    number = number.replace(",", ".")
+    if ":" in number:
+        return ":".join(part.zfill(2) for part in number.split(":")[:2])
+    return number.rstrip("0").rstrip(".") if "." in number else number
+
+def ungrounded_numbers(answer: str, context: str) -> List[str]:
+    """Números da resposta que não aparecem no contexto (prompt com os dados do aluno)."""
+    known = {_canonical(n) for n in _NUMBER_RE.findall(context)}
+    return [n for n in _NUMBER_RE.findall(answer) if _canonical(n) not in known]
+
+def escalation_reason(answer: str, token_logprobs: List[Optional[float]], context: str,
+                      min_logprob: float) -> Optional[str]:
+    """
+    Motivo para repassar a pergunta ao modelo principal, ou None se a
+    resposta do modelo pequeno pode ser usada.
+    """
+    if not answer.strip():
+        return "vazia"
+    if REFUSAL_RE.search(answer):
+        return "recusa"
+    if ungrounded_numbers(answer, context):
+        return "fundamentacao"
+    confidence = mean_logprob(token_logprobs)
+    if confidence is not None and confidence < min_logprob:
+        return "logprob"
+    return None
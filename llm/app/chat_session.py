@@ -0,0 +1,144 @@
+"""
+Sessões de chat por conexão WebSocket.
+
+A sessão guarda, enquanto a conexão estiver aberta, os dados do aluno (buscados
+uma vez), o prompt de sistema e os turnos da conversa. O prompt de cada turno
+estende o anterior (turnos + resposta + nova pergunta), então o llama.cpp
+reaproveita o prefixo já avaliado e só faz o prefill da pergunta nova.
+
+Como o modelo é compartilhado, outra requisição pode sobrescrever o cache KV
+entre dois turnos. O KVSlot fixa o prefixo da sessão: quando outra geração
+vai ocupar o modelo, o estado da sessão dona do cache é salvo
+(save_state) e restaurado (load_state) no próximo turno dela.
+
+Os estados salvos ficam em memória e somam no máximo LLM_CHAT_KV_SAVED_MB
+(padrão 1024); ao passar do limite, os salvos há mais tempo são descartados
+e a sessão volta a fazer o prefill completo no próximo turno. Quando o
+histórico não cabe mais no contexto e os turnos mais antigos saem do prompt,
+o estado salvo deixa de corresponder ao prefixo e também é descartado.
+"""
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from . import metrics
+
+SAVED_MAX_BYTES = int(float(os.getenv("LLM_CHAT_KV_SAVED_MB", "1024")) * 1024 * 1024)
+
+class KVSlot:
+    """Estado do cache KV fixado para uma sessão."""
+
+    def __init__(self):
+        self.state: Any = None
+        self.closed = False
+
+# Sessão cujo prefixo está no cache KV do modelo principal (acesso dentro do slot de geração)
+_owner: Optional[KVSlot] = None
+_owner_lock = threading.Lock()
+# Sessões com estado salvo, da salva há mais tempo para a mais recente -> bytes do estado
+_saved: "OrderedDict[KVSlot, int]" = OrderedDict()
+_saved_total = 0
+
+def state_bytes(state: Any) -> int:
+    """Tamanho do estado salvo (llama_state_size do LlamaState)."""
+    return int(getattr(state, "llama_state_size", 0) or 0)
+
+def saved_bytes() -> int:
+    """Memória ocupada pelos estados salvos das sessões (lida sem o lock, para as métricas)."""
+    return _saved_total
+
+def _drop(slot: KVSlot) -> None:
+    global _saved_total
+    slot.state = None
+    _saved_total -= _saved.pop(slot, 0)
+
+def _save(slot: KVSlot, state: Any, max_bytes: int) -> None:
+    """Guarda o estado da sessão, descartando os salvos há mais tempo acima de max_bytes."""
+    global _saved_total
+    _drop(slot)
+    size = state_bytes(state)
+    if size > max_bytes:
+        metrics.increment("chat_kv_evicted")
+        return
+    while _saved and _saved_total + size > max_bytes:
+        _drop(next(iter(_saved)))
+        metrics.increment("chat_kv_evicted")
+    slot.state = state
+    _saved[slot] = size
+    _saved_total += size
+
+def switch_kv(model: Any, slot: Optional[KVSlot], max_bytes: Optional[int] = None) -> bool:
+    """
+    Prepara o cache KV do modelo para a geração de slot (None = requisição
+    avulsa). Deve ser chamada com o slot de geração ocupado. max_bytes
+    substitui LLM_CHAT_KV_SAVED_MB.
+
+    Returns:
+        True se o estado da sessão foi restaurado.
+    """
+    global _owner
+    with _owner_lock:
+        if slot is _owner:
+            return False
+        # O estado da sessão que vai usar o modelo sai dos salvos antes do limite ser aplicado:
+        # ele vai para o modelo, e uma cópia nova é salva quando outra geração o ocupar
+        state = slot.state if slot is not None else None
+        if slot is not None:
+            _drop(slot)
+        if _owner is not None and not _owner.closed:
+            # Outra geração vai sobrescrever o cache: preserva o prefixo da sessão dona
+            _save(_owner, model.save_state(), SAVED_MAX_BYTES if max_bytes is None else max_bytes)
+        if state is not None:
+            model.load_state(state)
+        _owner = slot
+        return state is not None
+
+def discard_kv(slot: KVSlot) -> None:
+    """Descarta o estado salvo da sessão (o prefixo mudou e o estado não serve mais)."""
+    with _owner_lock:
+        _drop(slot)
+
+def release_kv(slot: KVSlot) -> None:
+    """Libera o estado salvo da sessão (conexão encerrada)."""
+    global _owner
+    with _owner_lock:
+        slot.closed = True
+        _drop(slot)
+        if _owner is slot:
+            _owner = None
+
+class ChatSession:
+    """Contexto e turnos de uma conversa."""
+
+    def __init__(self, student_id: int, student_data: Dict[str, Any], system_prompt: str):
+        self.student_id = student_id
+        self.student_data = student_data
+        self.system_prompt = system_prompt
+        self.turns: List[Tuple[str, str]] = []
+        self.kv_slot = KVSlot()
+
+    def build_prompt(self, question: str, max_chars: Optional[int] = None) -> str:
+        """
+        Prompt (formato Phi-3) com o contexto, os turnos anteriores e a pergunta.
+        Se max_chars for informado, descarta os turnos mais antigos até caber;
+        os turnos descartados saem da sessão (o histórico só cresce) e o estado
+        KV salvo, que tinha o prefixo antigo, é descartado.
+        """
+        while True:
+            prompt = f"<|user|>\n{self.system_prompt.strip()}\n\n"
+            for i, (q, a) in enumerate(self.turns):
+                prefix = "Pergunta: " if i == 0 else ""
+                prompt += f"{prefix}{q}<|end|>\n<|assistant|>{a}<|end|>\n<|user|>\n"
+            prompt += f"{'Pergunta: ' if not self.turns else ''}{question}<|end|>\n<|assistant|>"
+            if max_chars is None or len(prompt) <= max_chars or not self.turns:
+                return prompt
+            self.turns.pop(0)
+            discard_kv(self.kv_slot)
+            metrics.increment("chat_turns_truncated")
+
+    def add_turn(self, question: str, answer: str) -> None:
+        self.turns.append((question, answer))
+
+    def close(self) -> None:
+        release_kv(self.kv_slot)
@@ -0,0 +1,129 @@
+"""
+Agrupamento (single-flight) de chamadas idênticas em andamento.
+
+Cliques duplos, novas tentativas e várias abas abertas geram consultas
+idênticas ao mesmo tempo. Enquanto a primeira estiver em andamento, as
+demais se juntam a ela em vez de repetir o trabalho:
+
+- SingleFlight: uma corrotina (ex.: busca no backend) compartilhada por
+  todos os que pedem a mesma chave; cada um recebe o mesmo resultado.
+- StreamFlight: um stream de trechos (geração) compartilhado; quem chega
+  depois recebe os trechos já produzidos e segue o stream dali em diante.
+
+Nada é guardado depois que a chamada termina: não é um cache.
+"""
+import asyncio
+from contextlib import aclosing
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional
+
+from . import metrics
+from .scheduler import CancelToken, GenerationCancelled
+
+# Intervalo (s) de verificação do cancelamento de cada participante de um stream
+POLL_INTERVAL = 0.05
+
+def _same_loop(future: asyncio.Future) -> bool:
+    return future.get_loop() is asyncio.get_running_loop()
+
+class SingleFlight:
+    """Executa no máximo uma chamada por chave ao mesmo tempo."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Executa fn() ou aguarda a execução já em andamento para a mesma chave."""
+        future = self._calls.get(key)
+        if future is None or not _same_loop(future):
+            future = asyncio.ensure_future(fn())
+            self._calls[key] = future
+            future.add_done_callback(lambda f: self._calls.pop(key, None) if self._calls.get(key) is f else None)
+        else:
+            metrics.increment(f"{self.name}_coalesced")
+        # shield: quem desiste de esperar não cancela a chamada dos demais
+        return await asyncio.shield(future)
+
+class _Flight:
+    def __init__(self):
+        self.pieces: List[Any] = []
+        self.finished = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.token = CancelToken()
+        self.changed = asyncio.Event()
+        self.task: Optional[asyncio.Future] = None
+
+    def notify(self) -> None:
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+class StreamFlight:
+    """
+    Compartilha um stream assíncrono entre os pedidos idênticos simultâneos.
+
+    O stream recebe um CancelToken próprio, cancelado apenas quando todos os
+    participantes desistem (desconexão ou prazo de cada um).
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._flights: Dict[Hashable, _Flight] = {}
+
+    async def _produce(self, key: Hashable, flight: _Flight, factory) -> None:
+        try:
+            async with aclosing(factory(flight.token)) as stream:
+                async for piece in stream:
+                    flight.pieces.append(piece)
+                    flight.notify()
+        except BaseException as e:
+            flight.error = e
+        finally:
+            flight.finished = True
+            flight.notify()
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+    async def subscribe(self, key: Hashable, factory: Callable[[CancelToken], AsyncIterator[Any]],
+                        cancel_token: Optional[CancelToken] = None) -> AsyncIterator[Any]:
+        """
+        Participa do stream da chave, iniciando-o com factory(token) se ainda
+        não houver um em andamento.
+
+        Raises:
+            GenerationCancelled: Se o cancel_token deste participante for cancelado.
+        """
+        flight = self._flights.get(key)
+        if flight is None or flight.task is None or not _same_loop(flight.task):
+            flight = _Flight()
+            self._flights[key] = flight
+            flight.task = asyncio.ensure_future(self._produce(key, flight, factory))
+        else:
+            metrics.increment(f"{self.name}_coalesced")
+        flight.subscribers += 1
+        reason = "disconnect"
+        try:
+            i = 0
+            while True:
+                changed = flight.changed
+                while i < len(flight.pieces):
+                    yield flight.pieces[i]
+                    i += 1
+                if flight.finished:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                if cancel_token is not None and cancel_token.cancelled:
+                    reason = cancel_token.reason
+                    raise GenerationCancelled(reason)
+                try:
+                    await asyncio.wait_for(changed.wait(), POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.finished:
+                # Ninguém mais aguarda: interrompe a geração e não aceita novos participantes
+                flight.token.cancel(reason)
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
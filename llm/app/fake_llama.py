@@ -0,0 +1,249 @@
+"""
+Backend de modelo simulado com a mesma interface de chamada do llama_cpp.Llama.
+
+Permite testar e medir fila, streaming, cancelamento e cache do serviço sem
+carregar um GGUF de vários GB. O custo de prefill e de decode é simulado com
+taxas configuráveis (tokens/s) e jitter, e o texto gerado é determinístico:
+o mesmo prompt com a mesma semente produz sempre a mesma saída.
+
+Selecionado com LLM_BACKEND=fake. Variáveis de ambiente:
+    LLM_FAKE_PREFILL_TPS: Tokens de prompt processados por segundo (padrão: 200).
+    LLM_FAKE_DECODE_TPS: Tokens gerados por segundo (padrão: 20).
+    LLM_FAKE_JITTER: Variação relativa máxima de cada atraso, 0 a 1 (padrão: 0.1).
+    LLM_FAKE_OUTPUT_TOKENS: Tamanho típico da resposta em tokens (padrão: 80).
+    LLM_FAKE_SEED: Semente do gerador (padrão: 0).
+    LLM_FAKE_LOGPROB_MAX: Incerteza máxima de uma resposta; a média dos
+        log-probs de cada resposta fica entre 0 e -LLM_FAKE_LOGPROB_MAX (padrão: 1.5).
+"""
+import json
+import os
+import random
+import re
+import time
+import zlib
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+from .kv_cache import bytes_per_sequence
+
+# Tokenização aproximada: palavras quebradas em pedaços de até 4 caracteres,
+# pontuação e espaços isolados (próximo da contagem de um tokenizer BPE)
+_TOKEN_RE = re.compile(r" ?\w{1,4}|[^\w\s]|\s+")
+
+_ABERTURAS = [
+    "Olá! Com base nas suas informações,",
+    "Claro! Pelos dados que tenho,",
+    "Vamos lá. De acordo com o sistema,",
+]
+_FECHAMENTOS = [
+    "Posso ajudar com mais alguma coisa?",
+    "Se precisar de mais detalhes, procure a coordenação.",
+    "Qualquer dúvida, estou à disposição.",
+]
+# Modo estruturado: (prefixo dos registros, intenção, palavras-chave da pergunta)
+_INTENCOES = [
+    ("H", "horario", ("horário", "aula", "sala")),
+    ("F", "financeiro", ("mensalidade", "pagamento", "financeiro")),
+    ("N", "nota", ("nota", "média", "prova")),
+]
+_PALAVRAS_COMUNS = {"qual", "quais", "minha", "minhas", "meu", "meus", "quando", "onde", "está", "tenho",
+                    "nota", "notas", "aula", "aulas", "horário", "horários", "sala", "mensalidade"}
+
+def fake_config_from_env() -> Dict[str, Any]:
+    """Lê a configuração do backend simulado das variáveis de ambiente."""
+    return {
+        "prefill_tps": float(os.getenv("LLM_FAKE_PREFILL_TPS", "200")),
+        "decode_tps": float(os.getenv("LLM_FAKE_DECODE_TPS", "20")),
+        "jitter": float(os.getenv("LLM_FAKE_JITTER", "0.1")),
+        "output_tokens": int(os.getenv("LLM_FAKE_OUTPUT_TOKENS", "80")),
+        "seed": int(os.getenv("LLM_FAKE_SEED", "0")),
+        "logprob_max": float(os.getenv("LLM_FAKE_LOGPROB_MAX", "1.5")),
+    }
+
+class FakeLlamaState:
+    """Estado salvo (como o llama_cpp.LlamaState): tokens avaliados e o tamanho do cache KV em bytes."""
+
+    def __init__(self, input_ids: List[int], llama_state_size: int):
+        self.input_ids = input_ids
+        self.llama_state_size = llama_state_size
+
+class FakeLlama:
+    """
+    Substituto determinístico do llama_cpp.Llama.
+
+    Implementa __call__/create_completion (com e sem stream), tokenize,
+    detokenize, n_ctx e save_state/load_state. Assim como o llama.cpp, reutiliza
+    o prefixo de tokens já avaliado na chamada anterior, cobrando prefill só
+    pelo trecho novo do prompt. Com grammar=, gera o JSON do modo estruturado
+    (app.structured) em vez de prosa.
+    """
+
+    def __init__(self, model_path: Optional[str] = None, n_ctx: int = 4096,
+                 prefill_tps: float = 200.0, decode_tps: float = 20.0, jitter: float = 0.1,
+                 output_tokens: int = 80, seed: int = 0, logprob_max: float = 1.5, **kwargs):
+        self.model_path = model_path or "fake"
+        self._n_ctx = n_ctx
+        self.prefill_tps = prefill_tps
+        self.decode_tps = decode_tps
+        self.jitter = jitter
+        self.output_tokens = output_tokens
+        self.seed = seed
+        self.logprob_max = logprob_max
+        # Forma do Phi-3-mini, para as estimativas de memória do cache KV
+        self.metadata = {"general.name": "fake-llama", "general.architecture": "fake",
+                         "fake.block_count": "32", "fake.embedding_length": "3072",
+                         "fake.attention.head_count": "32", "fake.attention.head_count_kv": "32"}
+        self._vocab: Dict[int, bytes] = {}
+        self._input_ids: List[int] = []
+
+    # Interface de tokenização
+
+    def tokenize(self, text: bytes, add_bos: bool = True, special: bool = False) -> List[int]:
+        tokens = [1] if add_bos else []
+        for piece in _TOKEN_RE.findall(text.decode("utf-8", errors="ignore")):
+            raw = piece.encode("utf-8")
+            token = zlib.crc32(raw) % 32000 + 2
+            self._vocab.setdefault(token, raw)
+            tokens.append(token)
+        return tokens
+
+    def detokenize(self, tokens: List[int], prev_tokens: Optional[List[int]] = None, special: bool = False) -> bytes:
+        return b"".join(self._vocab.get(token, b"") for token in tokens)
+
+    def n_ctx(self) -> int:
+        return self._n_ctx
+
+    def reset(self) -> None:
+        self._input_ids = []
+
+    def save_state(self) -> FakeLlamaState:
+        return FakeLlamaState(list(self._input_ids), bytes_per_sequence(self.metadata, len(self._input_ids)))
+
+    def load_state(self, state: FakeLlamaState) -> None:
+        self._input_ids = list(state.input_ids)
+
+    # Geração
+
+    def __call__(self, prompt: str, max_tokens: int = 16, stop: Optional[Union[str, List[str]]] = None,
+                 temperature: float = 0.8, echo: bool = False, stream: bool = False,
+                 logprobs: Optional[int] = None, **kwargs) -> Union[Dict[str, Any], Iterator[Dict[str, Any]]]:
+        chunks = self._generate(prompt, max_tokens, stop, logprobs, kwargs.get("grammar") is not None)
+        if stream:
+            return chunks
+        return self._collect(prompt, chunks, echo)
+
+    create_completion = __call__
+
+    def _sleep(self, rng: random.Random, seconds: float) -> None:
+        if seconds > 0:
+            time.sleep(seconds * (1 + rng.uniform(-self.jitter, self.jitter)))
+
+    def _generate(self, prompt: str, max_tokens: int, stop, logprobs,
+                  structured: bool = False) -> Iterator[Dict[str, Any]]:
+        # Geradores separados para o texto e para os atrasos, para que o texto
+        # não dependa de quanto do prompt foi reaproveitado
+        seed = zlib.crc32(prompt.encode("utf-8")) ^ self.seed
+        rng = random.Random(seed)
+        text_rng = random.Random(seed + 1)
+        # Incerteza da resposta: média dos log-probs dos tokens em torno de -uncertainty
+        uncertainty = random.Random(seed + 2).uniform(0.0, self.logprob_max)
+        prompt_tokens = self.tokenize(prompt.encode("utf-8"))
+        if len(prompt_tokens) > self._n_ctx:
+            raise ValueError(f"Requested tokens ({len(prompt_tokens)}) exceed context window of {self._n_ctx}")
+
+        # Prefill apenas do trecho que não está no prefixo já avaliado
+        reused = 0
+        for a, b in zip(self._input_ids, prompt_tokens):
+            if a != b:
+                break
+            reused += 1
+        self._sleep(rng, (len(prompt_tokens) - reused) / self.prefill_tps)
+        self._input_ids = list(prompt_tokens)
+
+        stops = [stop] if isinstance(stop, str) else list(stop or [])
+        limit = min(max_tokens or self.output_tokens, self._n_ctx - len(prompt_tokens))
+        answer = self._structured_text(prompt, text_rng) if structured else self._answer_text(prompt, text_rng)
+        pieces = _TOKEN_RE.findall(answer)
+        completion_id = f"cmpl-fake-{zlib.crc32(prompt.encode('utf-8')):08x}"
+        created = int(time.time())
+        text = ""
+        finish_reason = "stop"
+        for i, piece in enumerate(pieces):
+            if i >= limit:
+                finish_reason = "length"
+                break
+            hit = next((s for s in stops if s and s in text + piece), None)
+            if hit:
+                # Emite apenas o trecho anterior à sequência de parada
+                piece = (text + piece).split(hit)[0][len(text):]
+            if piece:
+                self._sleep(rng, 1 / self.decode_tps)
+                text += piece
+                self._input_ids.append(zlib.crc32(piece.encode("utf-8")) % 32000 + 2)
+                choice = {"text": piece, "index": 0, "logprobs": None, "finish_reason": None}
+                if logprobs is not None:
+                    choice["logprobs"] = {
+                        "tokens": [piece],
+                        "token_logprobs": [-text_rng.uniform(0.0, 2 * uncertainty)],
+                        "top_logprobs": [None],
+                        "text_offset": [len(text) - len(piece)],
+                    }
+                yield {"id": completion_id, "object": "text_completion", "created": created,
+                       "model": self.model_path, "choices": [choice]}
+            if hit:
+                break
+        yield {"id": completion_id, "object": "text_completion", "created": created, "model": self.model_path,
+               "choices": [{"text": "", "index": 0, "logprobs": None, "finish_reason": finish_reason}]}
+
+    def _collect(self, prompt: str, chunks: Iterator[Dict[str, Any]], echo: bool) -> Dict[str, Any]:
+        text = ""
+        logprobs = None
+        completion_tokens = 0
+        for chunk in chunks:
+            choice = chunk["choices"][0]
+            if choice["text"]:
+                completion_tokens += 1
+                text += choice["text"]
+            if choice["logprobs"] is not None:
+                logprobs = logprobs or {"tokens": [], "token_logprobs": [], "top_logprobs": [], "text_offset": []}
+                for key in logprobs:
+                    logprobs[key].extend(choice["logprobs"][key])
+            last = chunk
+        prompt_tokens = len(self.tokenize(prompt.encode("utf-8")))
+        return {
+            "id": last["id"], "object": "text_completion", "created": last["created"], "model": self.model_path,
+            "choices": [{"text": (prompt + text) if echo else text, "index": 0, "logprobs": logprobs,
+                         "finish_reason": last["choices"][0]["finish_reason"]}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        }
+
+    def _answer_text(self, prompt: str, rng: random.Random) -> str:
+        """Monta uma resposta determinística reaproveitando linhas de dados do prompt."""
+        # Itens de lista ("- ...") ou linhas de tabela do contexto compacto ("a|b|c")
+        facts = [line.strip(" -\t").replace("|", ", ") for line in prompt.splitlines()
+                 if line.strip().startswith("-")
+                 or ("|" in line and "<|" not in line and not line.rstrip().endswith(":"))]
+        words = [rng.choice(_ABERTURAS)]
+        if facts:
+            words.extend(rng.sample(facts, k=min(len(facts), 3)))
+        words.append(rng.choice(_FECHAMENTOS))
+        text = " ".join(words)
+        # Completa até o tamanho típico configurado repetindo os fatos
+        while len(_TOKEN_RE.findall(text)) < self.output_tokens and facts:
+            text += " " + rng.choice(facts) + "."
+        return " " + text
+
+    def _structured_text(self, prompt: str, rng: random.Random) -> str:
+        """Monta o JSON do modo estruturado citando registros do prompt relacionados à pergunta."""
+        records = re.findall(r"^([NHF]\d+): (.*)$", prompt, re.MULTILINE)
+        question = prompt.rsplit("Pergunta:", 1)[-1].lower()
+        prefix, intent = next(((p, i) for p, i, words in _INTENCOES if any(w in question for w in words)),
+                              (None, "geral"))
+        candidates = [(rid, text.lower()) for rid, text in records if rid[0] == prefix]
+        # Palavras da pergunta que podem identificar uma disciplina
+        words = [w for w in re.findall(r"\w{4,}", question) if w not in _PALAVRAS_COMUNS]
+        cited = [rid for rid, text in candidates if any(w in text for w in words)]
+        if not cited and candidates:
+            cited = [rid for rid, _ in rng.sample(candidates, k=min(len(candidates), 2))]
+        texto = "" if cited else rng.choice(_FECHAMENTOS)
+        return json.dumps({"intencao": intent, "registros": cited, "texto": texto}, ensure_ascii=False)
@@ -0,0 +1,158 @@
+"""
+Consultas assíncronas (jobs) para gerações longas.
+
+O cliente envia a consulta e recebe imediatamente o id do job; depois
+consulta o estado ou acompanha a resposta por SSE. Com uma chave de
+idempotência, uma nova tentativa do cliente (ex.: após o timeout de 30 s do
+frontend) se junta ao job em andamento ou já concluído em vez de iniciar
+outra geração. Jobs terminados ficam disponíveis por LLM_JOB_TTL segundos.
+"""
+import asyncio
+import logging
+import time
+import uuid
+from contextlib import aclosing
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from . import metrics
+from .scheduler import CancelToken, GenerationCancelled
+
+logger = logging.getLogger(__name__)
+
+class JobConflict(Exception):
+    """Chave de idempotência reutilizada com uma consulta diferente."""
+
+class Job:
+    """Estado de uma consulta assíncrona e trechos da resposta já gerados."""
+
+    def __init__(self, params: Dict[str, Any], key: Optional[Tuple[int, str]], timeout: float):
+        self.id = uuid.uuid4().hex
+        self.params = params
+        self.key = key
+        self.status = "running"
+        self.pieces: List[str] = []
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.token = CancelToken(deadline=time.monotonic() + timeout)
+        self.task: Optional[asyncio.Future] = None
+        self.changed = asyncio.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.status != "running"
+
+    def notify(self) -> None:
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+    def to_dict(self) -> Dict[str, Any]:
+        text = "".join(self.pieces).strip()
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "answer": text if self.status == "done" else None,
+            "partial": None if self.status == "done" else text,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+class JobStore:
+    """
+    Jobs em memória, indexados pelo id e pela chave de idempotência
+    (escopo: aluno + chave informada pelo cliente).
+    """
+
+    def __init__(self, runner: Callable[..., AsyncIterator[str]], ttl: float, timeout: float):
+        self.runner = runner
+        self.ttl = ttl
+        self.timeout = timeout
+        self._jobs: Dict[str, Job] = {}
+        self._by_key: Dict[Tuple[int, str], Job] = {}
+
+    @property
+    def active(self) -> int:
+        return sum(1 for job in self._jobs.values() if not job.finished)
+
+    def submit(self, params: Dict[str, Any], idempotency_key: Optional[str] = None) -> Tuple[Job, bool]:
+        """
+        Cria o job da consulta, ou retorna o job existente da mesma chave de
+        idempotência (em andamento ou concluído com sucesso).
+
+        Returns:
+            (job, criado)
+
+        Raises:
+            JobConflict: Se a chave já foi usada com outra consulta.
+        """
+        self.purge()
+        key = (params["student_id"], idempotency_key) if idempotency_key else None
+        existing = self._by_key.get(key) if key else None
+        if existing is not None and existing.status in ("running", "done"):
+            if existing.params != params:
+                raise JobConflict(idempotency_key)
+            metrics.increment("jobs_reattached")
+            return existing, False
+        # Job anterior da mesma chave falhou ou foi cancelado: a nova tentativa gera novamente
+        job = Job(params, key, self.timeout)
+        self._jobs[job.id] = job
+        if key:
+            self._by_key[key] = job
+        job.task = asyncio.ensure_future(self._run(job))
+        metrics.increment("jobs_submitted")
+        return job, True
+
+    async def _run(self, job: Job) -> None:
+        try:
+            async with aclosing(self.runner(cancel_token=job.token, **job.params)) as pieces:
+                async for piece in pieces:
+                    job.pieces.append(piece)
+                    job.notify()
+            job.status = "done"
+        except GenerationCancelled as e:
+            job.status = "cancelled"
+            job.error = e.reason
+        except Exception as e:
+            logger.exception("Erro no job %s: %s", job.id, e)
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            if job.status == "running":
+                # Tarefa interrompida (ex.: desligamento do serviço)
+                job.status = "cancelled"
+                job.error = "shutdown"
+            job.finished_at = time.time()
+            metrics.increment(f"jobs_{job.status}")
+            job.notify()
+
+    def get(self, job_id: str) -> Optional[Job]:
+        self.purge()
+        return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """Cancela o job (a geração para no próximo token)."""
+        job = self.get(job_id)
+        if job is not None and not job.finished:
+            job.token.cancel("job_cancelled")
+        return job
+
+    async def follow(self, job: Job) -> AsyncIterator[str]:
+        """Trechos do job desde o início, seguindo a geração até o fim (sair não cancela o job)."""
+        i = 0
+        while True:
+            changed = job.changed
+            while i < len(job.pieces):
+                yield job.pieces[i]
+                i += 1
+            if job.finished:
+                return
+            await changed.wait()
+
+    def purge(self) -> None:
+        """Remove os jobs terminados há mais de ttl segundos."""
+        limit = time.time() - self.ttl
+        for job in [j for j in self._jobs.values() if j.finished_at is not None and j.finished_at < limit]:
+            del self._jobs[job.id]
+            if job.key and self._by_key.get(job.key) is job:
+                del self._by_key[job.key]
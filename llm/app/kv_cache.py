@@ -0,0 +1,72 @@
+"""
+Precisão do cache KV e estimativa de memória por sequência.
+
+O llama.cpp aloca, para cada sequência, K e V de n_ctx posições em todas as
+camadas. Em f16 isso custa ~1,5 GB para o Phi-3-mini com n_ctx=4096; em
+q8_0 cai para pouco mais da metade e em q4_0 para menos de um terço. A
+quantização do V exige o caminho de atenção com flash attention do llama.cpp
+(disponível também em CPU).
+"""
+import os
+from typing import Any, Dict, Optional
+
+# Tipos ggml aceitos em type_k/type_v: nome -> (id do ggml_type, bytes por elemento)
+GGML_TYPES = {
+    "f32": (0, 4.0),
+    "f16": (1, 2.0),
+    "q4_0": (2, 18 / 32),
+    "q4_1": (3, 20 / 32),
+    "q5_0": (6, 22 / 32),
+    "q5_1": (7, 24 / 32),
+    "q8_0": (8, 34 / 32),
+}
+
+def ggml_type(name: str) -> int:
+    """Id do ggml_type para o nome informado (ex.: "q8_0")."""
+    try:
+        return GGML_TYPES[name.lower()][0]
+    except KeyError:
+        raise ValueError(f"Tipo de cache KV desconhecido: {name} (opções: {', '.join(GGML_TYPES)})")
+
+def kv_overrides() -> Dict[str, Any]:
+    """
+    Opções do cache KV definidas por variáveis de ambiente, que prevalecem
+    sobre o perfil da plataforma: LLM_KV_TYPE (K e V), LLM_KV_TYPE_K,
+    LLM_KV_TYPE_V e LLM_FLASH_ATTN (1/0).
+    """
+    overrides: Dict[str, Any] = {}
+    both = os.getenv("LLM_KV_TYPE")
+    for key, env in (("type_k", "LLM_KV_TYPE_K"), ("type_v", "LLM_KV_TYPE_V")):
+        value = os.getenv(env) or both
+        if value:
+            ggml_type(value)
+            overrides[key] = value.lower()
+    flash_attn = os.getenv("LLM_FLASH_ATTN")
+    if flash_attn:
+        overrides["flash_attn"] = flash_attn.lower() in ("1", "true", "yes", "on")
+    return overrides
+
+def model_shape(metadata: Dict[str, Any]) -> Optional[Dict[str, int]]:
+    """Camadas e dimensões de K/V por token a partir dos metadados GGUF do modelo."""
+    arch = metadata.get("general.architecture")
+    try:
+        n_layer = int(metadata[f"{arch}.block_count"])
+        n_embd = int(metadata[f"{arch}.embedding_length"])
+        n_head = int(metadata[f"{arch}.attention.head_count"])
+        n_head_kv = int(metadata.get(f"{arch}.attention.head_count_kv", n_head))
+    except (KeyError, TypeError, ValueError):
+        return None
+    head_dim = n_embd // n_head
+    n_embd_k = int(metadata.get(f"{arch}.attention.key_length", head_dim)) * n_head_kv
+    n_embd_v = int(metadata.get(f"{arch}.attention.value_length", head_dim)) * n_head_kv
+    return {"n_layer": n_layer, "n_embd_k": n_embd_k, "n_embd_v": n_embd_v}
+
+def bytes_per_sequence(metadata: Dict[str, Any], n_ctx: int, type_k: str = "f16",
+                       type_v: str = "f16") -> Optional[int]:
+    """Memória do cache KV de uma sequência de n_ctx posições (None se o modelo não informar a forma)."""
+    shape = model_shape(metadata)
+    if shape is None:
+        return None
+    per_token = shape["n_layer"] * (shape["n_embd_k"] * GGML_TYPES[type_k][1] +
+                                    shape["n_embd_v"] * GGML_TYPES[type_v][1])
+    return int(per_token * n_ctx)
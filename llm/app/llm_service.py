@@ -1,6 +1,7 @@
 import sys
 import os
-from typing import Dict, List, Optional, Any
+import asyncio
+from typing import Dict, List, Optional, Any, AsyncIterator, Callable
 import requests
 import json
 import random
@@ -13,24 +14,35 @@ from langchain.chains import LLMChain
 from langchain.prompts import PromptTemplate
 from langchain.memory import ConversationBufferMemory
 import gc
+import datetime
 import time
+from contextlib import aclosing
 from threading import Thread
 
+# Configurar logging assíncrono (fila + thread de escrita) antes dos demais imports
+from .logging_config import setup_logging, begin_request_logging, request_sampled
+setup_logging()
+
 # Import da configuração da plataforma
 from .platform_config import get_model_config, should_run_gc, is_mac_m1
-
-# Configurar logging com rotação de arquivos
-try:
-    from logging.handlers import RotatingFileHandler
-    log_handler = RotatingFileHandler("llm_service.log", maxBytes=1024*1024*5, backupCount=3)
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        handlers=[log_handler, logging.StreamHandler()]
-    )
-except:
-    # Fallback para configuração padrão
-    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+from . import metrics
+from .fake_llama import FakeLlama, fake_config_from_env
+from .scheduler import BATCH, INTERACTIVE, CancelToken, GenerationCancelled, generation_slot
+from . import structured
+from . import tools
+from . import cascade
+from . import kv_cache
+from .coalesce import SingleFlight, StreamFlight
+from . import chat_session
+from . import model_loader
+from . import prompt_context
+from .chat_session import ChatSession, KVSlot
+# Arquivo do modelo (LLM_MODEL_PATH) e URL de download (LLM_MODEL_URL)
+from .model_config import model_path, model_url
+from .quota import QuotaExceeded, QuotaTracker, Usage
+from .load_profile import PROFILES as LOAD_PROFILES, LoadGovernor
+from .backend_pool import BackendError, BackendPool
+from . import pregen
 
 logger = logging.getLogger(__name__)
 
@@ -58,11 +70,66 @@ load_dotenv()
 # Variáveis globais
 llm = None
 llm_gguf = None  # Modelo GGUF
+llm_small = None  # Modelo GGUF pequeno da cascata (opcional)
 cleanup_thread = None
 backend_url = os.getenv("BACKEND_URL", "http://backend/api")
-model_path = os.getenv("LLM_MODEL_PATH", "/app/models/Phi-3-mini-4k-instruct-q4.gguf")
-# URL atualizada para um modelo no Hugging Face
-model_url = os.getenv("LLM_MODEL_URL", "https://huggingface.co/mradermacher/ggml-gpt4all-j-v1.3-groovy/resolve/main/ggml-gpt4all-j-v1.3-groovy.bin")
+# URL alternativa, usada como segundo endpoint quando BACKEND_URLS não é definido
+backend_fallback_url = os.getenv("BACKEND_FALLBACK_URL", "http://backend/api")
+# Endpoints do backend (separados por vírgula): reserva após o percentil de latência,
+# disjuntor por endpoint e dados antigos em falha total (ver backend_pool)
+backend_pool = BackendPool.from_env(os.getenv("BACKEND_URLS", f"{backend_url},{backend_fallback_url}").split(","))
+metrics.register_gauge("backend_endpoints", backend_pool.describe)
+metrics.register_gauge("backend_breakers_open", lambda: backend_pool.open_breakers)
+# Timeout (s) de cada chamada ao backend
+backend_timeout = float(os.getenv("BACKEND_TIMEOUT", "10"))
+# Backend do modelo: "llama_cpp" (padrão) ou "fake" (simulado, para benchmarks e testes)
+llm_backend = os.getenv("LLM_BACKEND", "llama_cpp")
+# Formato da resposta: "prose" (padrão) ou "structured" (JSON com gramática + template)
+output_mode = os.getenv("LLM_OUTPUT_MODE", "prose")
+structured_max_tokens = int(os.getenv("LLM_STRUCTURED_MAX_TOKENS", "96"))
+structured_grammar = None
+# Busca dos dados do aluno: "full" (padrão, /alunos/<id>/detalhes/) ou "tools" (só o que a pergunta pede)
+fetch_mode = os.getenv("LLM_FETCH_MODE", "full")
+# Formato do contexto do aluno no prompt: "verbose" (rótulos por linha) ou "compact" (linhas de tabela;
+# ativar só depois de comparar a qualidade das respostas com benchmarks/prompt_encoding)
+prompt_context_format = os.getenv("LLM_CONTEXT_FORMAT", "verbose")
+# Agrupa consultas idênticas simultâneas e buscas do mesmo aluno (1 = ativo)
+coalesce_enabled = os.getenv("LLM_COALESCE", "1") == "1"
+fetch_flights = SingleFlight("fetch")
+generation_flights = StreamFlight("generation")
+# Arquivo do modelo: aquecimento do page cache (fadvise, read, off), SHA-256 esperado,
+# tokens de aquecimento após o carregamento e pesos fora do mmap (elegíveis a huge pages)
+model_prewarm = os.getenv("LLM_MODEL_PREWARM", "fadvise")
+model_sha256 = os.getenv("LLM_MODEL_SHA256", "")
+warmup_tokens = int(os.getenv("LLM_WARMUP_TOKENS", "16"))
+model_hugepages = os.getenv("LLM_MODEL_HUGEPAGES", "0") == "1"
+# Cascata: modelo pequeno (mesmo formato de prompt) que responde antes do principal
+cascade_model_path = os.getenv("LLM_CASCADE_MODEL_PATH", "")
+# Média mínima dos log-probs para aceitar a resposta do modelo pequeno
+cascade_min_logprob = float(os.getenv("LLM_CASCADE_MIN_LOGPROB", "-1.0"))
+# Uso por aluno (tokens e computação) e cotas; o uso é enviado ao backend a cada LLM_QUOTA_FLUSH_S segundos
+quota_tracker = QuotaTracker.from_env()
+quota_flush_s = float(os.getenv("LLM_QUOTA_FLUSH_S", "60"))
+metrics.register_gauge("quota_students_tracked", lambda: quota_tracker.students)
+metrics.register_gauge("quota_global_tokens", lambda: quota_tracker.global_usage()["tokens"])
+# Perfil de geração pela fila do slot do modelo (ver load_profile); reavaliado também ao ler as métricas
+load_governor = LoadGovernor.from_env(lambda: generation_slot.waiting)
+# O gauge só lê o nível: a histerese avança com as requisições, não com a coleta de métricas
+metrics.register_gauge("load_profile", lambda: load_governor.active)
+# Pré-geração das perguntas frequentes dos alunos ativos na janela de baixo uso (ver pregen)
+pregen_enabled = os.getenv("LLM_PREGEN", "0") == "1"
+pregen_window = pregen.parse_window(os.getenv("LLM_PREGEN_WINDOW", "02:00-06:00"))
+pregen_questions = pregen.load_questions()
+pregen_active_days = int(os.getenv("LLM_PREGEN_ACTIVE_DAYS", "7"))
+pregen_max_students = int(os.getenv("LLM_PREGEN_MAX_STUDENTS", "500"))
+pregen_idle_s = float(os.getenv("LLM_PREGEN_IDLE_S", "30"))
+pregen_store = pregen.PregenStore()
+# As respostas são geradas com o perfil de carga completo e só servidas quando o perfil ativo é o mesmo
+PREGEN_PROFILE = "normal"
+# Estado da última execução da pré-geração (GET /admin/pregen)
+pregen_status: Dict[str, Any] = {"running": False, "last": None}
+metrics.register_gauge("pregen_answers", lambda: len(pregen_store))
+metrics.register_gauge("chat_kv_saved_bytes", chat_session.saved_bytes)
 
 def memory_cleanup():
     """Executa limpeza de memória periódica."""
@@ -93,20 +160,84 @@ def start_gc_thread():
         cleanup_thread.start()
         logger.info("Thread de limpeza de memória iniciado")
 
+def llama_kwargs(config: Dict[str, Any]) -> Dict[str, Any]:
+    """Converte a configuração GGUF da plataforma nos argumentos do llama_cpp.Llama."""
+    kwargs = dict(
+        n_ctx=config.get("n_ctx", 4096),
+        n_batch=config.get("n_batch", 512),
+        n_threads=config.get("n_threads", 4),
+        n_gpu_layers=config.get("n_gpu_layers", 40),
+        use_mlock=config.get("use_mlock", True),
+        verbose=config.get("verbose", True),
+        seed=config.get("seed", -1),
+        offload_kqv=config.get("offload_kqv", True),
+        embedding=config.get("embedding", False)
+    )
+    # Opções do cache KV só são passadas quando diferem do padrão (compatível com versões antigas)
+    type_k, type_v = config.get("type_k", "f16"), config.get("type_v", "f16")
+    flash_attn = config.get("flash_attn", False)
+    if type_v != "f16" and not flash_attn:
+        logger.warning("Cache V quantizado (%s) exige flash attention; ativando flash_attn", type_v)
+        flash_attn = True
+    if type_k != "f16":
+        kwargs["type_k"] = kv_cache.ggml_type(type_k)
+    if type_v != "f16":
+        kwargs["type_v"] = kv_cache.ggml_type(type_v)
+    if flash_attn:
+        kwargs["flash_attn"] = True
+    if model_hugepages:
+        # Pesos copiados para memória anônima (em vez do mmap do arquivo), que as
+        # transparent huge pages podem cobrir
+        kwargs["use_mmap"] = False
+    return kwargs
+
+def report_kv_memory(model: Any, config: Dict[str, Any]) -> Optional[int]:
+    """
+    Publica nas métricas a memória do cache KV por sequência e quantas
+    sequências cabem no orçamento LLM_MEMORY_BUDGET_MB (descontado o arquivo
+    do modelo), se definido.
+    """
+    type_k, type_v = config.get("type_k", "f16"), config.get("type_v", "f16")
+    n_ctx = model.n_ctx() if callable(getattr(model, "n_ctx", None)) else config.get("n_ctx", 4096)
+    per_sequence = kv_cache.bytes_per_sequence(getattr(model, "metadata", None) or {}, n_ctx, type_k, type_v)
+    metrics.set_gauge("kv_cache_type", f"{type_k}/{type_v}")
+    metrics.set_gauge("kv_cache_bytes_per_sequence", per_sequence)
+    budget_mb = os.getenv("LLM_MEMORY_BUDGET_MB")
+    if per_sequence and budget_mb:
+        model_bytes = os.path.getsize(model_path) if os.path.exists(model_path) else 0
+        available = float(budget_mb) * 1024 * 1024 - model_bytes
+        metrics.set_gauge("kv_cache_sequence_capacity", max(0, int(available // per_sequence)))
+    if per_sequence:
+        logger.info("Cache KV %s/%s com n_ctx=%s: %.0f MB por sequência", type_k, type_v, n_ctx,
+                    per_sequence / 1024 / 1024)
+    return per_sequence
+
 def setup_llm():
     """
     Configura e inicializa o modelo LLM.
     
     Esta função tenta carregar primeiramente o modelo GGUF. Se não for possível,
     tenta carregar o modelo GPT4All. Se ambos falharem, usa simulação.
+    Com LLM_BACKEND=fake, usa o modelo simulado de fake_llama no lugar do GGUF.
     """
     global llm, llm_gguf
+    setup_started = time.perf_counter()
+    
+    if llm_backend == "fake":
+        config = get_model_config("gguf")
+        fake_config = fake_config_from_env()
+        llm_gguf = FakeLlama(model_path=model_path, n_ctx=config.get("n_ctx", 4096), **fake_config)
+        logger.info(f"Usando modelo simulado (LLM_BACKEND=fake): {fake_config}")
+        report_load(llm_gguf, setup_started, time.perf_counter() - setup_started)
+        report_kv_memory(llm_gguf, config)
+        setup_cascade(config)
+        return
     
     # Verifica se o modelo existe
     if not os.path.exists(model_path):
         logger.info(f"Modelo não encontrado em {model_path}.")
-        logger.warning("O modelo precisa ser baixado manualmente. Usando LLM simulado.")
-        logger.info(f"Para usar o LLM real, baixe o modelo de {model_url} e coloque-o em {model_path}")
+        logger.warning("O modelo precisa ser baixado. Usando LLM simulado.")
+        logger.info(f"Para usar o LLM real, execute 'python -m app.model_download' (baixa {model_url} para {model_path})")
         llm = None
         llm_gguf = None
         return
@@ -124,21 +255,17 @@ def setup_llm():
             # Tentar carregar o modelo GGUF com llama-cpp-python
             logger.info(f"Tentando carregar modelo GGUF de {model_path}...")
             
+            # Valida o arquivo e aquece o page cache antes do mmap do llama.cpp
+            prepare_model_file(model_path)
+            
             # Usar a configuração da plataforma
-            llm_gguf = llama_cpp.Llama(
-                model_path=model_path,
-                n_ctx=config.get("n_ctx", 4096),
-                n_batch=config.get("n_batch", 512),
-                n_threads=config.get("n_threads", 4),
-                n_gpu_layers=config.get("n_gpu_layers", 40),
-                use_mlock=config.get("use_mlock", True),
-                verbose=config.get("verbose", True),
-                seed=config.get("seed", -1),
-                offload_kqv=config.get("offload_kqv", True),
-                embedding=config.get("embedding", False)
-            )
+            load_started = time.perf_counter()
+            llm_gguf = llama_cpp.Llama(model_path=model_path, **llama_kwargs(config))
             
             logger.info(f"Modelo GGUF carregado com sucesso de {model_path}")
+            report_load(llm_gguf, setup_started, time.perf_counter() - load_started)
+            report_kv_memory(llm_gguf, config)
+            setup_cascade(config)
             
             # Iniciar thread de limpeza de memória se necessário
             if should_run_gc():
@@ -166,64 +293,195 @@ def setup_llm():
         # Fallback: usar um LLM simulado
         llm = None
 
+def prepare_model_file(path: str) -> None:
+    """Valida o arquivo do modelo (com cache no arquivo lateral) e aquece o page cache."""
+    started = time.perf_counter()
+    meta = model_loader.validate(path, model_sha256 or None)
+    metrics.set_gauge("model_validate_s", round(time.perf_counter() - started, 3))
+    metrics.set_gauge("model_validate_cached", meta["cached"])
+    warm = model_loader.prewarm(path, model_prewarm)
+    metrics.set_gauge("model_prewarm_s", round(warm["seconds"], 3))
+    logger.info("Arquivo do modelo pronto: validação %s em %.2f s, aquecimento %s em %.2f s",
+                "em cache" if meta["cached"] else "completa", time.perf_counter() - started - warm["seconds"],
+                warm["mode"], warm["seconds"])
+    if model_hugepages:
+        thp = model_loader.transparent_hugepages()
+        metrics.set_gauge("model_hugepages", thp)
+        if thp not in ("always", "madvise"):
+            logger.warning("LLM_MODEL_HUGEPAGES=1, mas as transparent huge pages estão em %s", thp)
+
+def report_load(model: Any, setup_started: float, load_s: float) -> None:
+    """Publica o tempo de carregamento e o tempo até o primeiro token em velocidade plena."""
+    metrics.set_gauge("model_load_s", round(load_s, 3))
+    if warmup_tokens <= 0:
+        return
+    loaded = time.perf_counter()
+    warm = model_loader.warmup(model, warmup_tokens)
+    ready_s = loaded - setup_started + (warm["full_speed_s"] or 0)
+    metrics.set_gauge("model_first_token_s", warm["first_token_s"])
+    metrics.set_gauge("model_ready_s", round(ready_s, 3))
+    metrics.set_gauge("model_warmup_decode_tps", warm["decode_tps"])
+    logger.info("Modelo carregado em %.2f s; velocidade plena após %.2f s desde o início (decode %s t/s)",
+                load_s, ready_s, warm["decode_tps"] and round(warm["decode_tps"], 1))
+
+def setup_cascade(config: Dict[str, Any]) -> None:
+    """
+    Carrega o modelo pequeno da cascata, se LLM_CASCADE_MODEL_PATH estiver definido.
+    
+    Com LLM_BACKEND=fake, o modelo pequeno é simulado com prefill e decode
+    LLM_FAKE_SMALL_SPEEDUP vezes mais rápidos (padrão: 4).
+    """
+    global llm_small
+    if not cascade_model_path:
+        return
+    try:
+        if llm_backend == "fake":
+            fake_config = fake_config_from_env()
+            speedup = float(os.getenv("LLM_FAKE_SMALL_SPEEDUP", "4"))
+            fake_config["prefill_tps"] *= speedup
+            fake_config["decode_tps"] *= speedup
+            fake_config["seed"] += 1
+            llm_small = FakeLlama(model_path=cascade_model_path, n_ctx=config.get("n_ctx", 4096), **fake_config)
+        else:
+            # logits_all: necessário para obter os log-probs dos tokens em streaming
+            llm_small = llama_cpp.Llama(model_path=cascade_model_path, logits_all=True, **llama_kwargs(config))
+        logger.info(f"Modelo pequeno da cascata carregado de {cascade_model_path}")
+    except Exception as e:
+        logger.error(f"Erro ao carregar modelo pequeno da cascata: {str(e)}")
+        llm_small = None
+
+def set_backend_urls(urls: List[str]) -> None:
+    """Substitui os endpoints do backend (ex.: benchmarks com o backend substituto)."""
+    global backend_url
+    backend_pool.set_urls(urls)
+    backend_url = backend_pool.endpoints[0].url
+
 async def fetch_student_data(student_id: int) -> Dict[str, Any]:
     """
     Busca dados do aluno no backend.
     
+    Buscas simultâneas do mesmo aluno compartilham uma única chamada ao backend.
+    Se nenhum endpoint responder, usa os últimos dados obtidos do aluno (ver backend_pool).
+    
     Args:
         student_id: O ID do aluno para buscar os dados.
         
     Returns:
         Um dicionário com os dados do aluno.
     """
-    endpoint = f"{backend_url}/alunos/{student_id}/detalhes/"
-    logger.info(f"Buscando dados do aluno no endpoint: {endpoint}")
+    if not coalesce_enabled:
+        return await _fetch_student_data(student_id)
+    data = await fetch_flights.do(("detalhes", student_id), lambda: _fetch_student_data(student_id))
+    # Cópia rasa: cada requisição pode acrescentar chaves sem afetar as demais
+    return dict(data)
+
+async def _fetch_student_data(student_id: int) -> Dict[str, Any]:
+    path = f"/alunos/{student_id}/detalhes/"
+    if request_sampled():
+        logger.debug("Buscando dados do aluno no endpoint: %s", path)
     
+    # Adiciona cabeçalhos para depuração
+    headers = {
+        'Accept': 'application/json',
+        'Content-Type': 'application/json',
+        'User-Agent': 'UniChat-LLM-Service'
+    }
     try:
-        # Adiciona cabeçalhos para depuração
-        headers = {
-            'Accept': 'application/json',
-            'Content-Type': 'application/json',
-            'User-Agent': 'UniChat-LLM-Service'
-        }
-        
-        # Busca detalhes do aluno
-        response = requests.get(endpoint, headers=headers, timeout=10)
-        
-        logger.info(f"Resposta do backend: Status {response.status_code}")
-        
-        if response.status_code == 200:
-            data = response.json()
-            logger.info(f"Dados recebidos do aluno {student_id}: {len(str(data))} bytes")
-            return data
-        else:
-            logger.error(f"Erro ao buscar dados do aluno: Status {response.status_code}, Resposta: {response.text}")
-            # Tente uma URL alternativa como fallback (acesso direto via backend)
-            alt_url = f"http://backend/api/alunos/{student_id}/detalhes/"
-            logger.info(f"Tentando URL alternativa: {alt_url}")
-            alt_response = requests.get(alt_url, headers=headers, timeout=10)
-            
-            if alt_response.status_code == 200:
-                data = alt_response.json()
-                logger.info(f"Dados recebidos do aluno {student_id} (via URL alternativa): {len(str(data))} bytes")
-                return data
-            else:
-                logger.error(f"Erro ao buscar dados do aluno (via URL alternativa): Status {alt_response.status_code}")
-                return {}
-    except Exception as e:
-        logger.error(f"Exceção ao buscar dados do aluno: {str(e)}")
+        data = await backend_pool.get_json(path, headers=headers, timeout=backend_timeout)
+    except BackendError as e:
+        logger.error("Erro ao buscar dados do aluno: %s", e)
+        metrics.increment(f"fetch_failed_{e.reason}")
+        return {}
+    if data is None:
+        logger.error("Aluno %s não encontrado no backend", student_id)
+        metrics.increment("fetch_failed_status")
         return {}
+    metrics.increment("fetch_ok")
+    if request_sampled():
+        logger.debug("Dados recebidos do aluno %s", student_id)
+    return data
 
-def create_system_prompt(student_data: Dict[str, Any]) -> str:
+async def _get_json(path: str, params: Optional[Dict[str, Any]] = None) -> Any:
+    """Chama um endpoint do backend e retorna o JSON, ou None em caso de falha."""
+    if not coalesce_enabled:
+        return await _get_json_uncoalesced(path, params)
+    key = (path, tuple(sorted((params or {}).items())))
+    return await fetch_flights.do(key, lambda: _get_json_uncoalesced(path, params))
+
+async def _get_json_uncoalesced(path: str, params: Optional[Dict[str, Any]] = None) -> Any:
+    headers = {'Accept': 'application/json', 'User-Agent': 'UniChat-LLM-Service'}
+    try:
+        data = await backend_pool.get_json(path, params, headers, backend_timeout)
+    except BackendError as e:
+        logger.error("Erro ao consultar %s: %s", path, e)
+        return None
+    if data is None:
+        logger.error("Erro ao consultar %s: resposta 4xx", path)
+    return data
+
+async def fetch_question_data(question: str, student_id: int) -> Dict[str, Any]:
+    """
+    Busca apenas os dados do aluno necessários para responder à pergunta.
+    
+    O roteador de tools.py escolhe os endpoints por_aluno (e filtros) a partir
+    da pergunta; o resultado tem o mesmo formato de fetch_student_data, com as
+    seções consultadas em "_consultas". Se o perfil do aluno não puder ser
+    obtido, usa a busca completa.
+    
+    Args:
+        question: A pergunta feita pelo aluno.
+        student_id: O ID do aluno.
+        
+    Returns:
+        Um dicionário com os dados do aluno.
+    """
+    calls = tools.route(question)
+    if request_sampled():
+        logger.debug("Consultas escolhidas para a pergunta: %s", calls)
+
+    async def call(tool: tools.ToolCall) -> Any:
+        path, _ = tools.TOOLS[tool.name]
+        params = {"aluno_id": student_id, **tool.params}
+        result = await _get_json(path, params)
+        if result == [] and "disciplina" in tool.params:
+            # Disciplina extraída da pergunta não bate com nenhum registro: busca sem o filtro
+            params.pop("disciplina")
+            result = await _get_json(path, params)
+        return result
+
+    perfil, *results = await asyncio.gather(
+        _get_json(tools.TOOLS["perfil"][0].format(aluno_id=student_id)), *(call(c) for c in calls))
+    if not isinstance(perfil, dict):
+        metrics.increment("fetch_tools_fallback")
+        return await fetch_student_data(student_id)
+    metrics.increment("fetch_ok")
+    data = dict(perfil)
+    data["_consultas"] = []
+    for tool, result in zip(calls, results):
+        if isinstance(result, list):
+            key = tools.TOOLS[tool.name][1]
+            data[key] = result
+            data["_consultas"].append(key)
+    return data
+
+def create_system_prompt(student_data: Dict[str, Any], context_format: Optional[str] = None,
+                         max_rows: Optional[int] = None) -> str:
     """
     Cria um prompt de sistema com informações relevantes do aluno.
     
     Args:
         student_data: Dados do aluno a serem incluídos no prompt.
+        context_format: "compact" ou "verbose" (padrão: LLM_CONTEXT_FORMAT).
+        max_rows: Limite de registros por seção, abaixo dos limites padrão (opcional).
         
     Returns:
         Um prompt formatado com informações do aluno.
     """
+    if (context_format or prompt_context_format) == "compact":
+        if not student_data:
+            logger.warning("Nenhum dado de aluno fornecido para criar o prompt.")
+        return prompt_context.compact_system_prompt(student_data, max_rows)
+    
     # Extrai informações relevantes dos dados do aluno
     if not student_data:
         logger.warning("Nenhum dado de aluno fornecido para criar o prompt.")
@@ -239,22 +497,35 @@ def create_system_prompt(student_data: Dict[str, Any]) -> str:
     curso = student_data.get("curso", "")
     semestre = student_data.get("semestre", "")
     
-    logger.info(f"Criando prompt para aluno: {nome}, curso: {curso}, semestre: {semestre}")
+    if request_sampled():
+        logger.debug("Criando prompt para aluno: %s, curso: %s, semestre: %s", nome, curso, semestre)
     
     # Formata notas (se disponíveis)
     notas_info = ""
     if "notas" in student_data and student_data["notas"]:
         notas_info = "Notas do aluno:\n"
-        for nota in student_data["notas"][:5]:  # Limita a 5 notas para o prompt
+        for nota in student_data["notas"][:prompt_context.limit(5, max_rows)]:  # Limita a 5 notas para o prompt
             notas_info += f"- {nota.get('disciplina')}: {nota.get('nota_final')}\n"
     
     # Formata horários (se disponíveis)
     horarios_info = ""
     if "horarios" in student_data and student_data["horarios"]:
         horarios_info = "Horários de aula:\n"
-        for horario in student_data["horarios"][:5]:  # Limita a 5 horários
+        for horario in student_data["horarios"][:prompt_context.limit(5, max_rows)]:  # Limita a 5 horários
             horarios_info += f"- {horario.get('disciplina')}: {horario.get('dia_semana_display')} {horario.get('horario_inicio')} - {horario.get('horario_fim')}\n"
     
+    # Financeiro e frequência só entram quando buscados para a pergunta (LLM_FETCH_MODE=tools)
+    consultas = student_data.get("_consultas") or []
+    extra_info = ""
+    if "dados_financeiros" in consultas and student_data["dados_financeiros"]:
+        extra_info += "\nDados financeiros:\n"
+        for dado in student_data["dados_financeiros"][:prompt_context.limit(3, max_rows)]:
+            extra_info += f"- Mensalidade R${dado.get('mensalidade')}, vencimento {dado.get('data_vencimento')}: {dado.get('status_pagamento_display')}\n"
+    if "frequencias" in consultas and student_data["frequencias"]:
+        extra_info += "\nFrequência:\n"
+        for frequencia in student_data["frequencias"][:prompt_context.limit(5, max_rows)]:
+            extra_info += f"- {frequencia.get('disciplina')} em {frequencia.get('data')}: {frequencia.get('status_display')}\n"
+    
     # Constrói o prompt completo
     prompt = f"""
     Você é um assistente acadêmico chamado UniChat que está ajudando {nome}.
@@ -266,7 +537,7 @@ def create_system_prompt(student_data: Dict[str, Any]) -> str:
     
     {notas_info}
     
-    {horarios_info}
+    {horarios_info}{extra_info}
     
     Seja cordial e direto nas respostas. Use as informações acima para contextualizar suas respostas.
     Se não tiver informações suficientes, peça mais detalhes ou sugira que o aluno entre em contato com a coordenação.
@@ -274,98 +545,680 @@ def create_system_prompt(student_data: Dict[str, Any]) -> str:
     
     return prompt
 
-async def generate_response(question: str, student_id: int, context_data: Optional[Dict[str, Any]] = None) -> str:
+def build_prompt(system_prompt: str, question: str) -> str:
+    """Monta o prompt no formato de chat do modelo Phi-3."""
+    return f"<|user|>\n{system_prompt.strip()}\n\nPergunta: {question}<|end|>\n<|assistant|>"
+
+def _generate_gguf(prompt: str, config: Dict[str, Any], cancel_token: Optional[CancelToken] = None,
+                   on_token: Optional[Callable[[str], None]] = None, grammar: Any = None,
+                   model: Any = None, token_logprobs: Optional[List[Optional[float]]] = None,
+                   kv_slot: Optional[KVSlot] = None, usage: Optional[Usage] = None,
+                   priority: str = INTERACTIVE) -> str:
     """
-    Gera uma resposta para a pergunta do aluno.
+    Gera a resposta com o modelo GGUF token a token, verificando o cancelamento
+    a cada token para liberar o slot assim que a requisição deixar de existir.
+    Cada trecho gerado é repassado a on_token, se informado; grammar restringe
+    a saída a uma gramática do llama.cpp. model substitui o modelo principal
+    (ex.: o modelo pequeno da cascata), e os log-probs dos tokens são
+    acrescentados a token_logprobs, se informado. kv_slot identifica a sessão
+    de chat cujo prefixo deve estar no cache KV do modelo principal. Os tokens
+    e o tempo com o slot ocupado são somados a usage, se informado (inclusive
+    quando a geração é cancelada). priority=BATCH cede o slot às requisições
+    interativas (pré-geração).
+    """
+    extra: Dict[str, Any] = {"grammar": grammar} if grammar is not None else {}
+    if token_logprobs is not None:
+        extra["logprobs"] = 1
+    with generation_slot.acquire(cancel_token, priority):
+        slot_started = time.perf_counter()
+        if model is None or model is llm_gguf:
+            if chat_session.switch_kv(llm_gguf, kv_slot):
+                metrics.increment("chat_kv_restored")
+        stream = (model or llm_gguf)(
+            prompt,
+            max_tokens=config.get("max_tokens", 500),
+            stop=["<|end|>"],
+            temperature=config.get("temperature", 0.7),
+            echo=False,
+            stream=True,
+            **extra
+        )
+        pieces = []
+        try:
+            for chunk in stream:
+                if cancel_token is not None and cancel_token.cancelled:
+                    metrics.increment("tokens_discarded", len(pieces))
+                    raise GenerationCancelled(cancel_token.reason)
+                text = chunk["choices"][0]["text"]
+                if token_logprobs is not None and chunk["choices"][0].get("logprobs"):
+                    token_logprobs.extend(chunk["choices"][0]["logprobs"]["token_logprobs"])
+                if text:
+                    pieces.append(text)
+                    if on_token is not None:
+                        on_token(text)
+        finally:
+            stream.close()
+            if usage is not None:
+                prompt_tokens = len((model or llm_gguf).tokenize(prompt.encode("utf-8")))
+                usage.add(prompt_tokens, len(pieces), time.perf_counter() - slot_started)
+    metrics.increment("tokens_generated", len(pieces))
+    return "".join(pieces)
+
+def _log_response(backend: str, student_id: int, response: str, started: float) -> None:
+    """Registra uma linha estruturada por resposta gerada."""
+    logger.info("Resposta gerada", extra={
+        "backend": backend,
+        "student_id": student_id,
+        "chars": len(response),
+        "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+    })
+
+def _count_cancellation(reason: str) -> None:
+    """Contabiliza uma geração cancelada nas métricas."""
+    metrics.increment("generation_cancelled")
+    metrics.increment(f"generation_cancelled_{reason}")
+
+def _generate_gpt4all(prompt: str, cancel_token: Optional[CancelToken] = None) -> str:
+    """Gera a resposta com GPT4All (não interrompível após o início)."""
+    with generation_slot.acquire(cancel_token):
+        return llm(prompt)
+
+async def _stream_gguf(prompt: str, config: Dict[str, Any], cancel_token: CancelToken,
+                       kv_slot: Optional[KVSlot] = None, usage: Optional[Usage] = None) -> AsyncIterator[str]:
+    """Executa _generate_gguf em uma thread e repassa os tokens ao event loop."""
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    done = object()
+    
+    def on_token(text: str) -> None:
+        loop.call_soon_threadsafe(queue.put_nowait, text)
+    
+    future = loop.run_in_executor(None, lambda: _generate_gguf(prompt, config, cancel_token, on_token,
+                                                                   kv_slot=kv_slot, usage=usage))
+    future.add_done_callback(lambda _: queue.put_nowait(done))
+    try:
+        while True:
+            item = await queue.get()
+            if item is done:
+                break
+            yield item
+    finally:
+        if not future.done():
+            # O consumidor desistiu do stream: interrompe a geração no próximo token
+            cancel_token.cancel("disconnect")
+            _count_cancellation("disconnect")
+            # Recupera a exceção da thread quando ela terminar (evita aviso do asyncio)
+            future.add_done_callback(lambda f: f.exception())
+    future.result()
+
+def get_structured_grammar() -> Any:
+    """Gramática do modo estruturado, compilada na primeira utilização."""
+    global structured_grammar
+    if structured_grammar is None:
+        if isinstance(llm_gguf, FakeLlama):
+            structured_grammar = structured.GRAMMAR
+        else:
+            structured_grammar = llama_cpp.LlamaGrammar.from_string(structured.GRAMMAR, verbose=False)
+    return structured_grammar
+
+async def _structured_gguf(question: str, student_data: Dict[str, Any], config: Dict[str, Any],
+                           cancel_token: CancelToken, usage: Optional[Usage] = None) -> Optional[str]:
+    """
+    Gera a resposta no modo estruturado: o modelo emite o JSON restrito pela
+    gramática e a resposta é montada pelo template. Retorna None se o JSON
+    não puder ser interpretado.
+    """
+    prompt = structured.build_structured_prompt(student_data, question)
+    config = {**config, "max_tokens": structured_max_tokens}
+    loop = asyncio.get_running_loop()
+    text = await loop.run_in_executor(None, lambda: _generate_gguf(
+        prompt, config, cancel_token, grammar=get_structured_grammar(), usage=usage))
+    answer, unknown = structured.parse_structured(text, student_data)
+    if answer is None:
+        logger.warning("JSON estruturado inválido: %.200s", text)
+        metrics.increment("structured_invalid")
+        return None
+    if unknown:
+        logger.warning("Registros inexistentes citados pelo modelo: %s", unknown)
+        metrics.increment("structured_unknown_records", len(unknown))
+    metrics.increment("structured_answers")
+    return structured.render_answer(answer, student_data)
+
+async def _cascade_small(prompt: str, config: Dict[str, Any], cancel_token: CancelToken,
+                         usage: Optional[Usage] = None) -> Optional[str]:
+    """
+    Gera a resposta com o modelo pequeno da cascata. Retorna None quando a
+    resposta deve ser repassada ao modelo principal (baixa confiança, recusa
+    ou números que não constam nos dados do aluno).
+    """
+    token_logprobs: List[Optional[float]] = []
+    loop = asyncio.get_running_loop()
+    text = await loop.run_in_executor(None, lambda: _generate_gguf(
+        prompt, config, cancel_token, model=llm_small, token_logprobs=token_logprobs, usage=usage))
+    reason = cascade.escalation_reason(text, token_logprobs, prompt, cascade_min_logprob)
+    if reason is not None:
+        if request_sampled():
+            logger.debug("Cascata: repassando ao modelo principal (%s, logprob médio %s)",
+                         reason, cascade.mean_logprob(token_logprobs))
+        metrics.increment("cascade_escalations")
+        metrics.increment(f"cascade_escalated_{reason}")
+        return None
+    metrics.increment("cascade_small_answers")
+    return text.strip()
+
+def coalesce_key(question: str, student_id: int, context_data: Optional[Dict[str, Any]],
+                 mode: Optional[str]) -> tuple:
+    """Chave das consultas equivalentes: aluno, pergunta normalizada, modo e contexto."""
+    normalized = " ".join(question.lower().split()).rstrip("?!. ")
+    context = json.dumps(context_data, sort_keys=True, default=str) if context_data else None
+    return (student_id, normalized, mode or output_mode, context)
+
+async def stream_response(question: str, student_id: int, context_data: Optional[Dict[str, Any]] = None,
+                          cancel_token: Optional[CancelToken] = None,
+                          mode: Optional[str] = None) -> AsyncIterator[str]:
+    """
+    Gera a resposta para a pergunta do aluno em trechos, à medida que são produzidos.
+    
+    Com o modelo GGUF, cada token é entregue assim que gerado; com GPT4All ou
+    simulação, a resposta completa é entregue em um único trecho. No modo
+    "structured" (GGUF), a resposta montada pelo template é entregue de uma vez,
+    assim como a resposta aceita do modelo pequeno da cascata.
+    
+    Consultas idênticas simultâneas (mesmo aluno, pergunta normalizada e modo)
+    compartilham uma única geração; a geração só é interrompida quando todos
+    os participantes desistem.
     
     Args:
         question: A pergunta feita pelo aluno.
         student_id: O ID do aluno para contextualizar a resposta.
         context_data: Dados de contexto adicionais (opcional).
+        cancel_token: Token de cancelamento da requisição (opcional).
+        mode: "prose" ou "structured" (padrão: LLM_OUTPUT_MODE).
         
-    Returns:
-        A resposta gerada pelo LLM.
+    Yields:
+        Trechos da resposta gerada.
+        
+    Raises:
+        GenerationCancelled: Se o cliente desconectar ou o prazo expirar.
+        QuotaExceeded: Se o aluno estiver bloqueado pela cota de uso.
+    """
+    if not coalesce_enabled:
+        async with aclosing(_stream_response(question, student_id, context_data, cancel_token, mode)) as pieces:
+            async for piece in pieces:
+                yield piece
+        return
+    
+    def factory(token: CancelToken) -> AsyncIterator[str]:
+        return _stream_response(question, student_id, context_data, token, mode)
+    
+    key = coalesce_key(question, student_id, context_data, mode)
+    async with aclosing(generation_flights.subscribe(key, factory, cancel_token)) as pieces:
+        async for piece in pieces:
+            yield piece
+
+async def _stream_response(question: str, student_id: int, context_data: Optional[Dict[str, Any]] = None,
+                           cancel_token: Optional[CancelToken] = None,
+                           mode: Optional[str] = None) -> AsyncIterator[str]:
+    """Gera a resposta da consulta (sem agrupamento) e contabiliza o uso do aluno; ver stream_response."""
+    usage = Usage()
+    try:
+        async with aclosing(_stream_answer(question, student_id, context_data, cancel_token, mode, usage)) as pieces:
+            async for piece in pieces:
+                yield piece
+    finally:
+        quota_tracker.record(student_id, usage)
+
+def apply_load_profile(config: Dict[str, Any], profile: Dict[str, Any]) -> Dict[str, Any]:
+    """Configuração de geração com o teto de tokens e a temperatura do perfil de carga."""
+    config = {**config, "temperature": profile["temperature"]}
+    if profile["max_tokens"] is not None:
+        config["max_tokens"] = min(config.get("max_tokens", 500), profile["max_tokens"])
+    return config
+
+def check_quota(student_id: int) -> str:
     """
-    logger.info(f"Gerando resposta para pergunta: '{question}' do aluno ID: {student_id}")
+    Decisão da cota para a próxima consulta do aluno ("ok", "reduzida" ou "regras").
+    
+    Raises:
+        QuotaExceeded: Se o aluno estiver bloqueado.
+    """
+    decision = quota_tracker.check(student_id)
+    if decision != "ok":
+        metrics.increment(f"quota_{decision}")
+    if decision == "bloqueada":
+        raise QuotaExceeded(student_id, quota_tracker.retry_after(student_id))
+    return decision
+
+async def _stream_answer(question: str, student_id: int, context_data: Optional[Dict[str, Any]],
+                         cancel_token: Optional[CancelToken], mode: Optional[str], usage: Usage) -> AsyncIterator[str]:
+    started = time.perf_counter()
+    if cancel_token is None:
+        cancel_token = CancelToken()
+    if begin_request_logging(logger):
+        logger.debug("Gerando resposta para pergunta: '%s' do aluno ID: %s", question, student_id)
+    # Aluno bloqueado não chega a consultar o backend
+    decision = check_quota(student_id)
+    profile = load_governor.current()
+    
+    # Resposta pré-gerada (só em prosa): vale enquanto a versão dos dados do aluno e o formato do contexto
+    # forem os mesmos da geração. É servida em qualquer perfil de carga: custa menos que a resposta
+    # reduzida que o perfil atual geraria.
+    # Com LLM_PREGEN=1, toda consulta elegível conta um acerto (pregen_hits) ou uma falta (pregen_misses / pregen_outdated)
+    prefetched = None
+    pregen_eligible = pregen_enabled and not context_data and (mode or output_mode) == "prose"
+    if pregen_eligible and not pregen_store.has(student_id, question):
+        metrics.increment("pregen_misses")
+    elif pregen_eligible:
+        prefetched = await fetch_student_data(student_id)
+        prompt_variant = pregen.variant(prompt_context_format, PREGEN_PROFILE)
+        answer = (pregen_store.get(student_id, question, pregen.data_version(prefetched), prompt_variant)
+                  if prefetched else None)
+        if answer is not None:
+            metrics.increment("pregen_hits")
+            _log_response("pregen", student_id, answer, started)
+            yield answer
+            return
+        metrics.increment("pregen_outdated")
     
     # Busca dados do aluno (se não fornecidos no context_data)
-    student_data = context_data or await fetch_student_data(student_id)
+    if context_data:
+        student_data = context_data
+    elif prefetched and fetch_mode != "tools":
+        student_data = prefetched
+    elif fetch_mode == "tools":
+        student_data = await fetch_question_data(question, student_id)
+    else:
+        student_data = await fetch_student_data(student_id)
     
     # Verifica se há dados do aluno
     if not student_data:
-        logger.warning(f"Nenhum dado encontrado para o aluno ID: {student_id}, usando simulação")
-    else:
-        logger.info(f"Dados do aluno recuperados: {list(student_data.keys())}")
+        logger.warning("Nenhum dado encontrado para o aluno ID: %s, usando simulação", student_id)
+    elif request_sampled():
+        logger.debug("Dados do aluno recuperados: %s", list(student_data.keys()))
     
     # Cria um prompt de sistema
-    system_prompt = create_system_prompt(student_data)
+    system_prompt = create_system_prompt(student_data, max_rows=profile["rows"])
+    
+    # Não inicia a geração se a requisição já foi cancelada durante a busca de dados
+    if cancel_token.cancelled:
+        _count_cancellation(cancel_token.reason)
+        raise GenerationCancelled(cancel_token.reason)
+    
+    if (decision == "regras" or profile["path"] == "regras") and (llm_gguf is not None or llm):
+        # Cota esgotada ou fila crítica: responde por regras, sem ocupar o modelo
+        yield simulate_response(question, student_data, prefixo="")
+        return
     
     # Se o modelo GGUF estiver disponível, use-o
     if llm_gguf is not None:
+        emitted = []
         try:
             # Obter configurações para a plataforma atual
-            config = get_model_config("gguf")
+            config = apply_load_profile(get_model_config("gguf"), profile)
+            if decision == "reduzida":
+                config = {**config, "max_tokens": min(config.get("max_tokens", 500), quota_tracker.reduced_max_tokens)}
             
-            # Formato do prompt para o modelo Phi-3
-            prompt = f"<|user|>\n{system_prompt.strip()}\n\nPergunta: {question}<|end|>\n<|assistant|>"
-            logger.info("Gerando resposta com modelo GGUF")
+            if ((mode or output_mode) == "structured" or profile["path"] == "estruturado") and student_data:
+                response = await _structured_gguf(question, student_data, config, cancel_token, usage)
+                if response is not None:
+                    _log_response("gguf_structured", student_id, response, started)
+                    yield response
+                    return
+                # JSON inválido: gera a resposta em prosa
             
-            # Gera a resposta usando as configurações da plataforma
-            output = llm_gguf(
-                prompt,
-                max_tokens=config.get("max_tokens", 500),
-                stop=["<|end|>"],
-                temperature=0.7,
-                echo=False
-            )
+            prompt = build_prompt(system_prompt, question)
             
-            # Extrai a resposta
-            response = output["choices"][0]["text"].strip()
+            if llm_small is not None:
+                # A resposta do modelo pequeno precisa ser avaliada inteira antes de ser entregue
+                response = await _cascade_small(prompt, config, cancel_token, usage)
+                if response:
+                    _log_response("gguf_small", student_id, response, started)
+                    yield response
+                    return
             
-            logger.info(f"Resposta gerada pelo modelo GGUF: {len(response)} caracteres")
+            if request_sampled():
+                logger.debug("Gerando resposta com modelo GGUF")
+            
+            # Gera a resposta em uma thread separada, usando as configurações da plataforma
+            async with aclosing(_stream_gguf(prompt, config, cancel_token, usage=usage)) as tokens:
+                async for piece in tokens:
+                    if not emitted:
+                        piece = piece.lstrip()
+                        if not piece:
+                            continue
+                    emitted.append(piece)
+                    yield piece
+            
+            _log_response("gguf", student_id, "".join(emitted), started)
             
             # Forçar limpeza de memória em plataformas sensíveis (Mac)
             if is_mac_m1:
                 gc.collect()
-                
-            return response
+            return
+        except GenerationCancelled as e:
+            logger.info("Geração cancelada (%s) para o aluno ID: %s", e.reason, student_id)
+            _count_cancellation(e.reason)
+            raise
         except Exception as e:
-            logger.error(f"Erro ao gerar resposta com modelo GGUF: {str(e)}")
+            logger.error("Erro ao gerar resposta com modelo GGUF: %s", e)
+            if emitted:
+                # Parte da resposta já foi entregue; não é possível trocar de modelo
+                raise
             # Fallback para o próximo método
     
     # Se o modelo GPT4All estiver disponível, use-o
     if llm:
+        response = None
         try:
             # Prepara o prompt completo para GPT4All
             prompt_template = f"{system_prompt}\n\nPergunta: {question}\n\nResposta:"
             
             # Gera a resposta usando o LLM real
-            logger.info("Gerando resposta com GPT4All")
-            response = llm(prompt_template)
-            logger.info(f"Resposta gerada pelo GPT4All: {len(response)} caracteres")
+            if request_sampled():
+                logger.debug("Gerando resposta com GPT4All")
+            loop = asyncio.get_running_loop()
+            generation_started = time.perf_counter()
+            response = await loop.run_in_executor(None, _generate_gpt4all, prompt_template, cancel_token)
+            # Sem tokenizer acessível: estimativa de ~4 caracteres por token
+            usage.add(len(prompt_template) // 4, len(response) // 4, time.perf_counter() - generation_started)
+            _log_response("gpt4all", student_id, response, started)
             
             # Forçar limpeza de memória em plataformas sensíveis (Mac)
             if is_mac_m1:
                 gc.collect()
-                
-            return response.strip()
+        except GenerationCancelled as e:
+            logger.info("Geração cancelada (%s) para o aluno ID: %s", e.reason, student_id)
+            _count_cancellation(e.reason)
+            raise
         except Exception as e:
-            logger.error(f"Erro ao gerar resposta com GPT4All: {str(e)}")
+            logger.error("Erro ao gerar resposta com GPT4All: %s", e)
             # Fallback para resposta simulada
             logger.info("Usando simulação como fallback")
-            return simulate_response(question, student_data)
+        if response is not None:
+            yield response.strip()
+        else:
+            yield simulate_response(question, student_data)
+        return
     
     # Usa uma resposta simulada se o LLM não estiver disponível
-    logger.info("LLM não disponível, usando simulação")
-    return simulate_response(question, student_data)
+    if request_sampled():
+        logger.debug("LLM não disponível, usando simulação")
+    yield simulate_response(question, student_data)
 
-def simulate_response(question: str, student_data: Dict[str, Any]) -> str:
+async def generate_response(question: str, student_id: int, context_data: Optional[Dict[str, Any]] = None,
+                            cancel_token: Optional[CancelToken] = None, mode: Optional[str] = None) -> str:
+    """
+    Gera uma resposta para a pergunta do aluno.
+    
+    Args:
+        question: A pergunta feita pelo aluno.
+        student_id: O ID do aluno para contextualizar a resposta.
+        context_data: Dados de contexto adicionais (opcional).
+        cancel_token: Token de cancelamento da requisição (opcional).
+        mode: "prose" ou "structured" (padrão: LLM_OUTPUT_MODE).
+        
+    Returns:
+        A resposta gerada pelo LLM.
+        
+    Raises:
+        GenerationCancelled: Se o cliente desconectar ou o prazo expirar.
+    """
+    pieces = [piece async for piece in stream_response(question, student_id, context_data, cancel_token, mode)]
+    return "".join(pieces).strip()
+
+async def open_chat_session(student_id: int) -> ChatSession:
+    """Abre uma sessão de chat: busca os dados do aluno e monta o prompt de sistema uma única vez."""
+    student_data = await fetch_student_data(student_id)
+    if not student_data:
+        logger.warning("Nenhum dado encontrado para o aluno ID: %s ao abrir a sessão de chat", student_id)
+    return ChatSession(student_id, student_data, create_system_prompt(student_data))
+
+async def stream_chat_turn(session: ChatSession, question: str,
+                           cancel_token: Optional[CancelToken] = None) -> AsyncIterator[str]:
+    """
+    Gera a resposta de um turno da sessão de chat, token a token.
+    
+    O prompt estende o do turno anterior, então só a pergunta nova passa pelo
+    prefill. Sem o modelo GGUF, responde como stream_response com os dados da
+    sessão (sem histórico).
+    
+    Raises:
+        GenerationCancelled: Se o cliente desconectar ou o prazo expirar.
+        QuotaExceeded: Se o aluno estiver bloqueado pela cota de uso.
+    """
+    started = time.perf_counter()
+    if cancel_token is None:
+        cancel_token = CancelToken()
+    metrics.increment("chat_turns")
+    if llm_gguf is None:
+        answer = []
+        async with aclosing(_stream_response(question, session.student_id, session.student_data or None,
+                                             cancel_token)) as pieces:
+            async for piece in pieces:
+                answer.append(piece)
+                yield piece
+        session.add_turn(question, "".join(answer))
+        return
+    
+    decision = check_quota(session.student_id)
+    profile = load_governor.current()
+    if decision == "regras" or profile["path"] == "regras":
+        # O turno respondido por regras não entra no histórico (o prefixo da sessão no cache KV é mantido)
+        answer = simulate_response(question, session.student_data, prefixo="")
+        quota_tracker.record(session.student_id, Usage())
+        yield answer
+        return
+    config = apply_load_profile(get_model_config("gguf"), profile)
+    if decision == "reduzida":
+        config = {**config, "max_tokens": min(config.get("max_tokens", 500), quota_tracker.reduced_max_tokens)}
+    # Reserva espaço para a resposta (~3 caracteres por token)
+    max_chars = (config.get("n_ctx", 4096) - config.get("max_tokens", 500)) * 3
+    prompt = session.build_prompt(question, max_chars)
+    raw = []
+    emitted = False
+    usage = Usage()
+    try:
+        async with aclosing(_stream_gguf(prompt, config, cancel_token, session.kv_slot, usage)) as tokens:
+            async for piece in tokens:
+                raw.append(piece)
+                if not emitted:
+                    piece = piece.lstrip()
+                if piece:
+                    emitted = True
+                    yield piece
+    except GenerationCancelled as e:
+        _count_cancellation(e.reason)
+        raise
+    finally:
+        quota_tracker.record(session.student_id, usage)
+    # Guarda o texto gerado sem alterações, para que o próximo prompt preserve o prefixo avaliado
+    session.add_turn(question, "".join(raw))
+    _log_response("gguf_chat", session.student_id, "".join(raw), started)
+
+async def flush_usage() -> int:
+    """
+    Envia ao backend o uso acumulado desde o último envio. Em caso de falha,
+    o uso volta ao acumulado para a próxima tentativa.
+    
+    Returns:
+        Número de registros enviados.
+    """
+    records = quota_tracker.take_pending()
+    if not records:
+        return 0
+    loop = asyncio.get_running_loop()
+    try:
+        response = await loop.run_in_executor(None, lambda: requests.post(
+            f"{backend_pool.primary}/uso-llm/registrar/", json=records, timeout=backend_timeout,
+            headers={'User-Agent': 'UniChat-LLM-Service'}))
+        response.raise_for_status()
+    except Exception as e:
+        logger.warning("Falha ao enviar o uso dos alunos ao backend: %s", e)
+        quota_tracker.restore_pending(records)
+        metrics.increment("quota_flush_failed")
+        return 0
+    metrics.increment("quota_flush_records", len(records))
+    return len(records)
+
+async def flush_usage_loop() -> None:
+    """Envia o uso ao backend a cada LLM_QUOTA_FLUSH_S segundos (0 desativa)."""
+    if quota_flush_s <= 0:
+        return
+    while True:
+        await asyncio.sleep(quota_flush_s)
+        await flush_usage()
+
+async def fetch_active_students() -> List[int]:
+    """IDs dos alunos que usaram o chat nos últimos LLM_PREGEN_ACTIVE_DAYS dias, dos mais ativos aos menos."""
+    try:
+        data = await backend_pool.get_json("/alunos/ativos/", {"dias": pregen_active_days, "limite": pregen_max_students},
+                                           {'Accept': 'application/json', 'User-Agent': 'UniChat-LLM-Service'},
+                                           backend_timeout)
+    except BackendError as e:
+        logger.error("Erro ao buscar os alunos ativos: %s", e)
+        return []
+    return [aluno["id"] for aluno in data or []]
+
+async def _wait_interactive_idle(until: Optional[float]) -> bool:
+    """Aguarda LLM_PREGEN_IDLE_S segundos sem requisições interativas; False se until chegar antes."""
+    idle_since = time.monotonic()
+    while True:
+        now = time.monotonic()
+        if generation_slot.interactive_busy:
+            idle_since = now
+        elif now - idle_since >= pregen_idle_s:
+            return True
+        if until is not None and now >= until:
+            return False
+        await asyncio.sleep(min(0.5, pregen_idle_s or 0.5))
+
+async def _pregenerate_answer(student_data: Dict[str, Any], question: str, until: Optional[float]) -> Optional[str]:
+    """Gera a resposta (perfil de carga PREGEN_PROFILE) com prioridade de lote; None se uma requisição interativa chegar no meio."""
+    profile = {"name": PREGEN_PROFILE, **LOAD_PROFILES[PREGEN_PROFILE]}
+    prompt = build_prompt(create_system_prompt(student_data, max_rows=profile["rows"]), question)
+    config = apply_load_profile(get_model_config("gguf"), profile)
+    cancel_token = CancelToken(deadline=until)
+    
+    async def yield_to_interactive():
+        while not cancel_token.cancelled:
+            if generation_slot.waiting:
+                cancel_token.cancel("preempted")
+            await asyncio.sleep(0.05)
+    
+    loop = asyncio.get_running_loop()
+    watcher = asyncio.ensure_future(yield_to_interactive())
+    try:
+        answer = await loop.run_in_executor(None, lambda: _generate_gguf(prompt, config, cancel_token, priority=BATCH))
+    except GenerationCancelled as e:
+        metrics.increment(f"pregen_cancelled_{e.reason}")
+        return None
+    finally:
+        watcher.cancel()
+    return answer.strip()
+
+async def pregenerate(until: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Gera as respostas das perguntas de LLM_PREGEN_QUESTIONS para os alunos ativos.
+    
+    As respostas valem no dia em que a janela termina (pregen.serving_day);
+    as já geradas para esse dia e para a versão atual dos dados do aluno são
+    mantidas. Sempre que houver requisições interativas, a pré-geração
+    espera LLM_PREGEN_IDLE_S segundos sem fila antes de continuar.
+    
+    Args:
+        until: Instante (time.monotonic) em que a execução deve parar (fim da janela).
+        
+    Returns:
+        Resumo da execução (status, alunos, respostas geradas, mantidas e com erro).
+    """
+    summary: Dict[str, Any] = {"status": "concluida", "started_at": datetime.datetime.now().isoformat(timespec="seconds"),
+                               "students": 0, "generated": 0, "kept": 0, "preempted": 0, "errors": 0}
+    if llm_gguf is None:
+        return {**summary, "status": "sem_modelo"}
+    day = pregen.serving_day(datetime.datetime.now(), pregen_window)
+    pregen_status["running"] = True
+    try:
+        pregen_store.prune()
+        students = await fetch_active_students()
+        summary["students"] = len(students)
+        for student_id in students:
+            if not await _pregenerate_student(student_id, day, until, summary):
+                summary["status"] = "janela_encerrada"
+                break
+        return summary
+    finally:
+        pregen_status["running"] = False
+        pregen_status["last"] = summary
+        logger.info("Pré-geração: %s", summary)
+
+async def _pregenerate_student(student_id: int, day: datetime.date, until: Optional[float],
+                               summary: Dict[str, Any]) -> bool:
+    """
+    Pré-gera as respostas de um aluno para o dia day, acumulando em summary. Falhas de um
+    aluno ou de uma pergunta são registradas e não interrompem o lote.
+    
+    Returns:
+        False se a janela terminou antes das respostas do aluno.
+    """
+    try:
+        student_data = await fetch_student_data(student_id)
+    except Exception as e:
+        logger.error("Pré-geração: erro ao buscar os dados do aluno %s: %s", student_id, e)
+        summary["errors"] += 1
+        return True
+    if not student_data:
+        return True
+    version = pregen.data_version(student_data)
+    prompt_variant = pregen.variant(prompt_context_format, PREGEN_PROFILE)
+    for question in pregen_questions:
+        if pregen_store.is_current(student_id, question, version, prompt_variant, day):
+            summary["kept"] += 1
+            continue
+        answer = None
+        while answer is None:
+            if ((generation_slot.interactive_busy and not await _wait_interactive_idle(until))
+                    or (until is not None and time.monotonic() >= until)):
+                return False
+            try:
+                answer = await _pregenerate_answer(student_data, question, until)
+            except Exception as e:
+                logger.error("Pré-geração: erro na pergunta '%s' do aluno %s: %s", question, student_id, e)
+                summary["errors"] += 1
+                metrics.increment("pregen_errors")
+                break
+            if answer is None:
+                summary["preempted"] += 1
+        if answer is not None:
+            pregen_store.put(student_id, question, version, answer, prompt_variant, day)
+            summary["generated"] += 1
+            metrics.increment("pregen_generated")
+    return True
+
+async def pregen_loop() -> None:
+    """Executa a pré-geração uma vez por janela LLM_PREGEN_WINDOW (LLM_PREGEN=1 ativa)."""
+    if not pregen_enabled:
+        return
+    start, end = pregen_window
+    while True:
+        now = datetime.datetime.now()
+        if not pregen.in_window(now, pregen_window):
+            await asyncio.sleep(pregen.seconds_until(now, start))
+            continue
+        try:
+            await pregenerate(time.monotonic() + pregen.seconds_until(now, end))
+        except Exception as e:
+            logger.error("Erro na pré-geração: %s", e)
+        # Uma execução por janela: aguarda a janela terminar
+        await asyncio.sleep(pregen.seconds_until(datetime.datetime.now(), end) + 1)
+
+def simulate_response(question: str, student_data: Dict[str, Any], prefixo: str = "[SIMULAÇÃO] ") -> str:
     """
     Gera uma resposta simulada quando o LLM não está disponível.
     
     Args:
         question: A pergunta feita pelo aluno.
         student_data: Dados do aluno para contextualizar a resposta.
+        prefixo: Prefixo das respostas (vazio quando as regras substituem o modelo por cota).
         
     Returns:
         Uma resposta simulada baseada em regras.
@@ -373,10 +1226,8 @@ def simulate_response(question: str, student_data: Dict[str, Any]) -> str:
     question_lower = question.lower()
     nome = student_data.get("nome", "Aluno") if student_data else "Aluno"
     
-    logger.info(f"Gerando resposta simulada para '{question_lower}' para o aluno {nome}")
-    
-    # Prefixo para respostas simuladas
-    prefixo = "[SIMULAÇÃO] "
+    if request_sampled():
+        logger.debug("Gerando resposta simulada para '%s' para o aluno %s", question_lower, nome)
     
     # Responde com base em palavras-chave na pergunta
     if "nota" in question_lower or "avaliação" in question_lower or "prova" in question_lower:
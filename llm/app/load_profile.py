@@ -0,0 +1,87 @@
+"""
+Perfil de geração adaptado à carga.
+
+Conforme a fila de gerações (requisições aguardando o slot do modelo)
+cresce, o serviço passa para perfis mais baratos: menos tokens de saída,
+temperatura menor, menos registros do aluno no prompt e, nos níveis mais
+altos, o modo estruturado (JSON curto + template) e por fim as respostas por
+regras, sem o modelo. O perfil sobe assim que a fila atinge o limite do
+nível e desce um nível por vez, depois que a fila fica abaixo do limite por
+LLM_LOAD_RECOVER_S segundos (evita oscilar a cada requisição).
+
+Limites da fila por nível em LLM_LOAD_THRESHOLDS (padrão "2,4,8": ocupado a
+partir de 2 requisições na fila, sobrecarga a partir de 4, crítico a partir
+de 8). LLM_LOAD_ADAPTIVE=0 mantém sempre o perfil normal.
+"""
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from . import metrics
+
+# max_tokens: teto de tokens gerados (None = o da plataforma); rows: registros por seção no prompt;
+# path: "modelo", "estruturado" (JSON curto + template) ou "regras" (sem o modelo)
+PROFILES: Dict[str, Dict[str, Any]] = {
+    "normal": {"max_tokens": None, "temperature": 0.7, "rows": 5, "path": "modelo"},
+    "ocupado": {"max_tokens": 256, "temperature": 0.5, "rows": 4, "path": "modelo"},
+    "sobrecarga": {"max_tokens": 128, "temperature": 0.3, "rows": 3, "path": "estruturado"},
+    "critico": {"max_tokens": 64, "temperature": 0.2, "rows": 2, "path": "regras"},
+}
+LEVELS = list(PROFILES)
+
+class LoadGovernor:
+    """Escolhe o perfil de geração a partir da profundidade da fila, com histerese na descida."""
+
+    def __init__(self, depth: Callable[[], int], thresholds: List[int], recover_s: float = 5.0,
+                 enabled: bool = True):
+        if len(thresholds) != len(LEVELS) - 1:
+            raise ValueError(f"Informe {len(LEVELS) - 1} limites de fila (um por nível acima do normal)")
+        self.depth = depth
+        self.thresholds = thresholds
+        self.recover_s = recover_s
+        self.enabled = enabled
+        self.level = 0
+        self._below_since: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, depth: Callable[[], int]) -> "LoadGovernor":
+        thresholds = [int(t) for t in os.getenv("LLM_LOAD_THRESHOLDS", "2,4,8").split(",")]
+        return cls(depth, thresholds, float(os.getenv("LLM_LOAD_RECOVER_S", "5")),
+                   os.getenv("LLM_LOAD_ADAPTIVE", "1") == "1")
+
+    def update(self, now: Optional[float] = None) -> str:
+        """Reavalia o nível pela fila atual e retorna o nome do perfil ativo."""
+        if not self.enabled:
+            return LEVELS[0]
+        now = time.monotonic() if now is None else now
+        target = sum(1 for limit in self.thresholds if self.depth() >= limit)
+        with self._lock:
+            if target > self.level:
+                self._change(target)
+            elif target < self.level:
+                if self._below_since is None:
+                    self._below_since = now
+                elif now - self._below_since >= self.recover_s:
+                    self._change(self.level - 1)
+                    # O próximo degrau de descida espera outro período completo
+                    self._below_since = now
+            else:
+                self._below_since = None
+            return LEVELS[self.level]
+
+    @property
+    def active(self) -> str:
+        """Nome do perfil ativo, sem reavaliar a fila (leitura para as métricas)."""
+        return LEVELS[self.level] if self.enabled else LEVELS[0]
+
+    def _change(self, level: int) -> None:
+        self.level = level
+        self._below_since = None
+        metrics.increment(f"load_profile_{LEVELS[level]}")
+
+    def current(self) -> Dict[str, Any]:
+        """Perfil ativo (reavaliado agora), com o nome em "name"."""
+        name = self.update()
+        return {"name": name, **PROFILES[name]}
@@ -0,0 +1,96 @@
+"""
+Configuração de logging do serviço LLM.
+
+Os registros são colocados em uma fila na thread da requisição e escritos
+(stdout e arquivo rotativo) por uma thread separada (QueueListener), com
+formato JSON estruturado. Linhas de depuração por requisição são amostradas.
+
+Variáveis de ambiente:
+    LLM_LOG_LEVEL: Nível mínimo dos logs (padrão: INFO).
+    LLM_LOG_FORMAT: "json" (padrão) ou "text".
+    LLM_LOG_FILE: Arquivo de log rotativo (padrão: llm_service.log; vazio desativa).
+    LLM_LOG_SAMPLE_RATE: Fração das requisições com logs de depuração (padrão: 0.1).
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Optional
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Atributos padrão do LogRecord; o restante vem de extra= e vira campo no JSON
+_RESERVED_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_listener: Optional[QueueListener] = None
+_sample_rate = 1.0
+# Indica se a requisição em andamento foi sorteada para logs de depuração
+_request_sampled: ContextVar[bool] = ContextVar("llm_request_sampled", default=False)
+
+class JsonFormatter(logging.Formatter):
+    """Formata cada registro como uma linha JSON, incluindo os campos de extra=."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+def setup_logging() -> None:
+    """Configura o logging assíncrono. Chamadas repetidas não têm efeito."""
+    global _listener, _sample_rate
+    if _listener is not None:
+        return
+
+    level = os.getenv("LLM_LOG_LEVEL", "INFO").upper()
+    log_format = os.getenv("LLM_LOG_FORMAT", "json").lower()
+    log_file = os.getenv("LLM_LOG_FILE", "llm_service.log")
+    _sample_rate = float(os.getenv("LLM_LOG_SAMPLE_RATE", "0.1"))
+
+    formatter = JsonFormatter() if log_format == "json" else logging.Formatter(LOG_FORMAT)
+    handlers = [logging.StreamHandler()]
+    if log_file:
+        try:
+            handlers.append(RotatingFileHandler(log_file, maxBytes=1024*1024*5, backupCount=3))
+        except OSError:
+            # Sem permissão de escrita: mantém apenas a saída padrão
+            pass
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.handlers = [QueueHandler(log_queue)]
+    root.setLevel(level)
+
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+def begin_request_logging(logger: logging.Logger) -> bool:
+    """
+    Decide, uma vez por requisição, se as linhas de depuração dela serão registradas.
+
+    Não sorteia quando o nível DEBUG não está habilitado, então nenhuma
+    mensagem de depuração é montada nesse caso. O resultado fica disponível
+    para o restante da requisição via request_sampled().
+    """
+    sampled = logger.isEnabledFor(logging.DEBUG) and random.random() < _sample_rate
+    _request_sampled.set(sampled)
+    return sampled
+
+def request_sampled() -> bool:
+    """Indica se a requisição atual foi sorteada para logs de depuração."""
+    return _request_sampled.get()
@@ -1,11 +1,44 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Header, Request, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 import os
+import time
+import asyncio
+import hmac
+import json
+import logging
 import requests
 from typing import Dict, List, Optional, Any
-from .llm_service import generate_response, setup_llm
-from .models import QueryRequest, QueryResponse, HealthCheckResponse
+from .llm_service import (generate_response, stream_response, setup_llm, open_chat_session, stream_chat_turn,
+                          flush_usage, flush_usage_loop, quota_tracker, load_governor, pregenerate, pregen_loop,
+                          pregen_enabled, pregen_status)
+from .models import QueryRequest, QueryResponse, JobResponse, HealthCheckResponse
+from .scheduler import CancelToken, GenerationCancelled
+from .jobs import JobConflict, JobStore
+from .quota import QuotaExceeded
+from . import metrics, profiler
+
+logger = logging.getLogger(__name__)
+
+# Prazo máximo de uma consulta no servidor (o frontend desiste após 30 s)
+REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", "30"))
+# Intervalo de verificação de desconexão do cliente
+DISCONNECT_POLL_INTERVAL = 0.25
+# Token dos endpoints administrativos (vazio desativa os endpoints)
+ADMIN_TOKEN = os.getenv("LLM_ADMIN_TOKEN", "")
+# Jobs: prazo máximo da geração e tempo (s) que o resultado fica disponível após terminar
+JOB_TIMEOUT = float(os.getenv("LLM_JOB_TIMEOUT", "600"))
+JOB_TTL = float(os.getenv("LLM_JOB_TTL", "300"))
+# Cabeçalho com o perfil de geração escolhido pela carga (ver load_profile)
+PROFILE_HEADER = "X-UniChat-Profile"
+
+jobs = JobStore(stream_response, ttl=JOB_TTL, timeout=JOB_TIMEOUT)
+metrics.register_gauge("jobs_active", lambda: jobs.active)
+# Máximo de sessões de chat (WebSocket) simultâneas; cada uma pode fixar um estado do cache KV
+CHAT_MAX_SESSIONS = int(os.getenv("LLM_CHAT_MAX_SESSIONS", "32"))
+chat_sessions = 0
+metrics.register_gauge("chat_sessions", lambda: chat_sessions)
 
 # Inicializa a aplicação FastAPI
 app = FastAPI(
@@ -35,30 +68,304 @@ def read_root():
     """Retorna informações básicas sobre o serviço."""
     return {"status": "ok", "message": "UniChat LLM Service is running"}
 
+# Endpoint de métricas
+@app.get("/metrics")
+def get_metrics():
+    """Retorna os contadores e gauges do serviço."""
+    return metrics.snapshot()
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Exige o cabeçalho X-Admin-Token igual a LLM_ADMIN_TOKEN."""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Token administrativo inválido")
+
+# Endpoint de profiling sob demanda
+@app.get("/admin/profile", response_class=PlainTextResponse, dependencies=[Depends(require_admin)])
+async def get_profile(seconds: float = 10.0, rate: int = 100, native: bool = False, idle: bool = False):
+    """
+    Amostra as pilhas do processo por alguns segundos e retorna um arquivo
+    collapsed (flamegraph.pl, speedscope). native=true usa o py-spy, quando
+    disponível, para incluir frames nativos.
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        collapsed = await loop.run_in_executor(None, profiler.profile, seconds, rate, native, idle)
+    except profiler.ProfilerBusy:
+        raise HTTPException(status_code=409, detail="Já existe um perfil em andamento")
+    filename = f"llm-profile-{time.strftime('%Y%m%d-%H%M%S')}.folded"
+    return PlainTextResponse(collapsed, headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+# Uso do aluno na janela atual e decisão da cota para a próxima consulta
+@app.get("/admin/quota/{student_id}", dependencies=[Depends(require_admin)])
+def get_quota(student_id: int):
+    """Retorna o uso do aluno na janela de cota e o caminho da próxima consulta."""
+    return {"student_id": student_id, "window_s": quota_tracker.window_s,
+            "usage": quota_tracker.usage(student_id), "decision": quota_tracker.check(student_id)}
+
+@app.delete("/admin/quota/{student_id}", dependencies=[Depends(require_admin)])
+def reset_quota(student_id: int):
+    """Zera o uso do aluno na janela de cota (a próxima consulta volta ao caminho normal)."""
+    metrics.increment("quota_resets")
+    return {"student_id": student_id, "reset": quota_tracker.reset(student_id),
+            "decision": quota_tracker.check(student_id)}
+
+@app.get("/admin/pregen", dependencies=[Depends(require_admin)])
+def get_pregen():
+    """Retorna se a pré-geração está em andamento e o resumo da última execução."""
+    return pregen_status
+
+@app.post("/admin/pregen", status_code=202, dependencies=[Depends(require_admin)])
+async def start_pregen():
+    """Inicia a pré-geração agora, fora da janela (sem prazo; ainda cede às requisições interativas)."""
+    if not pregen_enabled:
+        raise HTTPException(status_code=409, detail="Pré-geração desativada (LLM_PREGEN=0)")
+    if pregen_status["running"]:
+        raise HTTPException(status_code=409, detail="Pré-geração já em andamento")
+    asyncio.ensure_future(pregenerate())
+    # Deixa a tarefa marcar "running" antes de responder
+    await asyncio.sleep(0)
+    return {"started": True}
+
+async def wait_generation(task: asyncio.Future, http_request: Request, cancel_token: CancelToken):
+    """
+    Aguarda a geração, cancelando-a se o cliente desconectar ou o prazo expirar.
+    
+    O cancelamento é cooperativo: a thread de geração para no próximo token e
+    libera o slot do modelo; por isso continuamos aguardando a tarefa terminar.
+    """
+    while True:
+        done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+        if done:
+            return task.result()
+        if not cancel_token.cancelled and await http_request.is_disconnected():
+            cancel_token.cancel("disconnect")
+
 # Endpoint para processar consultas
 @app.post("/api/query", response_model=QueryResponse)
-async def process_query(request: QueryRequest):
+async def process_query(request: QueryRequest, http_request: Request, response: Response):
     """
     Processa uma consulta do usuário.
     
     Esta função recebe uma pergunta e um ID de aluno, busca dados relevantes
-    do backend e gera uma resposta contextualizada usando o LLM.
+    do backend e gera uma resposta contextualizada usando o LLM. A geração é
+    interrompida se o cliente desconectar ou se LLM_REQUEST_TIMEOUT expirar.
+    O perfil de carga ativo na chegada da consulta vai em X-UniChat-Profile.
     """
+    metrics.increment("requests_total")
+    response.headers[PROFILE_HEADER] = load_governor.update()
+    cancel_token = CancelToken(deadline=time.monotonic() + REQUEST_TIMEOUT)
     try:
         # Gera a resposta usando o serviço LLM
-        answer = await generate_response(request.question, request.student_id, request.context_data)
+        task = asyncio.ensure_future(
+            generate_response(request.question, request.student_id, request.context_data,
+                              cancel_token=cancel_token, mode=request.mode)
+        )
+        answer = await wait_generation(task, http_request, cancel_token)
         return QueryResponse(answer=answer)
+    except QuotaExceeded as e:
+        raise HTTPException(status_code=429, detail="Cota de uso excedida",
+                            headers={"Retry-After": str(int(e.retry_after))})
+    except GenerationCancelled as e:
+        logger.info("Consulta cancelada: %s", e.reason)
+        if e.reason == "deadline":
+            raise HTTPException(status_code=504, detail="Tempo limite para gerar a resposta excedido")
+        # 499: cliente encerrou a conexão (ninguém vai ler esta resposta)
+        raise HTTPException(status_code=499, detail="Cliente desconectado")
     except Exception as e:
         # Loga o erro e retorna uma resposta de erro
-        print(f"Erro ao processar consulta: {str(e)}")
+        logger.exception("Erro ao processar consulta: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
+def sse_event(data: Dict[str, Any]) -> str:
+    """Formata um evento Server-Sent Events."""
+    return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+# Endpoint para processar consultas com streaming da resposta
+@app.post("/api/query/stream")
+async def process_query_stream(request: QueryRequest):
+    """
+    Processa uma consulta do usuário, enviando a resposta token a token (SSE).
+    
+    Cada evento traz {"token": "..."}; o último traz {"done": true} ou
+    {"error": "...", "reason": "..."}. Se o cliente desconectar, o Starlette
+    encerra o gerador e a geração é interrompida no próximo token.
+    """
+    metrics.increment("requests_total")
+    metrics.increment("requests_stream")
+    profile = load_governor.update()
+    cancel_token = CancelToken(deadline=time.monotonic() + REQUEST_TIMEOUT)
+    
+    async def events():
+        try:
+            async for piece in stream_response(request.question, request.student_id, request.context_data,
+                                               cancel_token=cancel_token, mode=request.mode):
+                yield sse_event({"token": piece})
+            yield sse_event({"done": True})
+        except QuotaExceeded as e:
+            yield sse_event({"error": "Cota de uso excedida", "reason": "quota", "retry_after": int(e.retry_after)})
+        except GenerationCancelled as e:
+            logger.info("Consulta cancelada: %s", e.reason)
+            yield sse_event({"error": "Geração cancelada", "reason": e.reason})
+        except Exception as e:
+            logger.exception("Erro ao processar consulta: %s", e)
+            yield sse_event({"error": str(e)})
+    
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", PROFILE_HEADER: profile})
+
+# Consultas assíncronas (jobs)
+@app.post("/api/jobs", response_model=JobResponse, status_code=202)
+async def submit_job(request: QueryRequest, response: Response,
+                     idempotency_key: Optional[str] = Header(None)):
+    """
+    Cria um job para a consulta e retorna imediatamente o seu id.
+    
+    Com o cabeçalho Idempotency-Key, uma nova tentativa com a mesma chave (para
+    o mesmo aluno) retorna o job em andamento ou concluído, sem gerar de novo.
+    """
+    metrics.increment("requests_total")
+    response.headers[PROFILE_HEADER] = load_governor.update()
+    try:
+        job, created = jobs.submit(request.model_dump(), idempotency_key)
+    except JobConflict:
+        raise HTTPException(status_code=409, detail="Idempotency-Key já usada com outra consulta")
+    if not created:
+        response.status_code = 200
+    return JobResponse(**job.to_dict())
+
+def get_job_or_404(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job não encontrado ou expirado")
+    return job
+
+@app.get("/api/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str):
+    """Retorna o estado do job e a resposta (completa ou parcial)."""
+    return JobResponse(**get_job_or_404(job_id).to_dict())
+
+@app.get("/api/jobs/{job_id}/stream")
+async def stream_job(job_id: str):
+    """
+    Acompanha o job por SSE, no mesmo formato de /api/query/stream: os trechos
+    já gerados são reenviados e os seguintes chegam à medida que são gerados.
+    Desconectar não cancela o job.
+    """
+    job = get_job_or_404(job_id)
+    
+    async def events():
+        async for piece in jobs.follow(job):
+            yield sse_event({"token": piece})
+        if job.status == "done":
+            yield sse_event({"done": True})
+        elif job.status == "cancelled":
+            yield sse_event({"error": "Geração cancelada", "reason": job.error})
+        else:
+            yield sse_event({"error": job.error})
+    
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.delete("/api/jobs/{job_id}", response_model=JobResponse)
+async def cancel_job(job_id: str):
+    """Cancela o job; a geração é interrompida no próximo token."""
+    job = jobs.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job não encontrado ou expirado")
+    return JobResponse(**job.to_dict())
+
+# Chat por WebSocket com estado por conexão
+@app.websocket("/ws/chat")
+async def chat_socket(websocket: WebSocket, student_id: int):
+    """
+    Sessão de chat: os dados do aluno são buscados uma vez por conexão e cada
+    turno estende o prompt do anterior (só a pergunta nova passa pelo prefill).
+    
+    O cliente envia {"question": "..."}; a resposta chega como {"token": "..."}
+    seguidos de {"done": true} ou {"error": "...", "reason": "..."}, no formato
+    do /api/query/stream. {"cancel": true} interrompe o turno em andamento.
+    """
+    global chat_sessions
+    await websocket.accept()
+    if chat_sessions >= CHAT_MAX_SESSIONS:
+        await websocket.close(code=1013, reason="Limite de sessões atingido")
+        return
+    # A vaga é reservada antes de abrir a sessão (a busca dos dados cede o loop a outras conexões)
+    chat_sessions += 1
+    session = None
+    try:
+        try:
+            session = await open_chat_session(student_id)
+        except Exception as e:
+            logger.exception("Erro ao abrir a sessão de chat do aluno %s: %s", student_id, e)
+            await websocket.close(code=1011, reason="Erro ao abrir a sessão")
+            return
+        metrics.increment("chat_sessions_opened")
+        await websocket.send_json({"ready": True, "student_id": student_id})
+        while True:
+            message = await websocket.receive_json()
+            question = (message.get("question") or "").strip() if isinstance(message, dict) else ""
+            if not question:
+                await websocket.send_json({"error": "Mensagem sem pergunta"})
+                continue
+            await chat_turn(websocket, session, question)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        if session is not None:
+            session.close()
+        chat_sessions -= 1
+
+async def chat_turn(websocket: WebSocket, session, question: str):
+    """Gera um turno, atendendo a pedidos de cancelamento e à desconexão durante a geração."""
+    cancel_token = CancelToken(deadline=time.monotonic() + REQUEST_TIMEOUT)
+    
+    async def watch_client():
+        # Durante a geração, só {"cancel": true} é aceito; a desconexão também cancela
+        while True:
+            try:
+                message = await websocket.receive_json()
+            except WebSocketDisconnect:
+                cancel_token.cancel("disconnect")
+                raise
+            if isinstance(message, dict) and message.get("cancel"):
+                cancel_token.cancel("client_cancel")
+                return
+            await websocket.send_json({"error": "Aguarde o fim da resposta em andamento"})
+    
+    watcher = asyncio.ensure_future(watch_client())
+    try:
+        async for piece in stream_chat_turn(session, question, cancel_token):
+            await websocket.send_json({"token": piece})
+        await websocket.send_json({"done": True})
+    except QuotaExceeded as e:
+        await websocket.send_json({"error": "Cota de uso excedida", "reason": "quota", "retry_after": int(e.retry_after)})
+    except GenerationCancelled as e:
+        if e.reason == "disconnect":
+            raise WebSocketDisconnect()
+        await websocket.send_json({"error": "Geração cancelada", "reason": e.reason})
+    except Exception as e:
+        logger.exception("Erro no chat: %s", e)
+        await websocket.send_json({"error": str(e)})
+    finally:
+        watcher.cancel()
+        # Recupera a exceção do watcher (desconexão) para evitar aviso do asyncio
+        watcher.add_done_callback(lambda t: t.cancelled() or t.exception())
+
 # Inicialização do LLM ao iniciar o aplicativo
 @app.on_event("startup")
 async def startup_event():
     """Inicializa o modelo LLM quando o serviço é iniciado."""
     try:
         setup_llm()
-        print("LLM inicializado com sucesso!")
+        logger.info("LLM inicializado com sucesso!")
     except Exception as e:
-        print(f"Erro ao inicializar LLM: {str(e)}")
+        logger.exception("Erro ao inicializar LLM: %s", e)
+    asyncio.ensure_future(flush_usage_loop())
+    asyncio.ensure_future(pregen_loop())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Envia ao backend o uso ainda não registrado."""
+    await flush_usage()
@@ -0,0 +1,38 @@
+"""
+Métricas simples em memória para o serviço LLM.
+Contadores e gauges são expostos pelo endpoint /metrics em formato JSON.
+"""
+import threading
+from collections import defaultdict
+from typing import Any, Callable, Dict
+
+_lock = threading.Lock()
+_counters: Dict[str, float] = defaultdict(float)
+_gauges: Dict[str, Callable[[], Any]] = {}
+
+def increment(name: str, value: float = 1) -> None:
+    """Incrementa um contador."""
+    with _lock:
+        _counters[name] += value
+
+def register_gauge(name: str, getter: Callable[[], Any]) -> None:
+    """Registra uma função que retorna o valor atual de um gauge."""
+    with _lock:
+        _gauges[name] = getter
+
+def set_gauge(name: str, value: Any) -> None:
+    """Define um gauge com valor fixo."""
+    register_gauge(name, lambda: value)
+
+def snapshot() -> Dict[str, Dict[str, Any]]:
+    """Retorna uma cópia dos contadores e o valor atual dos gauges."""
+    with _lock:
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+    values = {}
+    for name, getter in gauges.items():
+        try:
+            values[name] = getter()
+        except Exception:
+            values[name] = None
+    return {"counters": counters, "gauges": values}
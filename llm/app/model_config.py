@@ -0,0 +1,12 @@
+"""
+Arquivo do modelo principal e origem do download.
+
+Separado de llm_service para que ferramentas como app.model_download leiam
+os padrões sem carregar o serviço. Os padrões apontam para o mesmo artefato
+(Phi-3 mini em GGUF q4).
+"""
+import os
+
+model_path = os.getenv("LLM_MODEL_PATH", "/app/models/Phi-3-mini-4k-instruct-q4.gguf")
+model_url = os.getenv("LLM_MODEL_URL", "https://huggingface.co/microsoft/Phi-3-mini-4k-instruct-gguf/resolve/main/"
+                                       "Phi-3-mini-4k-instruct-q4.gguf")
@@ -0,0 +1,278 @@
+"""
+Provisionamento do arquivo do modelo: download paralelo, retomável e verificado.
+
+O arquivo é baixado em blocos com requisições Range simultâneas para um
+arquivo temporário <destino>.part; os blocos concluídos ficam registrados em
+<destino>.part.json, então um download interrompido continua de onde parou
+(desde que tamanho e ETag no servidor não tenham mudado). Ao final, o
+SHA-256 e (para .gguf) o cabeçalho GGUF são conferidos ainda no .part; só
+então o arquivo é movido para o destino de forma atômica e o arquivo lateral
+de model_loader é gravado, para que o primeiro start do serviço não precise
+validar o modelo de novo. Um arquivo inválido nunca chega ao destino.
+
+Uso (a partir do diretório llm; padrões: LLM_MODEL_URL e LLM_MODEL_PATH):
+
+    python -m app.model_download --sha256 <hash> --connections 8
+    python -m app.model_download --url https://.../modelo.gguf --dest /app/models/modelo.gguf
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, Optional, Set
+
+import requests
+
+from . import model_config, model_loader
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_MB = 32
+
+class DownloadError(Exception):
+    """Falha definitiva do download (após as novas tentativas)."""
+
+def probe(session: requests.Session, url: str, timeout: float) -> Dict[str, Any]:
+    """Tamanho, ETag e suporte a Range do arquivo remoto (segue redirecionamentos)."""
+    response = session.get(url, headers={"Range": "bytes=0-0"}, stream=True, timeout=timeout, allow_redirects=True)
+    try:
+        response.raise_for_status()
+        if response.status_code == 206 and "/" in response.headers.get("Content-Range", ""):
+            size = int(response.headers["Content-Range"].rsplit("/", 1)[1])
+            ranges = True
+        else:
+            size = int(response.headers.get("Content-Length", 0)) or None
+            ranges = False
+        return {"url": response.url, "size": size, "etag": response.headers.get("ETag"), "ranges": ranges}
+    finally:
+        response.close()
+
+class ChunkedDownload:
+    """Download de um arquivo em blocos paralelos com estado persistido para retomada."""
+
+    def __init__(self, url: str, dest: str, connections: int = 8, chunk_size: int = DEFAULT_CHUNK_MB * 1024 * 1024,
+                 retries: int = 5, timeout: float = 30.0,
+                 progress: Optional[Callable[[int, int], None]] = None):
+        self.url = url
+        self.dest = dest
+        self.part = f"{dest}.part"
+        self.state_path = f"{dest}.part.json"
+        self.connections = connections
+        self.chunk_size = chunk_size
+        self.retries = retries
+        self.timeout = timeout
+        self.progress = progress
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=connections)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._lock = threading.Lock()
+        self.done: Set[int] = set()
+        self.downloaded = 0
+        self.resumed_bytes = 0
+        self.retried = 0
+
+    def _load_state(self, remote: Dict[str, Any]) -> None:
+        try:
+            with open(self.state_path, encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return
+        same = (state.get("size") == remote["size"] and state.get("etag") == remote["etag"]
+                and state.get("chunk_size") == self.chunk_size and os.path.exists(self.part)
+                # .part truncado (ex.: copiado pela metade): os blocos registrados não estão mais lá
+                and os.path.getsize(self.part) == remote["size"])
+        if same:
+            self.done = set(state.get("done", []))
+            self.resumed_bytes = sum(self._chunk_len(i, remote["size"]) for i in self.done)
+
+    def _save_state(self, remote: Dict[str, Any]) -> None:
+        tmp = f"{self.state_path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"url": self.url, "size": remote["size"], "etag": remote["etag"],
+                       "chunk_size": self.chunk_size, "done": sorted(self.done)}, f)
+        os.replace(tmp, self.state_path)
+
+    def _chunk_len(self, index: int, size: int) -> int:
+        return min(self.chunk_size, size - index * self.chunk_size)
+
+    def _fetch_chunk(self, fd: int, index: int, remote: Dict[str, Any]) -> None:
+        start = index * self.chunk_size
+        end = start + self._chunk_len(index, remote["size"]) - 1
+        headers = {"Range": f"bytes={start}-{end}"}
+        if remote["etag"]:
+            # Se o arquivo mudar no servidor, a resposta vem completa (200) em vez do trecho
+            headers["If-Range"] = remote["etag"]
+        for attempt in range(self.retries + 1):
+            offset = start
+            try:
+                with self.session.get(remote["url"], headers=headers, stream=True, timeout=self.timeout) as response:
+                    if response.status_code != 206:
+                        raise DownloadError(f"Resposta {response.status_code} ao pedir o trecho {start}-{end}")
+                    for data in response.iter_content(1024 * 1024):
+                        os.pwrite(fd, data, offset)
+                        offset += len(data)
+                        with self._lock:
+                            self.downloaded += len(data)
+                if offset != end + 1:
+                    raise requests.exceptions.ConnectionError(f"Trecho incompleto: {offset - start} de {end - start + 1} bytes")
+                return
+            except (requests.exceptions.RequestException, OSError) as e:
+                with self._lock:
+                    self.downloaded -= offset - start
+                    self.retried += 1
+                if attempt == self.retries:
+                    raise DownloadError(f"Falha no trecho {start}-{end}: {e}") from e
+                time.sleep(min(2 ** attempt * 0.5, 10))
+
+    def _download_ranges(self, remote: Dict[str, Any]) -> None:
+        size = remote["size"]
+        self._load_state(remote)
+        if not self.done:
+            with open(self.part, "wb") as f:
+                f.truncate(size)
+        pending = [i for i in range((size + self.chunk_size - 1) // self.chunk_size) if i not in self.done]
+        fd = os.open(self.part, os.O_WRONLY)
+        try:
+            with ThreadPoolExecutor(max_workers=self.connections) as pool:
+                futures = {pool.submit(self._fetch_chunk, fd, i, remote): i for i in pending}
+                error: Optional[BaseException] = None
+                for future in as_completed(futures):
+                    if future.exception() is not None:
+                        # Continua registrando os blocos que terminarem, para a retomada aproveitá-los
+                        error = error or future.exception()
+                        continue
+                    with self._lock:
+                        self.done.add(futures[future])
+                        self._save_state(remote)
+                    if self.progress:
+                        self.progress(self.resumed_bytes + self.downloaded, size)
+            os.fsync(fd)
+            if error is not None:
+                raise error
+        finally:
+            os.close(fd)
+
+    def _download_single(self, remote: Dict[str, Any]) -> None:
+        # Servidor sem suporte a Range: um único stream, sem retomada
+        with self.session.get(remote["url"], stream=True, timeout=self.timeout) as response, open(self.part, "wb") as f:
+            response.raise_for_status()
+            for data in response.iter_content(1024 * 1024):
+                f.write(data)
+                self.downloaded += len(data)
+                if self.progress:
+                    self.progress(self.downloaded, remote["size"] or 0)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _discard(self) -> None:
+        """Remove o .part e o estado: o próximo download recomeça do zero."""
+        for path in (self.part, self.state_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def run(self, expected_sha256: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Baixa, verifica e move o arquivo para o destino.
+
+        Raises:
+            DownloadError: Se o download falhar, o SHA-256 não conferir ou o
+                arquivo .gguf não tiver um cabeçalho GGUF válido.
+        """
+        started = time.perf_counter()
+        try:
+            remote = probe(self.session, self.url, self.timeout)
+        except requests.exceptions.RequestException as e:
+            raise DownloadError(f"Falha ao consultar {self.url}: {e}") from e
+        os.makedirs(os.path.dirname(os.path.abspath(self.dest)), exist_ok=True)
+        if remote["ranges"] and remote["size"]:
+            self._download_ranges(remote)
+        else:
+            try:
+                self._download_single(remote)
+            except requests.exceptions.RequestException as e:
+                raise DownloadError(f"Falha no download de {self.url}: {e}") from e
+        download_s = time.perf_counter() - started
+
+        digest = hashlib.sha256()
+        with open(self.part, "rb") as f:
+            for data in iter(lambda: f.read(8 * 1024 * 1024), b""):
+                digest.update(data)
+        sha256 = digest.hexdigest()
+        if expected_sha256 and sha256 != expected_sha256.lower():
+            # Blocos corrompidos não são identificáveis: descarta o estado para baixar tudo de novo
+            self._discard()
+            raise DownloadError(f"SHA-256 não confere: {sha256} (esperado {expected_sha256})")
+        header = None
+        if self.dest.endswith(".gguf"):
+            try:
+                header = model_loader.read_gguf_header(self.part)
+            except ValueError as e:
+                # URL de outro artefato (ex.: .bin) ou página de erro servida com 200
+                self._discard()
+                raise DownloadError(f"O arquivo baixado não é GGUF: {e}") from e
+
+        os.replace(self.part, self.dest)
+        if os.path.exists(self.state_path):
+            os.remove(self.state_path)
+        dir_fd = os.open(os.path.dirname(os.path.abspath(self.dest)), os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+        stat = os.stat(self.dest)
+        if header is not None:
+            # Mesmo formato de model_loader.validate, com o hash já calculado
+            model_loader.write_sidecar(self.dest, {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+                                                   **header, "sha256": sha256})
+        size = stat.st_size
+        return {
+            "dest": self.dest, "size": size, "sha256": sha256, "seconds": time.perf_counter() - started,
+            "download_mb_per_s": self.downloaded / 1024 / 1024 / download_s if download_s else None,
+            "resumed_bytes": self.resumed_bytes, "retries": self.retried, "ranges": remote["ranges"],
+        }
+
+def main():
+    parser = argparse.ArgumentParser(description="Baixa o arquivo do modelo em paralelo, com retomada e verificação")
+    parser.add_argument("--url", default=None, help="URL do modelo (padrão: LLM_MODEL_URL)")
+    parser.add_argument("--dest", default=None, help="Arquivo de destino (padrão: LLM_MODEL_PATH)")
+    parser.add_argument("--sha256", default=os.getenv("LLM_MODEL_SHA256") or None, help="SHA-256 esperado")
+    parser.add_argument("--connections", type=int, default=8, help="Conexões simultâneas")
+    parser.add_argument("--chunk-mb", type=int, default=DEFAULT_CHUNK_MB, help="Tamanho dos blocos em MB")
+    parser.add_argument("--retries", type=int, default=5, help="Novas tentativas por bloco")
+    parser.add_argument("--force", action="store_true", help="Baixa mesmo que o destino já exista")
+    args = parser.parse_args()
+
+    args.url = args.url or model_config.model_url
+    args.dest = args.dest or model_config.model_path
+    if os.path.exists(args.dest) and not args.force:
+        print(f"{args.dest} já existe (use --force para baixar de novo)")
+        return
+
+    last = [0.0]
+
+    def progress(done: int, total: int) -> None:
+        now = time.monotonic()
+        if now - last[0] >= 1 or done == total:
+            last[0] = now
+            pct = f"{done / total * 100:5.1f}%" if total else ""
+            print(f"\r{done / 1024 / 1024:10.1f} MB {pct}", end="", flush=True)
+
+    download = ChunkedDownload(args.url, args.dest, args.connections, args.chunk_mb * 1024 * 1024,
+                               args.retries, progress=progress)
+    try:
+        result = download.run(args.sha256)
+    except DownloadError as e:
+        print(f"\nERRO: {e}")
+        sys.exit(1)
+    print(f"\n{result['dest']}: {result['size'] / 1024 / 1024:.1f} MB em {result['seconds']:.1f} s "
+          f"({result['download_mb_per_s'] or 0:.1f} MB/s, {result['resumed_bytes'] / 1024 / 1024:.1f} MB retomados, "
+          f"{result['retries']} novas tentativas)\nSHA-256: {result['sha256']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Preparação do arquivo do modelo antes do carregamento.
+
+Depois de um reboot, o arquivo GGUF não está no page cache e o llama.cpp
+(que mapeia o arquivo com mmap) paga por page faults em leituras aleatórias
+durante as primeiras gerações. Este módulo:
+
+- valida o arquivo (cabeçalho GGUF e, se LLM_MODEL_SHA256 estiver definido,
+  o SHA-256), guardando o resultado em um arquivo lateral <modelo>.meta.json
+  para que os próximos starts pulem a validação enquanto tamanho e mtime
+  não mudarem;
+- aquece o page cache com leitura sequencial (LLM_MODEL_PREWARM):
+  "fadvise" pede readahead ao kernel sem bloquear, "read" lê o arquivo
+  inteiro antes do carregamento e "off" desativa;
+- mede o tempo até o primeiro token em velocidade plena (aquecimento com
+  alguns tokens após o carregamento).
+"""
+import hashlib
+import json
+import logging
+import os
+import struct
+import time
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+GGUF_MAGIC = b"GGUF"
+_CHUNK = 8 * 1024 * 1024
+
+def sidecar_path(path: str) -> str:
+    return f"{path}.meta.json"
+
+def read_gguf_header(path: str) -> Dict[str, int]:
+    """Lê o cabeçalho GGUF (versão, número de tensores e de metadados)."""
+    with open(path, "rb") as f:
+        header = f.read(24)
+    if len(header) < 24 or header[:4] != GGUF_MAGIC:
+        raise ValueError(f"{path} não é um arquivo GGUF válido")
+    version, tensors, kv = struct.unpack("<IQQ", header[4:24])
+    return {"gguf_version": version, "tensor_count": tensors, "kv_count": kv}
+
+def _read_sequential(path: str, digest: Optional[Any] = None) -> int:
+    """Lê o arquivo inteiro em blocos grandes (alimentando digest, se informado)."""
+    total = 0
+    with open(path, "rb", buffering=0) as f:
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        while True:
+            chunk = f.read(_CHUNK)
+            if not chunk:
+                break
+            total += len(chunk)
+            if digest is not None:
+                digest.update(chunk)
+    return total
+
+def validate(path: str, expected_sha256: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Valida o arquivo do modelo, reaproveitando o arquivo lateral quando o
+    tamanho e o mtime não mudaram.
+
+    Returns:
+        Metadados do arquivo, com "cached" indicando se a validação foi pulada.
+
+    Raises:
+        ValueError: Se o arquivo não for GGUF ou o SHA-256 não conferir.
+    """
+    stat = os.stat(path)
+    try:
+        with open(sidecar_path(path), encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        meta = {}
+    fresh = meta.get("size") == stat.st_size and meta.get("mtime_ns") == stat.st_mtime_ns
+    if fresh and (not expected_sha256 or meta.get("sha256") == expected_sha256.lower()):
+        return {**meta, "cached": True}
+
+    meta = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, **read_gguf_header(path)}
+    if expected_sha256:
+        digest = hashlib.sha256()
+        # A leitura para o hash também aquece o page cache
+        _read_sequential(path, digest)
+        meta["sha256"] = digest.hexdigest()
+        if meta["sha256"] != expected_sha256.lower():
+            raise ValueError(f"SHA-256 do modelo não confere: {meta['sha256']} (esperado {expected_sha256})")
+    write_sidecar(path, meta)
+    return {**meta, "cached": False}
+
+def write_sidecar(path: str, meta: Dict[str, Any]) -> None:
+    """Grava os metadados da validação no arquivo lateral (falhas só geram aviso)."""
+    try:
+        with open(sidecar_path(path), "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2)
+    except OSError as e:
+        # Diretório somente leitura: valida de novo no próximo start
+        logger.warning("Não foi possível gravar %s: %s", sidecar_path(path), e)
+
+def prewarm(path: str, mode: str = "fadvise") -> Dict[str, Any]:
+    """Aquece o page cache com o arquivo do modelo ("fadvise", "read" ou "off")."""
+    started = time.perf_counter()
+    if mode == "read":
+        size = _read_sequential(path)
+        elapsed = time.perf_counter() - started
+        return {"mode": mode, "seconds": elapsed, "mb_per_s": size / 1024 / 1024 / elapsed if elapsed else None}
+    if mode == "fadvise" and hasattr(os, "posix_fadvise"):
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            # Readahead assíncrono do arquivo inteiro, em ordem
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+        finally:
+            os.close(fd)
+        return {"mode": mode, "seconds": time.perf_counter() - started}
+    return {"mode": "off", "seconds": 0.0}
+
+def transparent_hugepages() -> Optional[str]:
+    """Modo ativo das transparent huge pages (always, madvise, never) ou None."""
+    try:
+        with open("/sys/kernel/mm/transparent_hugepage/enabled", encoding="utf-8") as f:
+            return next((w.strip("[]") for w in f.read().split() if w.startswith("[")), None)
+    except OSError:
+        return None
+
+def warmup(model: Any, tokens: int = 16, prompt: str = "<|user|>\nOlá<|end|>\n<|assistant|>") -> Dict[str, Any]:
+    """
+    Gera alguns tokens e mede quando o decode atinge velocidade plena: o
+    primeiro token cujo intervalo fica abaixo de 1,5x a mediana.
+    """
+    started = time.perf_counter()
+    times: List[float] = []
+    for chunk in model(prompt, max_tokens=tokens, temperature=0.0, stream=True):
+        if chunk["choices"][0]["text"]:
+            times.append(time.perf_counter() - started)
+    if hasattr(model, "reset"):
+        # Descarta o prompt de aquecimento do cache KV
+        model.reset()
+    if not times:
+        return {"first_token_s": None, "full_speed_s": None, "decode_tps": None}
+    intervals = [b - a for a, b in zip(times, times[1:])]
+    full_speed = times[0]
+    if intervals:
+        median = sorted(intervals)[len(intervals) // 2]
+        full_speed = next((times[i + 1] for i, dt in enumerate(intervals) if dt <= 1.5 * median), times[-1])
+    steady = intervals[len(intervals) // 2:]
+    return {
+        "first_token_s": times[0],
+        "full_speed_s": full_speed,
+        "decode_tps": len(steady) / sum(steady) if steady and sum(steady) > 0 else None,
+    }
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Literal, Optional, Any
 
 class QueryRequest(BaseModel):
     """
@@ -9,10 +9,12 @@ class QueryRequest(BaseModel):
         question: A pergunta feita pelo aluno.
         student_id: O ID do aluno que está fazendo a pergunta.
         context_data: Dados contextuais opcionais para enriquecer a resposta.
+        mode: Formato da resposta, "prose" ou "structured" (padrão: LLM_OUTPUT_MODE).
     """
     question: str
     student_id: int
     context_data: Optional[Dict[str, Any]] = None
+    mode: Optional[Literal["prose", "structured"]] = None
 
 class QueryResponse(BaseModel):
     """
@@ -23,6 +25,27 @@ class QueryResponse(BaseModel):
     """
     answer: str
 
+class JobResponse(BaseModel):
+    """
+    Modelo para o estado de uma consulta assíncrona (job).
+    
+    Attributes:
+        job_id: Identificador do job.
+        status: "running", "done", "failed" ou "cancelled".
+        answer: A resposta completa (quando status é "done").
+        partial: O trecho da resposta gerado até agora (enquanto não termina).
+        error: Motivo da falha ou do cancelamento.
+        created_at: Instante de criação (epoch, s).
+        finished_at: Instante de término (epoch, s).
+    """
+    job_id: str
+    status: Literal["running", "done", "failed", "cancelled"]
+    answer: Optional[str] = None
+    partial: Optional[str] = None
+    error: Optional[str] = None
+    created_at: float
+    finished_at: Optional[float] = None
+
 class HealthCheckResponse(BaseModel):
     """
     Modelo para a resposta do endpoint de verificação de saúde.
@@ -6,6 +6,8 @@ import platform
 import os
 import logging
 
+from .kv_cache import kv_overrides
+
 logger = logging.getLogger(__name__)
 
 # Detectar plataforma
@@ -17,10 +19,10 @@ is_linux = platform.system() == "Linux"
 logger.info(f"Plataforma detectada: {platform.system()} {platform.machine()}")
 logger.info(f"Mac com Apple Silicon: {is_mac_m1}")
 
-# Definir o limite de memória por plataforma
-if is_mac_m1:
+# Perfis de configuração por plataforma
+PROFILES = {
     # Configuração otimizada para Mac com chip Apple Silicon
-    LLM_CONFIG = {
+    "mac_m1": {
         # Configurações gerais
         "gc_interval": 60,      # Intervalo para coleta de lixo (segundos)
         
@@ -36,6 +38,9 @@ if is_mac_m1:
             "seed": -1,
             "embedding": False,   # Desativar embeddings
             "max_tokens": 300,    # Limitar tokens de saída
+            "type_k": "f16",      # Precisão do cache KV (f16, q8_0, q4_0...)
+            "type_v": "f16",
+            "flash_attn": False,  # Atenção com flash attention (exigida por V quantizado)
         },
         
         # Configurações para outros tipos de LLM
@@ -43,10 +48,10 @@ if is_mac_m1:
             "verbose": False,
             "n_threads": 4,
         }
-    }
-else:
+    },
+    
     # Configuração padrão para outras plataformas (Linux, etc.)
-    LLM_CONFIG = {
+    "default": {
         # Configurações gerais
         "gc_interval": 120,     # Intervalo para coleta de lixo (segundos)
         
@@ -62,6 +67,9 @@ else:
             "seed": -1,
             "embedding": False,   # Desativar embeddings
             "max_tokens": 500,    # Tokens de saída originais
+            "type_k": "f16",      # Precisão do cache KV (f16, q8_0, q4_0...)
+            "type_v": "f16",
+            "flash_attn": False,  # Atenção com flash attention (exigida por V quantizado)
         },
         
         # Configurações para outros tipos de LLM
@@ -69,12 +77,53 @@ else:
             "verbose": True,
             "n_threads": 6,
         }
-    }
+    },
+    
+    # Nós com pouca RAM: cache KV em q8_0 (cerca de metade do f16) e flash attention
+    "low_memory": {
+        "gc_interval": 60,
+        
+        "gguf": {
+            "n_ctx": 4096,
+            "n_batch": 256,
+            "n_threads": 6,
+            "n_gpu_layers": 0,    # Somente CPU
+            "use_mlock": False,
+            "verbose": False,
+            "offload_kqv": False,
+            "seed": -1,
+            "embedding": False,
+            "max_tokens": 500,
+            "type_k": "q8_0",
+            "type_v": "q8_0",
+            "flash_attn": True,
+        },
+        
+        "gpt4all": {
+            "verbose": False,
+            "n_threads": 6,
+        }
+    },
+}
+
+# Perfil ativo: detectado pela plataforma ou forçado com LLM_PLATFORM_PROFILE
+ACTIVE_PROFILE = os.getenv("LLM_PLATFORM_PROFILE") or ("mac_m1" if is_mac_m1 else "default")
+LLM_CONFIG = PROFILES[ACTIVE_PROFILE]
+# LLM_KV_TYPE* e LLM_FLASH_ATTN, lidas uma vez (tipo inválido falha já na importação)
+KV_OVERRIDES = kv_overrides()
+
+def get_profile_names():
+    """Retorna os nomes dos perfis de configuração disponíveis."""
+    return list(PROFILES)
 
-def get_model_config(model_type="gguf"):
-    """Retorna a configuração apropriada para o tipo de modelo."""
-    if model_type in LLM_CONFIG:
-        return LLM_CONFIG[model_type]
+def get_model_config(model_type="gguf", profile=None):
+    """Retorna a configuração apropriada para o tipo de modelo (no perfil ativo ou no informado)."""
+    config = PROFILES[profile] if profile else LLM_CONFIG
+    if model_type == "gguf" and model_type in config:
+        # LLM_KV_TYPE* e LLM_FLASH_ATTN prevalecem sobre o perfil
+        return {**config[model_type], **KV_OVERRIDES}
+    if model_type in config:
+        return config[model_type]
     return {}
 
 def should_run_gc():
@@ -0,0 +1,118 @@
+"""
+Respostas pré-geradas para as perguntas frequentes dos alunos ativos.
+
+Na janela de baixo uso (LLM_PREGEN_WINDOW, padrão "02:00-06:00", horário
+local), o serviço gera em lote as respostas das perguntas de
+LLM_PREGEN_QUESTIONS (separadas por "|") para os alunos que usaram o chat
+nos últimos LLM_PREGEN_ACTIVE_DAYS dias (endpoint alunos/ativos do
+backend). Cada resposta fica associada à versão dos dados do aluno usada
+para gerá-la, ao dia em que será servida (o dia em que a janela termina,
+mesmo que ela passe da meia-noite) e à variante do prompt (formato do contexto
+e perfil de carga, sempre "normal" na pré-geração); no caminho online, uma
+pergunta equivalente (mesmo texto normalizado) em modo prosa recebe a
+resposta guardada enquanto os dados do aluno não mudarem, naquele dia e com
+a mesma variante.
+
+A pré-geração usa a prioridade de lote do slot do modelo (ver scheduler) e
+cede assim que aparecem requisições interativas: a geração em andamento é
+interrompida e o lote só continua depois de LLM_PREGEN_IDLE_S segundos sem
+fila.
+"""
+import datetime
+import hashlib
+import json
+import os
+import re
+import threading
+import unicodedata
+from typing import Any, Dict, List, Optional, Tuple
+
+DEFAULT_QUESTIONS = "Quais são minhas aulas hoje?|Qual foi minha última nota?|Quando vence minha próxima mensalidade?"
+# Chaves dos dados do aluno que não alteram as respostas (o histórico do chat cresce a cada pergunta)
+VERSION_IGNORED = {"historico_chat", "_consultas"}
+
+def load_questions() -> List[str]:
+    return [q.strip() for q in os.getenv("LLM_PREGEN_QUESTIONS", DEFAULT_QUESTIONS).split("|") if q.strip()]
+
+def normalize_question(question: str) -> str:
+    """Minúsculas, sem acentos, pontuação ou espaços repetidos."""
+    text = unicodedata.normalize("NFKD", question.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(re.sub(r"[^\w\s]", " ", text).split())
+
+def data_version(student_data: Dict[str, Any]) -> str:
+    """Versão dos dados do aluno: hash do JSON canônico, sem as chaves de VERSION_IGNORED."""
+    relevant = {k: v for k, v in student_data.items() if k not in VERSION_IGNORED}
+    encoded = json.dumps(relevant, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()[:16]
+
+def variant(context_format: str, profile_name: str) -> str:
+    """Identifica o prompt usado na geração: formato do contexto e perfil de carga."""
+    return f"{context_format}:{profile_name}"
+
+def parse_window(window: str) -> Tuple[datetime.time, datetime.time]:
+    """ "02:00-06:00" -> (02:00, 06:00); a janela pode passar da meia-noite ("23:00-05:00")."""
+    start, end = (datetime.datetime.strptime(part.strip(), "%H:%M").time() for part in window.split("-"))
+    return start, end
+
+def in_window(now: datetime.datetime, window: Tuple[datetime.time, datetime.time]) -> bool:
+    start, end = window
+    current = now.time()
+    if start <= end:
+        return start <= current < end
+    return current >= start or current < end
+
+def seconds_until(now: datetime.datetime, moment: datetime.time) -> float:
+    """Segundos até a próxima ocorrência do horário (0 se for agora)."""
+    target = now.replace(hour=moment.hour, minute=moment.minute, second=0, microsecond=0)
+    if target < now:
+        target += datetime.timedelta(days=1)
+    return (target - now).total_seconds()
+
+def serving_day(now: datetime.datetime, window: Tuple[datetime.time, datetime.time]) -> datetime.date:
+    """Dia em que as respostas geradas agora serão servidas: o do fim da janela (hoje, fora dela)."""
+    if not in_window(now, window):
+        return now.date()
+    return (now + datetime.timedelta(seconds=seconds_until(now, window[1]))).date()
+
+class PregenStore:
+    """Respostas pré-geradas por (aluno, pergunta normalizada), com a versão dos dados e o dia em que valem."""
+
+    def __init__(self):
+        self._answers: Dict[Tuple[int, str], Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._answers)
+
+    def put(self, student_id: int, question: str, version: str, answer: str, prompt_variant: str,
+            day: Optional[datetime.date] = None) -> None:
+        with self._lock:
+            self._answers[(student_id, normalize_question(question))] = {
+                "version": version, "answer": answer, "variant": prompt_variant, "day": day or datetime.date.today()}
+
+    def has(self, student_id: int, question: str) -> bool:
+        """Há resposta guardada para a pergunta (sem conferir a versão; evita buscar os dados à toa)."""
+        return (student_id, normalize_question(question)) in self._answers
+
+    def get(self, student_id: int, question: str, version: str, prompt_variant: str,
+            day: Optional[datetime.date] = None) -> Optional[str]:
+        """Resposta guardada para o dia (padrão hoje), com a mesma versão dos dados do aluno e a mesma variante do prompt."""
+        entry = self._answers.get((student_id, normalize_question(question)))
+        if (entry is None or entry["version"] != version or entry["variant"] != prompt_variant
+                or entry["day"] != (day or datetime.date.today())):
+            return None
+        return entry["answer"]
+
+    def is_current(self, student_id: int, question: str, version: str, prompt_variant: str,
+                   day: Optional[datetime.date] = None) -> bool:
+        return self.get(student_id, question, version, prompt_variant, day) is not None
+
+    def prune(self) -> int:
+        """Remove as respostas de dias anteriores; retorna quantas foram removidas."""
+        today = datetime.date.today()
+        with self._lock:
+            stale = [key for key, entry in self._answers.items() if entry["day"] < today]
+            for key in stale:
+                del self._answers[key]
+        return len(stale)
@@ -0,0 +1,104 @@
+"""
+Profiler por amostragem sob demanda.
+
+Enquanto um perfil está em andamento, uma thread lê periodicamente as pilhas
+de todas as threads do processo (sys._current_frames) e conta cada pilha no
+formato "collapsed" (frames separados por ";" seguidos da contagem), aceito
+diretamente por flamegraph.pl, speedscope e inferno. Fora desse intervalo
+nada é executado, então o custo com o profiler desligado é nulo.
+
+Com native=True e o py-spy instalado (e permissão de ptrace), a amostragem é
+feita pelo py-spy, que também inclui frames nativos (llama.cpp, numpy).
+"""
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+MAX_DURATION = 120.0
+MAX_RATE = 1000
+
+# Frames no topo de threads bloqueadas esperando trabalho (não consomem CPU)
+IDLE_FUNCTIONS = {"wait", "select", "poll", "accept", "_worker", "get", "dequeue"}
+
+_lock = threading.Lock()
+
+class ProfilerBusy(Exception):
+    """Já existe um perfil em andamento neste processo."""
+
+def _collapse(frame) -> str:
+    """Pilha da raiz até o frame atual, no formato collapsed."""
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join(reversed(stack))
+
+def _sample_python(duration: float, rate: int, include_idle: bool) -> Counter:
+    interval = 1.0 / rate
+    own = threading.get_ident()
+    names = {}
+    stacks: Counter = Counter()
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        started = time.monotonic()
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own:
+                continue
+            if not include_idle and frame.f_code.co_name in IDLE_FUNCTIONS:
+                continue
+            if thread_id not in names:
+                names = {t.ident: t.name for t in threading.enumerate()}
+            stacks[f"{names.get(thread_id, thread_id)};{_collapse(frame)}"] += 1
+        time.sleep(max(0.0, interval - (time.monotonic() - started)))
+    return stacks
+
+def _sample_native(duration: float, rate: int, include_idle: bool) -> Optional[str]:
+    """Executa o py-spy sobre o próprio processo; retorna None se não for possível."""
+    py_spy = shutil.which("py-spy")
+    if py_spy is None:
+        return None
+    with tempfile.NamedTemporaryFile(suffix=".folded", delete=False) as f:
+        output = f.name
+    cmd = [py_spy, "record", "--pid", str(os.getpid()), "--duration", str(max(1, round(duration))),
+           "--rate", str(rate), "--format", "raw", "--native", "--nonblocking", "--output", output]
+    if include_idle:
+        cmd.append("--idle")
+    try:
+        proc = subprocess.run(cmd, capture_output=True, timeout=duration + 30)
+        if proc.returncode != 0:
+            return None
+        with open(output, encoding="utf-8") as f:
+            return f.read()
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    finally:
+        os.unlink(output)
+
+def profile(duration: float = 10.0, rate: int = 100, native: bool = False, include_idle: bool = False) -> str:
+    """
+    Amostra o processo por duration segundos a rate amostras/s e retorna as
+    pilhas no formato collapsed. Bloqueia durante a amostragem.
+
+    Raises:
+        ProfilerBusy: Se outro perfil estiver em andamento.
+    """
+    duration = min(max(duration, 0.1), MAX_DURATION)
+    rate = min(max(rate, 1), MAX_RATE)
+    if not _lock.acquire(blocking=False):
+        raise ProfilerBusy()
+    try:
+        if native:
+            collapsed = _sample_native(duration, rate, include_idle)
+            if collapsed is not None:
+                return collapsed
+        stacks = _sample_python(duration, rate, include_idle)
+        return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+    finally:
+        _lock.release()
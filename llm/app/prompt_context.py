@@ -0,0 +1,70 @@
+"""
+Codificação compacta do contexto do aluno no prompt de sistema
+(LLM_CONTEXT_FORMAT=compact; o padrão continua sendo o detalhado).
+
+O formato detalhado (LLM_CONTEXT_FORMAT=verbose) repete rótulos em cada
+linha e carrega a indentação da f-string. O compacto declara o cabeçalho de
+cada seção uma vez e lista os registros como linhas de tabela separadas por
+"|", sem espaços sobrando:
+
+    Aluno (nome|curso|semestre):
+    Maria Souza|Ciência da Computação|3
+    Notas (disciplina|final):
+    Cálculo I|6.40
+    Horários (disciplina|dia|início-fim):
+    Cálculo I|Segunda|08:00-10:00
+
+Os limites de registros por seção são os mesmos do formato detalhado, então
+os dois formatos levam as mesmas informações ao modelo. max_rows reduz esses
+limites (perfis de carga, ver load_profile).
+"""
+from typing import Any, Dict, List, Optional
+
+INSTRUCOES = ("Responda de forma cordial e direta usando os dados abaixo. Se faltarem informações, "
+              "peça mais detalhes ou sugira contato com a coordenação.")
+
+def _hora(value: Any) -> str:
+    """08:00:00 -> 08:00"""
+    text = str(value or "")
+    return text[:5] if len(text) == 8 and text[2] == ":" else text
+
+def _dia(value: Any) -> str:
+    """Segunda-feira -> Segunda"""
+    return str(value or "").replace("-feira", "")
+
+def limit(default: int, max_rows: Optional[int]) -> int:
+    """Registros de uma seção: o limite padrão, reduzido a max_rows se informado."""
+    return default if max_rows is None else min(default, max_rows)
+
+def _table(title: str, header: str, rows: List[str]) -> str:
+    return f"{title} ({header}):\n" + "\n".join(rows)
+
+def compact_system_prompt(student_data: Dict[str, Any], max_rows: Optional[int] = None) -> str:
+    """Prompt de sistema com o contexto do aluno em linhas de tabela."""
+    if not student_data:
+        return "Você é o UniChat, assistente acadêmico de alunos (notas, horários, finanças e vida acadêmica).\n" + INSTRUCOES
+
+    nome = student_data.get("nome", "Aluno")
+    lines = [f"Você é o UniChat, assistente acadêmico de {nome}. {INSTRUCOES}",
+             _table("Aluno", "nome|curso|semestre",
+                    [f"{nome}|{student_data.get('curso', '')}|{student_data.get('semestre', '')}"])]
+
+    if student_data.get("notas"):
+        lines.append(_table("Notas", "disciplina|final", [
+            f"{nota.get('disciplina')}|{nota.get('nota_final')}" for nota in student_data["notas"][:limit(5, max_rows)]]))
+    if student_data.get("horarios"):
+        lines.append(_table("Horários", "disciplina|dia|início-fim", [
+            f"{h.get('disciplina')}|{_dia(h.get('dia_semana_display'))}|{_hora(h.get('horario_inicio'))}-{_hora(h.get('horario_fim'))}"
+            for h in student_data["horarios"][:limit(5, max_rows)]]))
+
+    # Financeiro e frequência só entram quando buscados para a pergunta (LLM_FETCH_MODE=tools)
+    consultas = student_data.get("_consultas") or []
+    if "dados_financeiros" in consultas and student_data.get("dados_financeiros"):
+        lines.append(_table("Mensalidades", "valor R$|vencimento|situação", [
+            f"{d.get('mensalidade')}|{d.get('data_vencimento')}|{d.get('status_pagamento_display')}"
+            for d in student_data["dados_financeiros"][:limit(3, max_rows)]]))
+    if "frequencias" in consultas and student_data.get("frequencias"):
+        lines.append(_table("Frequência", "disciplina|data|situação", [
+            f"{f.get('disciplina')}|{f.get('data')}|{f.get('status_display')}"
+            for f in student_data["frequencias"][:limit(5, max_rows)]]))
+    return "\n".join(lines)
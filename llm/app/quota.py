@@ -0,0 +1,245 @@
+"""
+Contabilização de uso por aluno e cotas.
+
+Cada geração registra os tokens do prompt, os tokens da resposta e o tempo
+de computação (tempo com o slot do modelo ocupado) do aluno. O uso fica em
+uma janela deslizante em memória, com baldes de LLM_QUOTA_BUCKET_S segundos
+(só as somas por balde, não as requisições), e é enviado periodicamente ao
+backend (/api/uso-llm/registrar/).
+
+Antes de gerar, a cota do aluno decide o caminho da consulta:
+
+- "ok": geração normal;
+- "reduzida": max_tokens limitado a LLM_QUOTA_REDUCED_MAX_TOKENS (a partir
+  de LLM_QUOTA_SOFT da cota do aluno, ou quando o uso global passa de
+  LLM_QUOTA_SOFT e o aluno responde por mais de LLM_QUOTA_HEAVY_SHARE dele);
+- "regras": resposta por regras, sem o modelo (cota do aluno esgotada, ou
+  uso global esgotado para os alunos mais pesados);
+- "bloqueada": a consulta é recusada (uso acima de LLM_QUOTA_HARD vezes a
+  cota do aluno).
+
+Cotas com valor 0 ficam desativadas (padrão).
+"""
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, List, Optional
+
+class QuotaExceeded(Exception):
+    """Consulta recusada por excesso de uso do aluno."""
+
+    def __init__(self, student_id: int, retry_after: float):
+        super().__init__(f"Cota de uso do aluno {student_id} excedida")
+        self.student_id = student_id
+        self.retry_after = retry_after
+
+class Usage:
+    """Uso de uma consulta, acumulado pelas gerações que ela dispara."""
+
+    def __init__(self):
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.compute_s = 0.0
+
+    def add(self, prompt_tokens: int, completion_tokens: int, compute_s: float) -> None:
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+        self.compute_s += compute_s
+
+    @property
+    def tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+class _Window:
+    """Somas de uso em baldes de tempo fixos (janela deslizante)."""
+
+    def __init__(self):
+        # [início do balde, tokens do prompt, tokens da resposta, computação (s), requisições]
+        self.buckets: Deque[List[float]] = deque()
+
+    def add(self, now: float, bucket_s: float, usage: Usage) -> None:
+        start = now - now % bucket_s
+        if not self.buckets or self.buckets[-1][0] != start:
+            self.buckets.append([start, 0, 0, 0.0, 0])
+        bucket = self.buckets[-1]
+        bucket[1] += usage.prompt_tokens
+        bucket[2] += usage.completion_tokens
+        bucket[3] += usage.compute_s
+        bucket[4] += 1
+
+    def expire(self, limit: float) -> None:
+        while self.buckets and self.buckets[0][0] < limit:
+            self.buckets.popleft()
+
+    def totals(self) -> Dict[str, float]:
+        prompt = sum(b[1] for b in self.buckets)
+        completion = sum(b[2] for b in self.buckets)
+        return {
+            "prompt_tokens": prompt,
+            "completion_tokens": completion,
+            "tokens": prompt + completion,
+            "compute_s": sum(b[3] for b in self.buckets),
+            "requests": sum(b[4] for b in self.buckets),
+        }
+
+class QuotaTracker:
+    """Janelas de uso por aluno e global, com as cotas configuradas."""
+
+    def __init__(self, window_s: float = 3600, bucket_s: float = 60, student_tokens: int = 0,
+                 student_compute_s: float = 0, global_tokens: int = 0, soft: float = 0.8, hard: float = 2.0,
+                 heavy_share: float = 0.2, reduced_max_tokens: int = 128):
+        self.window_s = window_s
+        self.bucket_s = bucket_s
+        self.student_tokens = student_tokens
+        self.student_compute_s = student_compute_s
+        self.global_tokens = global_tokens
+        self.soft = soft
+        self.hard = hard
+        self.heavy_share = heavy_share
+        self.reduced_max_tokens = reduced_max_tokens
+        self._lock = threading.Lock()
+        self._students: Dict[int, _Window] = {}
+        self._global = _Window()
+        # Uso ainda não enviado ao backend, por aluno
+        self._pending: Dict[int, Usage] = {}
+        self._pending_requests: Dict[int, int] = {}
+        self._pending_since = time.time()
+
+    @classmethod
+    def from_env(cls) -> "QuotaTracker":
+        return cls(
+            window_s=float(os.getenv("LLM_QUOTA_WINDOW_S", "3600")),
+            bucket_s=float(os.getenv("LLM_QUOTA_BUCKET_S", "60")),
+            student_tokens=int(os.getenv("LLM_QUOTA_STUDENT_TOKENS", "0")),
+            student_compute_s=float(os.getenv("LLM_QUOTA_STUDENT_COMPUTE_S", "0")),
+            global_tokens=int(os.getenv("LLM_QUOTA_GLOBAL_TOKENS", "0")),
+            soft=float(os.getenv("LLM_QUOTA_SOFT", "0.8")),
+            hard=float(os.getenv("LLM_QUOTA_HARD", "2.0")),
+            heavy_share=float(os.getenv("LLM_QUOTA_HEAVY_SHARE", "0.2")),
+            reduced_max_tokens=int(os.getenv("LLM_QUOTA_REDUCED_MAX_TOKENS", "128")),
+        )
+
+    def _expire(self, now: float) -> None:
+        limit = now - self.window_s
+        self._global.expire(limit)
+        for student_id, window in list(self._students.items()):
+            window.expire(limit)
+            if not window.buckets:
+                del self._students[student_id]
+
+    def record(self, student_id: int, usage: Usage, now: Optional[float] = None) -> None:
+        """Registra o uso de uma consulta do aluno."""
+        now = time.time() if now is None else now
+        with self._lock:
+            self._students.setdefault(student_id, _Window()).add(now, self.bucket_s, usage)
+            self._global.add(now, self.bucket_s, usage)
+            pending = self._pending.setdefault(student_id, Usage())
+            pending.add(usage.prompt_tokens, usage.completion_tokens, usage.compute_s)
+            self._pending_requests[student_id] = self._pending_requests.get(student_id, 0) + 1
+
+    def usage(self, student_id: int, now: Optional[float] = None) -> Dict[str, float]:
+        """Uso do aluno na janela atual."""
+        now = time.time() if now is None else now
+        with self._lock:
+            self._expire(now)
+            window = self._students.get(student_id)
+            return window.totals() if window else _Window().totals()
+
+    def _student_fraction(self, totals: Dict[str, float]) -> float:
+        """Fração da cota do aluno já usada (a maior entre tokens e computação)."""
+        fractions = [0.0]
+        if self.student_tokens:
+            fractions.append(totals["tokens"] / self.student_tokens)
+        if self.student_compute_s:
+            fractions.append(totals["compute_s"] / self.student_compute_s)
+        return max(fractions)
+
+    def check(self, student_id: int, now: Optional[float] = None) -> str:
+        """
+        Decide o caminho da próxima consulta do aluno ("ok", "reduzida",
+        "regras" ou "bloqueada").
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            self._expire(now)
+            window = self._students.get(student_id)
+            if window is None:
+                return "ok"
+            totals = window.totals()
+            global_tokens = self._global.totals()["tokens"]
+        fraction = self._student_fraction(totals)
+        decision = "ok"
+        if fraction >= self.hard:
+            return "bloqueada"
+        if fraction >= 1:
+            decision = "regras"
+        elif fraction >= self.soft:
+            decision = "reduzida"
+        if self.global_tokens and global_tokens and totals["tokens"] / global_tokens >= self.heavy_share:
+            # Capacidade global apertada: só os alunos que respondem por boa parte do uso são rebaixados
+            global_fraction = global_tokens / self.global_tokens
+            if global_fraction >= 1:
+                decision = "regras"
+            elif global_fraction >= self.soft and decision == "ok":
+                decision = "reduzida"
+        return decision
+
+    def reset(self, student_id: int) -> bool:
+        """
+        Zera a janela de uso do aluno (liberação manual da cota). O uso global
+        e o acumulado para o backend não mudam: o consumo aconteceu.
+
+        Returns:
+            False se o aluno não tinha uso na janela.
+        """
+        with self._lock:
+            return self._students.pop(student_id, None) is not None
+
+    def retry_after(self, student_id: int, now: Optional[float] = None) -> float:
+        """Segundos até o balde mais antigo do aluno sair da janela."""
+        now = time.time() if now is None else now
+        with self._lock:
+            window = self._students.get(student_id)
+            if window is None or not window.buckets:
+                return 0.0
+            return max(window.buckets[0][0] + self.window_s - now, 0.0) + self.bucket_s
+
+    def take_pending(self) -> List[Dict[str, Any]]:
+        """Uso acumulado desde o último envio, no formato do backend (zera o acumulado)."""
+        now = time.time()
+        with self._lock:
+            pending, requests = self._pending, self._pending_requests
+            since = self._pending_since
+            self._pending, self._pending_requests, self._pending_since = {}, {}, now
+        return [{
+            "aluno": student_id,
+            "inicio": datetime.fromtimestamp(since, timezone.utc).isoformat(),
+            "fim": datetime.fromtimestamp(now, timezone.utc).isoformat(),
+            "tokens_prompt": usage.prompt_tokens,
+            "tokens_resposta": usage.completion_tokens,
+            "tempo_computo": round(usage.compute_s, 3),
+            "requisicoes": requests[student_id],
+        } for student_id, usage in pending.items()]
+
+    def restore_pending(self, records: List[Dict[str, Any]]) -> None:
+        """Devolve registros cujo envio falhou, para a próxima tentativa."""
+        with self._lock:
+            for record in records:
+                pending = self._pending.setdefault(record["aluno"], Usage())
+                pending.add(record["tokens_prompt"], record["tokens_resposta"], record["tempo_computo"])
+                self._pending_requests[record["aluno"]] = (self._pending_requests.get(record["aluno"], 0)
+                                                           + record["requisicoes"])
+            self._pending_since = min([self._pending_since]
+                                      + [datetime.fromisoformat(r["inicio"]).timestamp() for r in records])
+
+    @property
+    def students(self) -> int:
+        with self._lock:
+            return len(self._students)
+
+    def global_usage(self) -> Dict[str, float]:
+        with self._lock:
+            self._expire(time.time())
+            return self._global.totals()
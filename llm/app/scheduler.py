@@ -0,0 +1,120 @@
+"""
+Controle de acesso ao modelo e cancelamento de gerações.
+
+O llama.cpp não suporta chamadas concorrentes na mesma instância do modelo,
+então as gerações passam por um slot único. Cada requisição carrega um
+CancelToken que é verificado a cada token gerado e enquanto a requisição
+aguarda o slot. Gerações em lote (pré-geração) só ocupam o slot quando não
+há requisições interativas aguardando.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+from . import metrics
+
+class GenerationCancelled(Exception):
+    """Indica que a geração foi interrompida antes de terminar."""
+
+    def __init__(self, reason: str = "cancelled"):
+        super().__init__(f"Geração cancelada: {reason}")
+        self.reason = reason
+
+class CancelToken:
+    """
+    Sinal de cancelamento compartilhado entre a requisição e a thread de geração.
+
+    Attributes:
+        deadline: Instante limite (time.monotonic) para a geração, ou None.
+        reason: Motivo do cancelamento ("disconnect", "deadline", ...).
+    """
+
+    def __init__(self, deadline: Optional[float] = None):
+        self._event = threading.Event()
+        self.deadline = deadline
+        self.reason: Optional[str] = None
+
+    def cancel(self, reason: str) -> None:
+        """Cancela a geração, mantendo o primeiro motivo informado."""
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        if not self._event.is_set() and self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel("deadline")
+        return self._event.is_set()
+
+    def raise_if_cancelled(self) -> None:
+        if self.cancelled:
+            raise GenerationCancelled(self.reason)
+
+INTERACTIVE = "interativa"
+BATCH = "lote"
+
+class GenerationSlot:
+    """
+    Slot exclusivo de uso do modelo, com contagem de requisições na fila.
+
+    waiting conta só as requisições interativas (a fila que os clientes
+    sentem); as de lote aguardando ficam em waiting_batch.
+    """
+
+    def __init__(self, poll_interval: float = 0.05):
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._state_lock = threading.Lock()
+        self.waiting = 0
+        self.waiting_batch = 0
+        self.active = 0
+        self.active_batch = 0
+
+    @property
+    def interactive_busy(self) -> bool:
+        """Há requisição interativa aguardando ou usando o slot."""
+        return self.waiting > 0 or self.active > self.active_batch
+
+    def _take(self, priority: str) -> bool:
+        if priority == BATCH and self.waiting:
+            # Cede a vez às interativas
+            time.sleep(self.poll_interval)
+            return False
+        return self._lock.acquire(timeout=self.poll_interval)
+
+    @contextmanager
+    def acquire(self, token: Optional[CancelToken] = None, priority: str = INTERACTIVE):
+        """
+        Aguarda o slot livre. Se o token for cancelado durante a espera,
+        levanta GenerationCancelled sem ocupar o slot. Com priority=BATCH,
+        só ocupa o slot quando nenhuma requisição interativa está aguardando.
+        """
+        counter = "waiting_batch" if priority == BATCH else "waiting"
+        with self._state_lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+        try:
+            while not self._take(priority):
+                if token is not None:
+                    token.raise_if_cancelled()
+        finally:
+            with self._state_lock:
+                setattr(self, counter, getattr(self, counter) - 1)
+        batch = 1 if priority == BATCH else 0
+        with self._state_lock:
+            self.active += 1
+            self.active_batch += batch
+        try:
+            if token is not None:
+                token.raise_if_cancelled()
+            yield
+        finally:
+            with self._state_lock:
+                self.active -= 1
+                self.active_batch -= batch
+            self._lock.release()
+
+generation_slot = GenerationSlot()
+metrics.register_gauge("generation_waiting", lambda: generation_slot.waiting)
+metrics.register_gauge("generation_active", lambda: generation_slot.active)
+metrics.register_gauge("generation_waiting_batch", lambda: generation_slot.waiting_batch)
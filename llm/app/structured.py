@@ -0,0 +1,112 @@
+"""
+Modo de saída estruturada.
+
+Em vez de gerar a resposta em prosa, o modelo é restrito por uma gramática
+do llama.cpp a emitir um JSON compacto com a intenção, os registros do aluno
+referenciados (por identificadores curtos listados no prompt) e um texto
+livre curto. A resposta final é montada por templates a partir dos dados do
+aluno, então os fatos citados vêm sempre do backend e o JSON pode ser
+validado contra eles.
+
+Exemplo de saída do modelo:
+    {"intencao": "nota", "registros": ["N2"], "texto": ""}
+"""
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+INTENTS = ("nota", "horario", "financeiro", "geral")
+
+# Gramática GBNF (llama.cpp) do JSON de resposta
+GRAMMAR = r'''
+root      ::= "{" ws "\"intencao\":" ws intencao "," ws "\"registros\":" ws registros "," ws "\"texto\":" ws texto ws "}"
+intencao  ::= "\"nota\"" | "\"horario\"" | "\"financeiro\"" | "\"geral\""
+registros ::= "[" ws ( registro ( "," ws registro )? ( "," ws registro )? ( "," ws registro )? ( "," ws registro )? )? ws "]"
+registro  ::= "\"" [NHF] [1-9] [0-9]? "\""
+texto     ::= "\"" [^"\\\n]* "\""
+ws        ::= " "?
+'''
+
+# Máximo de registros de cada tipo listados no prompt
+MAX_RECORDS = {"N": 10, "H": 10, "F": 3}
+_SOURCES = {"N": "notas", "H": "horarios", "F": "dados_financeiros"}
+
+def record_index(student_data: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """Registros do aluno por identificador curto (N1, H2, F1...)."""
+    index = {}
+    for prefix, key in _SOURCES.items():
+        for i, record in enumerate((student_data.get(key) or [])[:MAX_RECORDS[prefix]], 1):
+            index[f"{prefix}{i}"] = record
+    return index
+
+def build_structured_prompt(student_data: Dict[str, Any], question: str) -> str:
+    """Monta o prompt (formato Phi-3) com os registros identificados e o formato esperado."""
+    lines = []
+    for record_id, record in record_index(student_data).items():
+        if record_id.startswith("N"):
+            lines.append(f"{record_id}: nota {record.get('disciplina')} = {record.get('nota_final')}")
+        elif record_id.startswith("H"):
+            lines.append(f"{record_id}: aula {record.get('disciplina')} {record.get('dia_semana_display')} "
+                         f"{record.get('horario_inicio')}-{record.get('horario_fim')} {record.get('sala')}")
+        else:
+            lines.append(f"{record_id}: mensalidade R${record.get('mensalidade')} vence {record.get('data_vencimento')} "
+                         f"{record.get('status_pagamento_display')}")
+    registros = "\n".join(lines) or "(nenhum registro)"
+    return (
+        "<|user|>\n"
+        "Você é o UniChat, assistente acadêmico. Responda apenas com JSON no formato "
+        '{"intencao": "nota|horario|financeiro|geral", "registros": [ids], "texto": "..."}.\n'
+        "Em registros, cite os ids dos dados que respondem à pergunta. Use texto apenas para o que "
+        "os registros não dizem (no máximo uma frase curta); deixe vazio quando os registros bastam.\n"
+        f"Dados do aluno {student_data.get('nome', '')}:\n{registros}\n\n"
+        f"Pergunta: {question}<|end|>\n<|assistant|>"
+    )
+
+def parse_structured(text: str, student_data: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], List[str]]:
+    """
+    Interpreta o JSON gerado e confere os registros citados com os dados do aluno.
+
+    Returns:
+        (resposta, ids desconhecidos). resposta é None se o JSON for inválido;
+        ids que não existem nos dados são removidos da resposta.
+    """
+    try:
+        answer = json.loads(text)
+    except ValueError:
+        return None, []
+    if not isinstance(answer, dict) or answer.get("intencao") not in INTENTS:
+        return None, []
+    index = record_index(student_data)
+    cited = [r for r in answer.get("registros") or [] if isinstance(r, str)]
+    answer["registros"] = [r for r in dict.fromkeys(cited) if r in index]
+    answer["texto"] = str(answer.get("texto") or "").strip()
+    return answer, [r for r in cited if r not in index]
+
+def render_answer(answer: Dict[str, Any], student_data: Dict[str, Any]) -> str:
+    """Monta a resposta final a partir do JSON validado e dos dados do aluno."""
+    nome = student_data.get("nome", "Aluno") if student_data else "Aluno"
+    index = record_index(student_data or {})
+    records = [index[r] for r in answer["registros"]]
+    notas = [r for rid, r in zip(answer["registros"], records) if rid.startswith("N")]
+    horarios = [r for rid, r in zip(answer["registros"], records) if rid.startswith("H")]
+    financeiro = [r for rid, r in zip(answer["registros"], records) if rid.startswith("F")]
+
+    parts = []
+    if len(notas) == 1:
+        parts.append(f"Sua nota em {notas[0]['disciplina']} é {notas[0]['nota_final']}.")
+    elif notas:
+        parts.append("Suas notas: " + ", ".join(f"{n['disciplina']}: {n['nota_final']}" for n in notas) + ".")
+    if len(horarios) == 1:
+        h = horarios[0]
+        parts.append(f"Sua aula de {h['disciplina']} é {h['dia_semana_display']} das {h['horario_inicio']} "
+                     f"às {h['horario_fim']} na sala {h['sala']}.")
+    elif horarios:
+        parts.append("Seus horários: " + "; ".join(
+            f"{h['disciplina']}: {h['dia_semana_display']} {h['horario_inicio']}-{h['horario_fim']}" for h in horarios) + ".")
+    for f in financeiro:
+        parts.append(f"Sua mensalidade de R${f['mensalidade']} vence em {f['data_vencimento']} "
+                     f"e está com status {f['status_pagamento_display']}.")
+    if answer["texto"]:
+        parts.append(answer["texto"])
+    if not parts:
+        parts.append("Não encontrei essa informação nos seus dados. Se precisar, procure a coordenação.")
+    return f"Olá {nome}! " + " ".join(parts)
@@ -0,0 +1,95 @@
+"""
+Busca seletiva dos dados do aluno (LLM_FETCH_MODE=tools).
+
+Em vez de baixar o payload completo de /alunos/<id>/detalhes/, um roteador
+por palavras-chave decide, a partir da pergunta, quais dados são necessários
+(notas de uma disciplina, horários de um dia, mensalidades em aberto...) e o
+serviço chama apenas os endpoints por_aluno correspondentes do backend, com
+os filtros extraídos da pergunta. O tamanho do payload e do prompt passa a
+depender da pergunta, e não do histórico do aluno.
+"""
+import datetime
+import re
+import unicodedata
+from typing import Dict, List, NamedTuple, Optional
+
+# Ferramenta -> (caminho no backend, chave correspondente no AlunoDetalhadoSerializer)
+TOOLS = {
+    "perfil": ("/alunos/{aluno_id}/", None),
+    "notas": ("/notas/por_aluno/", "notas"),
+    "horarios": ("/horarios/por_aluno/", "horarios"),
+    "financeiro": ("/financeiro/por_aluno/", "dados_financeiros"),
+    "frequencias": ("/frequencias/por_aluno/", "frequencias"),
+}
+
+# Palavras-chave (sem acento) que indicam cada ferramenta
+_KEYWORDS = {
+    "notas": ("nota", "media", "prova", "trabalho", "desempenho", "aprovad", "reprovad", "boletim"),
+    "horarios": ("horario", "aula", "sala", "professor", "grade", "hoje", "amanha", "segunda", "terca",
+                 "quarta", "quinta", "sexta", "sabado", "domingo"),
+    "financeiro": ("mensalidade", "pagamento", "boleto", "financeir", "debito", "divida", "vencimento", "vence"),
+    "frequencias": ("frequencia", "falta", "presenca", "ausencia"),
+}
+# Sem correspondência: os mesmos dados usados pelo prompt padrão
+DEFAULT_TOOLS = ("notas", "horarios")
+
+DIAS = ["SEG", "TER", "QUA", "QUI", "SEX", "SAB", "DOM"]
+_DIAS_NOMES = {"segunda": "SEG", "terca": "TER", "quarta": "QUA", "quinta": "QUI", "sexta": "SEX",
+               "sabado": "SAB", "domingo": "DOM"}
+
+# Nome de disciplina: trecho com iniciais maiúsculas após "em", "de", "da"...
+_DISCIPLINA_RE = re.compile(
+    r"\b(?:em|de|da|do|na|no|sobre)\s+((?:[A-ZÀ-Ý][\wÀ-ÿ]*)(?:\s+(?:[A-ZÀ-Ý0-9][\wÀ-ÿ]*|I{1,3}|IV|V|de|da|do))*)"
+)
+
+class ToolCall(NamedTuple):
+    name: str
+    params: Dict[str, str]
+
+def _normalize(text: str) -> str:
+    return "".join(c for c in unicodedata.normalize("NFD", text.lower()) if unicodedata.category(c) != "Mn")
+
+def extract_disciplina(question: str) -> Optional[str]:
+    """Nome de disciplina citado na pergunta, se houver (ex.: "nota em Cálculo I")."""
+    for match in _DISCIPLINA_RE.finditer(question):
+        name = re.sub(r"\s+(?:de|da|do)$", "", match.group(1)).strip()
+        if _normalize(name) not in _DIAS_NOMES and _normalize(name.split()[0]) not in ("hoje", "amanha"):
+            return name
+    return None
+
+def extract_dia(question: str, today: Optional[datetime.date] = None) -> Optional[str]:
+    """Dia da semana (SEG, TER...) citado na pergunta, inclusive "hoje" e "amanhã"."""
+    normalized = _normalize(question)
+    today = today or datetime.date.today()
+    if "amanha" in normalized:
+        return DIAS[(today.weekday() + 1) % 7]
+    if "hoje" in normalized:
+        return DIAS[today.weekday()]
+    for name, code in _DIAS_NOMES.items():
+        if re.search(rf"\b{name}\b", normalized):
+            return code
+    return None
+
+def route(question: str, today: Optional[datetime.date] = None) -> List[ToolCall]:
+    """Escolhe as ferramentas (e filtros) necessárias para responder à pergunta."""
+    normalized = _normalize(question)
+    names = [name for name, words in _KEYWORDS.items() if any(w in normalized for w in words)]
+    if not names:
+        names = list(DEFAULT_TOOLS)
+    disciplina = extract_disciplina(question)
+    calls = []
+    for name in names:
+        params: Dict[str, str] = {}
+        if name in ("notas", "horarios", "frequencias") and disciplina:
+            params["disciplina"] = disciplina
+        if name == "horarios":
+            dia = extract_dia(question, today)
+            if dia and not disciplina:
+                params["dia_semana"] = dia
+        if name == "financeiro":
+            if "atrasad" in normalized:
+                params["status_pagamento"] = "ATRASADO"
+            elif any(w in normalized for w in ("pendente", "em aberto", "proxima", "vence")):
+                params["status_pagamento"] = "PENDENTE"
+        calls.append(ToolCall(name, params))
+    return calls
@@ -0,0 +1,5 @@
+"""
+Ferramentas de benchmark e teste de desempenho do serviço LLM.
+
+Execute a partir do diretório llm, por exemplo: python -m benchmarks.stages
+"""
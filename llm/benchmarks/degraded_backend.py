@@ -0,0 +1,141 @@
+"""
+Comportamento do serviço LLM com o backend degradado.
+
+Para cada cenário, sobe o backend substituto com latência e falhas
+injetadas e dispara consultas concorrentes pelo caminho real do serviço
+(fetch_student_data, ou generate_response completo com --generate). Mede a
+latência de cauda, a fração de consultas que ficaram sem dados do aluno e
+os contadores do serviço (fetch_*, backend_*), para avaliar timeouts,
+reservas, disjuntores e os dados antigos do backend_pool sob falhas
+(stale_hit_rate: fração das falhas totais atendidas com dados antigos). Cenários com uma lista
+de falhas sobem um backend substituto por item (BACKEND_URLS).
+
+Uso (a partir do diretório llm):
+
+    python -m benchmarks.degraded_backend --requests 200 --concurrency 8 --json degradado.json
+    python -m benchmarks.degraded_backend --scenarios lento,instavel --timeout 2 --generate
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import time
+from contextlib import ExitStack
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+os.environ.setdefault("LLM_BACKEND", "fake")
+
+from app import llm_service, metrics
+
+from .fixtures import FIXTURE_NAMES, QUESTIONS
+from .stats import percentile, summarize
+from .stub_backend import Faults, StubBackend
+
+# Cenários: argumentos de Faults (uma lista = um backend por item, na ordem de BACKEND_URLS)
+SCENARIOS: Dict[str, Any] = {
+    "saudavel": {"latency": "lognormal:15:0.3"},
+    "lento": {"latency": "lognormal:400:0.8"},
+    "cauda": {"latency": "pareto:20:1.2"},
+    "travamentos": {"latency": "lognormal:15:0.3", "hang_rate": 0.05},
+    "instavel": {"latency": "lognormal:30:0.5", "error_rate": 0.2},
+    "truncado": {"latency": "lognormal:15:0.3", "truncate_rate": 0.1, "reset_rate": 0.05},
+    # Primário com cauda longa e secundário saudável: a reserva deve acompanhar o mais rápido
+    "reserva": [{"latency": "pareto:20:1.2"}, {"latency": "lognormal:15:0.3"}],
+    # Primário fora do ar: o disjuntor deve tirá-lo da rota
+    "queda": [{"latency": "lognormal:15:0.3", "error_rate": 1.0}, {"latency": "lognormal:15:0.3"}],
+}
+
+async def run_scenario(urls: List[str], requests_total: int, concurrency: int, generate: bool) -> List[Dict[str, Any]]:
+    """Executa as consultas do cenário e retorna uma amostra por consulta."""
+    llm_service.set_backend_urls(urls)
+    semaphore = asyncio.Semaphore(concurrency)
+    student_ids = list(FIXTURE_NAMES)
+
+    async def one(i: int) -> Dict[str, Any]:
+        student_id = student_ids[i % len(student_ids)]
+        async with semaphore:
+            started = time.perf_counter()
+            if generate:
+                await llm_service.generate_response(QUESTIONS[i % len(QUESTIONS)], student_id)
+            else:
+                await llm_service.fetch_student_data(student_id)
+            return {"student_id": student_id, "latency_ms": (time.perf_counter() - started) * 1000}
+
+    return await asyncio.gather(*(one(i) for i in range(requests_total)))
+
+def counter_delta(before: Dict[str, float], after: Dict[str, float]) -> Dict[str, float]:
+    return {name: after[name] - before.get(name, 0) for name in after if after[name] != before.get(name, 0)}
+
+def print_table(results: List[Dict[str, Any]]) -> None:
+    header = f"{'cenário':<14}{'n':>6}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'máx ms':>10}{'sem dados':>11}  contadores"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        counters = ", ".join(f"{k}={v:g}" for k, v in sorted(r["counters"].items()) if k.startswith(("fetch_", "backend_")))
+        print(f"{r['scenario']:<14}{r['n']:>6}{r['p50']:>10.0f}{r['p90']:>10.0f}{r['p99']:>10.0f}{r['max']:>10.0f}"
+              f"{r['empty_rate'] * 100:>10.1f}%  {counters}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Serviço LLM com backend lento ou instável")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Cenários separados por vírgula")
+    parser.add_argument("--requests", type=int, default=100, help="Consultas por cenário")
+    parser.add_argument("--concurrency", type=int, default=8, help="Consultas simultâneas")
+    parser.add_argument("--timeout", type=float, default=None,
+                        help="Timeout das chamadas ao backend em s (padrão: BACKEND_TIMEOUT do serviço)")
+    parser.add_argument("--hang-s", type=float, default=None,
+                        help="Duração dos travamentos (padrão: 1 s além do timeout)")
+    parser.add_argument("--generate", action="store_true",
+                        help="Executa generate_response completo (modelo do LLM_BACKEND; padrão: fake)")
+    parser.add_argument("--coalesce", action="store_true",
+                        help="Mantém o agrupamento de buscas simultâneas do mesmo aluno (padrão: desativado, "
+                             "para que cada consulta chegue ao backend)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", dest="json_path", default=None, help="Arquivo JSON de saída")
+    args = parser.parse_args()
+
+    llm_service.coalesce_enabled = args.coalesce
+    if args.timeout is not None:
+        llm_service.backend_timeout = args.timeout
+    hang_s = args.hang_s if args.hang_s is not None else llm_service.backend_timeout + 1
+    if args.generate:
+        llm_service.setup_llm()
+
+    results = []
+    for name in args.scenarios.split(","):
+        specs = SCENARIOS[name] if isinstance(SCENARIOS[name], list) else [SCENARIOS[name]]
+        faults = [Faults(**{"hang_s": hang_s, **spec}, seed=args.seed + i) for i, spec in enumerate(specs)]
+        before = metrics.snapshot()["counters"]
+        with ExitStack() as stack:
+            stubs = [stack.enter_context(StubBackend(faults=f)) for f in faults]
+            samples = asyncio.run(run_scenario([stub.url for stub in stubs], args.requests, args.concurrency,
+                                               args.generate))
+        counters = counter_delta(before, metrics.snapshot()["counters"])
+        latencies = [s["latency_ms"] for s in samples]
+        # Dados antigos (backend_pool): consultados só quando todos os endpoints falham
+        hits, misses = counters.get("fetch_stale", 0), counters.get("fetch_stale_missing", 0)
+        results.append({
+            "scenario": name, "faults": SCENARIOS[name], "backend_outcomes": [dict(f.stats) for f in faults], "unit": "ms", **summarize(latencies),
+            "p99": percentile(latencies, 99),
+            # Consultas respondidas sem os dados do aluno (todas as tentativas de busca falharam)
+            "empty_rate": sum(v for k, v in counters.items() if k.startswith("fetch_failed_")) / len(samples),
+            "stale_hit_rate": hits / (hits + misses) if hits + misses else None,
+            "counters": counters, "samples": latencies,
+        })
+
+    print_table(results)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "suite": "degraded_backend",
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "host": platform.node(),
+                "backend_timeout_s": llm_service.backend_timeout,
+                "generate": args.generate,
+                "results": results,
+            }, f, ensure_ascii=False, indent=2)
+        print(f"Resultados salvos em {args.json_path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Dados de alunos fixos para benchmarks, no formato do AlunoDetalhadoSerializer
+(endpoint /api/alunos/<id>/detalhes/ do backend).
+
+Os dados são gerados de forma determinística, então todas as execuções usam
+exatamente o mesmo conteúdo.
+"""
+from typing import Any, Dict, List
+
+DISCIPLINAS = [
+    "Cálculo I", "Física I", "Algoritmos", "Estruturas de Dados", "Banco de Dados",
+    "Engenharia de Software", "Redes de Computadores", "Sistemas Operacionais",
+    "Inteligência Artificial", "Machine Learning", "Compiladores", "Álgebra Linear",
+]
+DIAS = [("SEG", "Segunda-feira"), ("TER", "Terça-feira"), ("QUA", "Quarta-feira"),
+        ("QUI", "Quinta-feira"), ("SEX", "Sexta-feira")]
+PROFESSORES = ["Prof. Silva", "Prof. Santos", "Prof. Oliveira", "Prof. Souza", "Prof. Lima"]
+
+def build_student(student_id: int, n_disciplinas: int, n_semestres: int, n_chats: int) -> Dict[str, Any]:
+    """Monta um aluno com notas, horários, frequências, dados financeiros e histórico."""
+    nome = f"Aluno Benchmark {student_id}"
+    disciplinas = [DISCIPLINAS[i % len(DISCIPLINAS)] for i in range(n_disciplinas)]
+    notas: List[Dict[str, Any]] = []
+    horarios: List[Dict[str, Any]] = []
+    frequencias: List[Dict[str, Any]] = []
+    financeiro: List[Dict[str, Any]] = []
+    matriculas: List[Dict[str, Any]] = []
+    for s in range(n_semestres):
+        semestre = f"{2024 - s // 2}.{2 - s % 2}"
+        matriculas.append({
+            "id": student_id * 100 + s, "aluno": student_id, "aluno_nome": nome, "semestre": semestre,
+            "data_matricula": f"{2024 - s // 2}-0{1 + 6 * (s % 2)}-10", "ativa": s == 0,
+            "disciplinas": [
+                {"id": student_id * 1000 + s * 20 + i, "matricula": student_id * 100 + s, "codigo": f"CC{i:03d}",
+                 "nome": d, "creditos": 4, "professor": PROFESSORES[i % len(PROFESSORES)],
+                 "status": "EM_ANDAMENTO" if s == 0 else "APROVADO",
+                 "status_display": "Em andamento" if s == 0 else "Aprovado"}
+                for i, d in enumerate(disciplinas)
+            ],
+        })
+        for i, disciplina in enumerate(disciplinas):
+            nota_final = round(5 + ((student_id * 7 + s * 3 + i * 11) % 50) / 10, 2)
+            notas.append({
+                "id": len(notas) + 1, "aluno": student_id, "aluno_nome": nome, "disciplina": disciplina,
+                "nota_prova": f"{nota_final:.2f}", "nota_trabalho": f"{min(10, nota_final + 0.5):.2f}",
+                "nota_final": f"{nota_final:.2f}", "data_avaliacao": f"{2024 - s // 2}-0{4 + s % 2}-15",
+                "semestre": semestre,
+            })
+            if s == 0:
+                dia, dia_display = DIAS[i % len(DIAS)]
+                inicio = 8 + 2 * (i // len(DIAS))
+                horarios.append({
+                    "id": len(horarios) + 1, "aluno": student_id, "aluno_nome": nome, "disciplina": disciplina,
+                    "dia_semana": dia, "dia_semana_display": dia_display,
+                    "horario_inicio": f"{inicio:02d}:00:00", "horario_fim": f"{inicio + 2:02d}:00:00",
+                    "sala": f"Sala {100 + i}", "professor": PROFESSORES[i % len(PROFESSORES)], "semestre": semestre,
+                })
+                for semana in range(4):
+                    frequencias.append({
+                        "id": len(frequencias) + 1, "aluno": student_id, "aluno_nome": nome, "disciplina": disciplina,
+                        "data": f"2024-03-{4 + semana * 7:02d}", "status": "PRESENTE" if (i + semana) % 5 else "AUSENTE",
+                        "status_display": "Presente" if (i + semana) % 5 else "Ausente",
+                    })
+        for mes in range(6):
+            pago = s > 0 or mes < 3
+            financeiro.append({
+                "id": len(financeiro) + 1, "aluno": student_id, "aluno_nome": nome, "mensalidade": "1250.00",
+                "data_vencimento": f"{2024 - s // 2}-{mes + 1 + 6 * (s % 2):02d}-10",
+                "status_pagamento": "PAGO" if pago else "PENDENTE",
+                "status_pagamento_display": "Pago" if pago else "Pendente",
+                "data_pagamento": f"{2024 - s // 2}-{mes + 1 + 6 * (s % 2):02d}-08" if pago else None,
+                "valor_pago": "1250.00" if pago else None, "descricao": "Mensalidade",
+            })
+    historico = [
+        {"id": i + 1, "aluno": student_id, "aluno_nome": nome,
+         "pergunta": f"Qual é a minha nota em {disciplinas[i % len(disciplinas)]}?",
+         "resposta": f"Sua nota em {disciplinas[i % len(disciplinas)]} é {notas[i % len(notas)]['nota_final']}.",
+         "timestamp": f"2024-03-{1 + i % 28:02d}T10:00:00Z", "dados_contextuais": None}
+        for i in range(n_chats)
+    ]
+    return {
+        "id": student_id, "nome": nome, "email": f"aluno{student_id}@example.com",
+        "matricula": f"2024{student_id:04d}", "curso": "Ciência da Computação", "semestre": n_semestres,
+        "data_nascimento": "2002-05-20", "endereco": "Rua Benchmark, 100",
+        "notas": notas, "horarios": horarios, "frequencias": frequencias, "dados_financeiros": financeiro,
+        "matriculas": matriculas, "historico_chat": historico,
+    }
+
+# Alunos de referência: do calouro ao veterano com histórico longo
+STUDENTS = {
+    1: build_student(1, n_disciplinas=3, n_semestres=1, n_chats=0),
+    2: build_student(2, n_disciplinas=6, n_semestres=4, n_chats=10),
+    3: build_student(3, n_disciplinas=8, n_semestres=10, n_chats=60),
+}
+FIXTURE_NAMES = {1: "pequeno", 2: "medio", 3: "grande"}
+
+# Perguntas usadas nos benchmarks (uma por tema)
+QUESTIONS = [
+    "Qual é a minha nota em Cálculo I?",
+    "Qual é o meu horário na segunda-feira?",
+    "Quando vence a minha próxima mensalidade?",
+]
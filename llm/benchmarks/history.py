@@ -0,0 +1,334 @@
+"""
+Histórico de benchmarks com detecção automática de regressões.
+
+Os resultados das suítes (stages, model_matrix, prompt_encoding, degraded_backend,
+test_llm_carga e bench_backend do backend) são gravados em um arquivo JSONL
+local, somente com acréscimos, uma linha por série de amostras, identificada
+pelo commit do git, pelo host, pelo perfil e pelo modelo. O comando compare confronta um commit com a linha
+de base e aponta regressões estatisticamente significativas (teste de
+Mann-Whitney) em latência, vazão, memória ou número de consultas; séries com
+poucas amostras para o teste são marcadas como "amostras insuficientes".
+
+Uso (a partir do diretório llm):
+
+    python -m benchmarks.stages --json stages.json
+    python -m benchmarks.history record stages.json
+    python -m benchmarks.history compare --baseline main
+    python -m benchmarks.history list
+
+Variáveis de ambiente:
+    BENCH_HISTORY: Arquivo do histórico (padrão: benchmarks/history.jsonl).
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from app.platform_config import ACTIVE_PROFILE
+
+from .stats import percentile
+
+DEFAULT_HISTORY_PATH = os.getenv("BENCH_HISTORY", os.path.join(os.path.dirname(__file__), "history.jsonl"))
+# Campos que identificam uma série ao longo do histórico
+KEY_FIELDS = ("suite", "metric", "host", "profile", "model")
+
+def git_commit(ref: str = "HEAD") -> Tuple[Optional[str], bool]:
+    """Retorna (hash do commit, árvore com alterações não commitadas) para a referência."""
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short=12", ref], cwd=cwd, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None, False
+    if ref != "HEAD":
+        return commit, False
+    status = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=cwd,
+                            capture_output=True, text=True).stdout
+    return commit, bool(status.strip())
+
+# Extração de séries de cada suíte
+
+def _series(metric: str, unit: str, direction: str, samples: List[float], **key) -> Dict[str, Any]:
+    """direction: "lower" quando valores menores são melhores, "higher" no caso contrário."""
+    return {"metric": metric, "unit": unit, "direction": direction,
+            "samples": [s for s in samples if s is not None], **key}
+
+def _from_stages(report: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    for r in report["results"]:
+        model = report.get("model", "-") if r["backend"] == "llama_cpp" else r["backend"]
+        yield _series(f"{r['stage']}/{r['fixture']}", r["unit"], "lower", r["samples"],
+                      profile=r["profile"], model=model)
+
+def _from_model_matrix(report: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    for r in report["results"]:
+        if "error" in r:
+            continue
+        key = {"profile": report.get("profile"), "model": os.path.basename(r["model"])}
+        runs = r.get("runs", [])
+        yield _series("latency", "s", "lower", [run["latency_s"] for run in runs], **key)
+        yield _series("prefill_tps", "tokens/s", "higher", [run["prefill_tps"] for run in runs], **key)
+        yield _series("decode_tps", "tokens/s", "higher", [run["decode_tps"] for run in runs], **key)
+        yield _series("term_coverage", "fração", "higher", [run["coverage"] for run in runs], **key)
+        yield _series("load", "s", "lower", [r["load_s"]], **key)
+        yield _series("peak_rss", "MB", "lower", [r["peak_rss_mb"]], **key)
+
+def _from_carga(report: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    config = report.get("configuracao", {})
+    key = {"profile": f"{config.get('modo')}-c{config.get('concorrencia')}-r{config.get('taxa')}"}
+    ok = [a for a in report.get("amostras", []) if a["status"] == 200]
+    yield _series("latency", "ms", "lower", [a["latencia_ms"] for a in ok], **key)
+    yield _series("ttft", "ms", "lower", [a["ttft_ms"] for a in ok], **key)
+    yield _series("tokens_per_s", "tokens/s", "higher", [a["tokens_por_s"] for a in ok], **key)
+    if report.get("vazao_rps") is not None:
+        yield _series("throughput", "req/s", "higher", [report["vazao_rps"]], **key)
+
+def _from_degraded(report: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    for r in report["results"]:
+        key = {"profile": r["scenario"]}
+        yield _series("latency", "ms", "lower", r["samples"], **key)
+        yield _series("empty_rate", "fração", "lower", [r["empty_rate"]], **key)
+
+def _from_prompt_encoding(report: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    for r in report["results"]:
+        key = {"profile": f"{report.get('profile')}-{r['format']}", "model": report.get("model")}
+        sizes = r["prompt_sizes"].values()
+        yield _series("prompt_tokens", "tokens", "lower", [s["base"]["tokens"] for s in sizes], **key)
+        yield _series("ttft", "s", "lower", [run["ttft_s"] for run in r["runs"]], **key)
+        yield _series("term_coverage", "fração", "higher", [run["coverage"] for run in r["runs"]], **key)
+
+_EXTRACTORS = {
+    "llm_stages": _from_stages,
+    "model_matrix": _from_model_matrix,
+    "carga_llm": _from_carga,
+    "degraded_backend": _from_degraded,
+    "prompt_encoding": _from_prompt_encoding,
+}
+
+def extract_series(report: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Converte o JSON de uma suíte em séries; relatórios com "series" já estão no formato final."""
+    suite = report.get("suite")
+    if "series" in report:
+        series = list(report["series"])
+    elif suite in _EXTRACTORS:
+        series = list(_EXTRACTORS[suite](report))
+    else:
+        raise ValueError(f"Suíte desconhecida: {suite!r}")
+    return [s for s in series if s["samples"]]
+
+# Armazenamento
+
+def record(report: Dict[str, Any], path: str = DEFAULT_HISTORY_PATH, commit: Optional[str] = None,
+           host: Optional[str] = None, profile: Optional[str] = None, model: Optional[str] = None) -> int:
+    """Acrescenta ao histórico as séries de um relatório. Retorna o número de linhas gravadas."""
+    head, dirty = git_commit()
+    entry = {
+        "suite": report["suite"],
+        "commit": commit or report.get("commit") or head,
+        "dirty": dirty if commit is None else False,
+        "recorded_at": datetime.now(timezone.utc).isoformat(),
+        "created_at": report.get("created_at") or report.get("data"),
+        "host": host or report.get("host") or platform.node(),
+    }
+    lines = []
+    for series in extract_series(report):
+        line = {**entry, **series}
+        line["profile"] = profile or series.get("profile") or report.get("profile") or ACTIVE_PROFILE
+        line["model"] = model or series.get("model") or report.get("model") or "-"
+        lines.append(json.dumps(line, ensure_ascii=False))
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        for line in lines:
+            f.write(line + "\n")
+    return len(lines)
+
+def load(path: str = DEFAULT_HISTORY_PATH) -> List[Dict[str, Any]]:
+    """Lê todas as linhas do histórico, na ordem em que foram gravadas."""
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+# Comparação
+
+def mann_whitney(a: List[float], b: List[float]) -> Optional[float]:
+    """
+    Valor-p bilateral do teste U de Mann-Whitney pela aproximação normal, com
+    correção para empates. Retorna None com menos de 3 amostras em um dos lados.
+    """
+    n1, n2 = len(a), len(b)
+    if n1 < 3 or n2 < 3:
+        return None
+    ranked = sorted([(v, 0) for v in a] + [(v, 1) for v in b])
+    ranks = [0.0] * len(ranked)
+    ties = 0.0
+    i = 0
+    while i < len(ranked):
+        j = i
+        while j + 1 < len(ranked) and ranked[j + 1][0] == ranked[i][0]:
+            j += 1
+        for k in range(i, j + 1):
+            ranks[k] = (i + j) / 2 + 1
+        t = j - i + 1
+        ties += t ** 3 - t
+        i = j + 1
+    u1 = sum(r for r, (_, group) in zip(ranks, ranked) if group == 0) - n1 * (n1 + 1) / 2
+    n = n1 + n2
+    variance = n1 * n2 / 12 * ((n + 1) - ties / (n * (n - 1)))
+    if variance <= 0:
+        return 1.0
+    z = (abs(u1 - n1 * n2 / 2) - 0.5) / math.sqrt(variance)
+    return math.erfc(max(z, 0) / math.sqrt(2))
+
+def _resolve(commit: str, commits: List[str]) -> Optional[str]:
+    """
+    Aceita o hash registrado, um prefixo dele que identifique um único commit
+    do histórico, o hash completo ou qualquer referência do git.
+
+    Raises:
+        ValueError: Se o prefixo corresponder a mais de um commit do histórico.
+    """
+    if commit in commits:
+        return commit
+    matches = [c for c in commits if c and (c.startswith(commit) or commit.startswith(c))]
+    if len(matches) > 1:
+        raise ValueError(f"Commit ambíguo: {commit!r} corresponde a {', '.join(matches)}")
+    if matches:
+        return matches[0]
+    resolved, _ = git_commit(commit)
+    return resolved if resolved in commits else None
+
+def compare(entries: List[Dict[str, Any]], baseline: Optional[str] = None, candidate: Optional[str] = None,
+            alpha: float = 0.01, min_change: float = 0.05) -> List[Dict[str, Any]]:
+    """
+    Compara, série a série, as amostras do commit candidato com as da linha de base.
+
+    Sem candidate, usa o último commit registrado; sem baseline, o commit
+    registrado imediatamente antes dele. Uma série regrediu quando a mediana
+    piorou mais que min_change (relativo) e o teste de Mann-Whitney rejeita a
+    igualdade com nível alpha. Séries com menos de 3 amostras em um dos lados
+    (memória, tempo de carga) não têm teste: uma variação acima de min_change
+    aparece como "amostras insuficientes", sem contar como regressão.
+
+    Raises:
+        ValueError: Se os commits não forem encontrados ou forem ambíguos.
+    """
+    commits = list(dict.fromkeys(e["commit"] for e in entries))
+    if candidate is None:
+        candidate = commits[-1] if commits else None
+    else:
+        candidate = _resolve(candidate, commits)
+    if candidate is None:
+        raise ValueError("Commit candidato não encontrado no histórico")
+    if baseline is None:
+        earlier = commits[:commits.index(candidate)]
+        baseline = earlier[-1] if earlier else None
+    else:
+        baseline = _resolve(baseline, commits)
+    if baseline is None or baseline == candidate:
+        raise ValueError("Linha de base não encontrada no histórico")
+
+    samples = {baseline: defaultdict(list), candidate: defaultdict(list)}
+    meta = {}
+    for e in entries:
+        if e["commit"] in samples:
+            key = tuple(e.get(field) for field in KEY_FIELDS)
+            samples[e["commit"]][key].extend(e["samples"])
+            meta[key] = e
+
+    report = []
+    for key in sorted(set(samples[baseline]) & set(samples[candidate]), key=str):
+        before, after = samples[baseline][key], samples[candidate][key]
+        base_median, cand_median = percentile(before, 50), percentile(after, 50)
+        direction = meta[key]["direction"]
+        if base_median:
+            change = (cand_median - base_median) / abs(base_median)
+        else:
+            change = 0.0 if cand_median == base_median else math.inf
+        worse = change > min_change if direction == "lower" else change < -min_change
+        better = change < -min_change if direction == "lower" else change > min_change
+        p_value = mann_whitney(before, after)
+        if p_value is None:
+            status = "amostras insuficientes" if worse or better else "ok"
+        else:
+            status = "regressão" if worse and p_value < alpha else "melhora" if better and p_value < alpha else "ok"
+        report.append({
+            **dict(zip(KEY_FIELDS, key)), "unit": meta[key]["unit"], "direction": direction,
+            "baseline": baseline, "candidate": candidate, "n_baseline": len(before), "n_candidate": len(after),
+            "baseline_median": base_median, "candidate_median": cand_median, "change": change, "p_value": p_value,
+            "status": status,
+        })
+    return report
+
+def print_report(rows: List[Dict[str, Any]], only_changes: bool = False) -> None:
+    header = (f"{'suíte':<13}{'métrica':<34}{'perfil':<18}{'modelo':<22}{'base':>11}{'atual':>11}"
+              f"{'var.':>9}{'p':>9}  status")
+    print(header)
+    print("-" * len(header))
+    for r in rows:
+        if only_changes and r["status"] == "ok":
+            continue
+        p_value = "-" if r["p_value"] is None else f"{r['p_value']:.4f}"
+        print(f"{r['suite']:<13}{r['metric'][:33]:<34}{str(r['profile'])[:17]:<18}{str(r['model'])[:21]:<22}"
+              f"{r['baseline_median']:>11.3f}{r['candidate_median']:>11.3f}{r['change'] * 100:>8.1f}%"
+              f"{p_value:>9}  {r['status']}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Histórico de benchmarks e detecção de regressões")
+    parser.add_argument("--history", default=DEFAULT_HISTORY_PATH, help="Arquivo JSONL do histórico")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    rec = sub.add_parser("record", help="Acrescenta resultados de benchmark ao histórico")
+    rec.add_argument("reports", nargs="+", help="Arquivos JSON gerados pelas suítes")
+    rec.add_argument("--commit", default=None, help="Commit a registrar (padrão: HEAD)")
+    rec.add_argument("--host", default=None, help="Identificação da máquina (padrão: hostname)")
+    rec.add_argument("--profile", default=None, help="Perfil da máquina (padrão: o do relatório ou o ativo)")
+    rec.add_argument("--model", default=None, help="Modelo (padrão: o do relatório)")
+
+    cmp_ = sub.add_parser("compare", help="Compara um commit com a linha de base")
+    cmp_.add_argument("--baseline", default=None, help="Commit ou referência da linha de base (padrão: o anterior)")
+    cmp_.add_argument("--candidate", default=None, help="Commit avaliado (padrão: o último registrado)")
+    cmp_.add_argument("--alpha", type=float, default=0.01, help="Nível de significância do teste")
+    cmp_.add_argument("--min-change", type=float, default=0.05, help="Variação relativa mínima considerada")
+    cmp_.add_argument("--all", action="store_true", help="Exibe também as séries sem alteração")
+    cmp_.add_argument("--json", dest="json_path", default=None, help="Arquivo JSON de saída")
+
+    sub.add_parser("list", help="Lista os commits registrados")
+    args = parser.parse_args()
+
+    if args.command == "record":
+        for path in args.reports:
+            with open(path, encoding="utf-8") as f:
+                count = record(json.load(f), args.history, args.commit, args.host, args.profile, args.model)
+            print(f"{path}: {count} séries gravadas em {args.history}")
+        return
+
+    entries = load(args.history)
+    if args.command == "list":
+        runs = defaultdict(set)
+        for e in entries:
+            runs[(e["commit"], e.get("dirty", False), e["host"])].add(e["suite"])
+        for (commit, dirty, host), suites in runs.items():
+            print(f"{commit}{'+' if dirty else ' '} {host:<20} {', '.join(sorted(suites))}")
+        return
+
+    try:
+        rows = compare(entries, args.baseline, args.candidate, args.alpha, args.min_change)
+    except ValueError as e:
+        parser.error(str(e))
+    print_report(rows, only_changes=not args.all)
+    regressions = [r for r in rows if r["status"] == "regressão"]
+    insufficient = sum(1 for r in rows if r["status"] == "amostras insuficientes")
+    print(f"{len(rows)} séries comparadas, {len(regressions)} regressões, {insufficient} com amostras insuficientes")
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"suite": "history_compare", "results": rows}, f, ensure_ascii=False, indent=2)
+    sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+"""
+Matriz de comparação de modelos e quantizações.
+
+Roda o conjunto de perguntas de testes_prontos.py (backend) contra cada
+arquivo de modelo e registra tempo de carga, pico de RSS, tokens/s de
+prefill e de decode e a taxa de acerto dos termos_esperados. O resultado é
+uma tabela ordenada por qualidade e latência, com os modelos da fronteira de
+Pareto marcados, para escolher o melhor ponto para cada classe de máquina.
+
+Cada modelo é avaliado em um subprocesso separado, para que o pico de RSS
+e o tempo de carga de um não contaminem os do outro.
+
+Uso (a partir do diretório llm):
+
+    python -m benchmarks.model_matrix --models-dir /app/models --json matriz.json
+    python -m benchmarks.model_matrix --models phi3-q4.gguf,phi3-q5.gguf,phi3-q8.gguf
+"""
+import argparse
+import datetime
+import glob
+import json
+import os
+import resource
+import runpy
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+from app import kv_cache, llm_service
+from app.fake_llama import FakeLlama, fake_config_from_env
+from app.platform_config import ACTIVE_PROFILE, get_model_config
+
+from .fixtures import STUDENTS
+
+DEFAULT_QUESTIONS_PATH = os.path.join(
+    os.path.dirname(__file__), "..", "..", "backend", "api", "management", "commands", "testes_prontos.py"
+)
+RESULT_PREFIX = "MODEL_MATRIX_RESULT "
+
+def load_questions(path: str) -> List[Dict[str, Any]]:
+    """Carrega TESTES_CONSULTAS do arquivo testes_prontos.py."""
+    return runpy.run_path(path)["TESTES_CONSULTAS"]
+
+def peak_rss_mb() -> float:
+    """Pico de memória residente do processo atual, em MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa em KB; macOS, em bytes
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+def check_terms(answer: str, terms: List[str]) -> float:
+    """Fração dos termos esperados presentes na resposta (mesma regra do test_llm_avancado)."""
+    if not terms:
+        return 1.0
+    return sum(1 for term in terms if term.lower() in answer.lower()) / len(terms)
+
+class ModelRunner:
+    """Executa prompts em um modelo GGUF (ou simulado) medindo prefill e decode."""
+
+    def __init__(self, model_path: str, profile: str):
+        self.config = get_model_config("gguf", profile)
+        started = time.perf_counter()
+        if model_path == "fake":
+            self.model = FakeLlama(n_ctx=self.config.get("n_ctx", 4096), **fake_config_from_env())
+        else:
+            import llama_cpp
+            kwargs = llm_service.llama_kwargs(self.config)
+            kwargs["verbose"] = False
+            self.model = llama_cpp.Llama(model_path=model_path, **kwargs)
+        self.load_s = time.perf_counter() - started
+
+    def run(self, prompt: str, max_tokens: int) -> Dict[str, Any]:
+        self.model.reset()
+        prompt_tokens = len(self.model.tokenize(prompt.encode("utf-8")))
+        pieces = []
+        started = time.perf_counter()
+        first = None
+        for chunk in self.model(prompt, max_tokens=max_tokens, stop=["<|end|>"], temperature=0.7, stream=True):
+            text = chunk["choices"][0]["text"]
+            if text:
+                if first is None:
+                    first = time.perf_counter()
+                pieces.append(text)
+        ended = time.perf_counter()
+        decode_s = ended - first if first is not None else 0
+        return {
+            "answer": "".join(pieces).strip(),
+            "latency_s": ended - started,
+            "prompt_tokens": prompt_tokens,
+            "ttft_s": first - started if first is not None else None,
+            "prefill_tps": prompt_tokens / (first - started) if first is not None else None,
+            "decode_tps": (len(pieces) - 1) / decode_s if len(pieces) > 1 and decode_s > 0 else None,
+        }
+
+class GPT4AllRunner:
+    """Executa prompts em um modelo GPT4All (.bin); sem medição por token."""
+
+    def __init__(self, model_path: str, profile: str):
+        from langchain.llms import GPT4All
+        started = time.perf_counter()
+        self.model = GPT4All(model=model_path, verbose=False)
+        self.load_s = time.perf_counter() - started
+
+    def run(self, prompt: str, max_tokens: int) -> Dict[str, Any]:
+        started = time.perf_counter()
+        answer = self.model(prompt)
+        return {"answer": answer.strip(), "latency_s": time.perf_counter() - started, "prompt_tokens": None,
+                "ttft_s": None, "prefill_tps": None, "decode_tps": None}
+
+def kv_mb_per_sequence(runner) -> Optional[float]:
+    """Memória estimada do cache KV de uma sequência, com a precisão do perfil."""
+    model = getattr(runner, "model", None)
+    if not hasattr(model, "metadata"):
+        return None
+    config = runner.config
+    size = kv_cache.bytes_per_sequence(model.metadata or {}, model.n_ctx(), config.get("type_k", "f16"),
+                                       config.get("type_v", "f16"))
+    return size / 1024 / 1024 if size else None
+
+def evaluate_model(model_path: str, questions: List[Dict[str, Any]], student_id: int,
+                   profile: str, max_tokens: Optional[int]) -> Dict[str, Any]:
+    """Avalia um modelo no processo atual (chamado pelo subprocesso --worker)."""
+    runner_class = GPT4AllRunner if model_path.endswith(".bin") else ModelRunner
+    runner = runner_class(model_path, profile)
+    max_tokens = max_tokens or get_model_config("gguf", profile).get("max_tokens", 500)
+    system_prompt = llm_service.create_system_prompt(STUDENTS[student_id])
+    runs = run_questions(runner, questions, system_prompt, max_tokens)
+
+    def mean(key):
+        values = [r[key] for r in runs if r[key] is not None]
+        return sum(values) / len(values) if values else None
+
+    return {
+        "model": model_path,
+        "size_gb": os.path.getsize(model_path) / 1024 ** 3 if os.path.exists(model_path) else None,
+        "load_s": runner.load_s,
+        "peak_rss_mb": peak_rss_mb(),
+        "kv_mb_per_sequence": kv_mb_per_sequence(runner),
+        "prefill_tps": mean("prefill_tps"),
+        "decode_tps": mean("decode_tps"),
+        "latency_s": mean("latency_s"),
+        "pass_rate": sum(1 for r in runs if r["passed"]) / len(runs) if runs else None,
+        "term_coverage": mean("coverage"),
+        "runs": runs,
+    }
+
+def run_questions(runner, questions: List[Dict[str, Any]], system_prompt: str,
+                  max_tokens: int) -> List[Dict[str, Any]]:
+    """Roda as perguntas com o prompt de sistema informado e confere os termos esperados."""
+    runs = []
+    for question in questions:
+        if question.get("categoria") == "conversacao":
+            first = runner.run(llm_service.build_prompt(system_prompt, question["pergunta_inicial"]), max_tokens)
+            prompt = (llm_service.build_prompt(system_prompt, question["pergunta_inicial"]) + first["answer"]
+                      + f"<|end|>\n<|user|>\n{question['pergunta_sequencia']}<|end|>\n<|assistant|>")
+        else:
+            text = question["pergunta"]
+            if question.get("contexto") == "data_atual":
+                hoje = datetime.datetime.now()
+                dia = ["segunda", "terça", "quarta", "quinta", "sexta", "sábado", "domingo"][hoje.weekday()]
+                text = f"Hoje é {dia}, {hoje.day}/{hoje.month}. {text}"
+            prompt = llm_service.build_prompt(system_prompt, text)
+        run = runner.run(prompt, max_tokens)
+        coverage = check_terms(run["answer"], question.get("termos_esperados", []))
+        runs.append({"categoria": question.get("categoria"), "coverage": coverage, "passed": coverage == 1.0,
+                     **{k: v for k, v in run.items() if k != "answer"}})
+    return runs
+
+def run_worker(model_path: str, args) -> Dict[str, Any]:
+    """Avalia um modelo em um subprocesso e devolve o resultado."""
+    cmd = [sys.executable, "-m", "benchmarks.model_matrix", "--worker", model_path,
+           "--questions", args.questions, "--student", str(args.student), "--profile", args.profile]
+    if args.max_tokens:
+        cmd += ["--max-tokens", str(args.max_tokens)]
+    proc = subprocess.run(cmd, capture_output=True, text=True,
+                          cwd=os.path.join(os.path.dirname(__file__), ".."))
+    for line in reversed(proc.stdout.splitlines()):
+        if line.startswith(RESULT_PREFIX):
+            return json.loads(line[len(RESULT_PREFIX):])
+    return {"model": model_path, "error": (proc.stderr or proc.stdout)[-500:]}
+
+def rank(results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Ordena por taxa de acerto e latência, marcando a fronteira de Pareto (qualidade x latência)."""
+    ok = [r for r in results if "error" not in r]
+    for r in ok:
+        r["pareto"] = not any(
+            o is not r and o["pass_rate"] >= r["pass_rate"] and o["latency_s"] <= r["latency_s"]
+            and (o["pass_rate"] > r["pass_rate"] or o["latency_s"] < r["latency_s"])
+            for o in ok
+        )
+    ok.sort(key=lambda r: (-r["pass_rate"], -(r["term_coverage"] or 0), r["latency_s"]))
+    return ok + [r for r in results if "error" in r]
+
+def print_table(results: List[Dict[str, Any]]) -> None:
+    header = (f"{'#':<3}{'modelo':<40}{'GB':>6}{'carga s':>9}{'RSS MB':>9}{'prefill t/s':>13}"
+              f"{'decode t/s':>12}{'latência s':>12}{'acerto':>9}{'termos':>9}  pareto")
+    print(header)
+    print("-" * len(header))
+    for i, r in enumerate(results, 1):
+        name = os.path.basename(r["model"])[:38]
+        if "error" in r:
+            print(f"{i:<3}{name:<40}  ERRO: {r['error'].splitlines()[-1] if r['error'] else ''}")
+            continue
+
+        def fmt(value, width, digits=1):
+            return f"{'-':>{width}}" if value is None else f"{value:>{width}.{digits}f}"
+
+        print(f"{i:<3}{name:<40}{fmt(r['size_gb'], 6, 2)}{fmt(r['load_s'], 9)}{fmt(r['peak_rss_mb'], 9, 0)}"
+              f"{fmt(r['prefill_tps'], 13)}{fmt(r['decode_tps'], 12)}{fmt(r['latency_s'], 12, 2)}"
+              f"{r['pass_rate'] * 100:>8.0f}%{r['term_coverage'] * 100:>8.0f}%  {'*' if r['pareto'] else ''}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara modelos/quantizações em latência, memória e qualidade")
+    parser.add_argument("--models", default=None, help="Arquivos de modelo separados por vírgula ('fake' = simulado)")
+    parser.add_argument("--models-dir", default=None, help="Diretório com arquivos .gguf/.bin a comparar")
+    parser.add_argument("--questions", default=os.getenv("TESTES_PRONTOS_PATH", DEFAULT_QUESTIONS_PATH),
+                        help="Caminho do testes_prontos.py")
+    parser.add_argument("--student", type=int, default=2, help="Aluno das fixtures usado como contexto")
+    parser.add_argument("--profile", default=ACTIVE_PROFILE, help="Perfil do platform_config para carregar os modelos")
+    parser.add_argument("--max-tokens", type=int, default=None, help="Limite de tokens gerados (padrão: o do perfil)")
+    parser.add_argument("--json", dest="json_path", default=None, help="Arquivo JSON de saída")
+    parser.add_argument("--worker", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    args.questions = os.path.abspath(args.questions)
+
+    if args.worker:
+        result = evaluate_model(args.worker, load_questions(args.questions), args.student, args.profile, args.max_tokens)
+        print(RESULT_PREFIX + json.dumps(result))
+        return
+
+    models = [m for m in (args.models or "").split(",") if m]
+    if args.models_dir:
+        models += sorted(glob.glob(os.path.join(args.models_dir, "*.gguf")) + glob.glob(os.path.join(args.models_dir, "*.bin")))
+    if not models:
+        parser.error("informe --models ou --models-dir")
+
+    results = []
+    for model_path in models:
+        print(f"Avaliando {model_path}...", flush=True)
+        results.append(run_worker(os.path.abspath(model_path) if model_path != "fake" else model_path, args))
+    results = rank(results)
+    print_table(results)
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"suite": "model_matrix", "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                       "profile": args.profile, "student": args.student, "results": results},
+                      f, ensure_ascii=False, indent=2)
+        print(f"Resultados salvos em {args.json_path}")
+
+if __name__ == "__main__":
+    main()
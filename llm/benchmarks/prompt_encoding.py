@@ -0,0 +1,106 @@
+"""
+Comparação dos formatos do contexto do aluno no prompt (LLM_CONTEXT_FORMAT).
+
+Para cada formato, conta os tokens do prompt de sistema de cada aluno das
+fixtures com o tokenizer do modelo e roda as perguntas de testes_prontos.py
+(backend), registrando o tempo até o primeiro token (prefill), a latência e
+a taxa de acerto dos termos_esperados. O objetivo é confirmar que o formato
+compacto reduz o custo de prefill sem perder qualidade nas respostas.
+
+Uso (a partir do diretório llm):
+
+    python -m benchmarks.prompt_encoding --model /app/models/Phi-3-mini-4k-instruct-q4.gguf
+    python -m benchmarks.prompt_encoding --model fake --json formatos.json
+"""
+import argparse
+import datetime
+import json
+import os
+from typing import Any, Dict, List
+
+from app import llm_service
+from app.platform_config import ACTIVE_PROFILE, get_model_config
+
+from .fixtures import STUDENTS
+from .model_matrix import DEFAULT_QUESTIONS_PATH, GPT4AllRunner, ModelRunner, load_questions, run_questions
+
+FORMATS = ("verbose", "compact")
+
+def prompt_tokens(runner, student_data: Dict[str, Any], context_format: str) -> Dict[str, int]:
+    """Tokens e caracteres do prompt de sistema do aluno no formato informado."""
+    prompt = llm_service.create_system_prompt(student_data, context_format)
+    tokens = len(runner.model.tokenize(prompt.encode("utf-8"))) if hasattr(runner.model, "tokenize") else None
+    return {"chars": len(prompt), "tokens": tokens}
+
+def evaluate_format(runner, context_format: str, questions: List[Dict[str, Any]], student_id: int,
+                    max_tokens: int) -> Dict[str, Any]:
+    sizes = {}
+    for sid, student in STUDENTS.items():
+        # Com financeiro e frequência, como no modo de busca seletiva
+        data = {**student, "_consultas": ["dados_financeiros", "frequencias"]}
+        sizes[sid] = {"base": prompt_tokens(runner, student, context_format),
+                      "tools": prompt_tokens(runner, data, context_format)}
+    system_prompt = llm_service.create_system_prompt(STUDENTS[student_id], context_format)
+    runs = run_questions(runner, questions, system_prompt, max_tokens)
+
+    def mean(key):
+        values = [r[key] for r in runs if r.get(key) is not None]
+        return sum(values) / len(values) if values else None
+
+    return {
+        "format": context_format,
+        "prompt_sizes": sizes,
+        "ttft_s": mean("ttft_s"),
+        "latency_s": mean("latency_s"),
+        "pass_rate": sum(1 for r in runs if r["passed"]) / len(runs) if runs else None,
+        "term_coverage": mean("coverage"),
+        "runs": runs,
+    }
+
+def print_table(results: List[Dict[str, Any]]) -> None:
+    base = results[0]
+    header = f"{'formato':<10}" + "".join(f"{f'aluno {sid}':>14}" for sid in STUDENTS) + \
+             f"{'TTFT ms':>10}{'latência s':>12}{'acerto':>9}{'termos':>9}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        cells = ""
+        for sid in STUDENTS:
+            tokens = r["prompt_sizes"][sid]["base"]["tokens"]
+            ref = base["prompt_sizes"][sid]["base"]["tokens"]
+            delta = f" {(tokens - ref) / ref * 100:+.0f}%" if r is not base and ref and tokens else ""
+            cells += f"{str(tokens) + delta:>14}"
+        ttft = f"{r['ttft_s'] * 1000:>10.1f}" if r["ttft_s"] is not None else f"{'-':>10}"
+        print(f"{r['format']:<10}{cells}{ttft}{r['latency_s']:>12.2f}"
+              f"{r['pass_rate'] * 100:>8.0f}%{r['term_coverage'] * 100:>8.0f}%")
+    print("(tokens do prompt de sistema por aluno das fixtures, sem financeiro e frequência)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara os formatos do contexto do aluno em tokens, prefill e acerto")
+    parser.add_argument("--model", default=llm_service.model_path, help="Arquivo do modelo ('fake' = simulado)")
+    parser.add_argument("--questions", default=os.getenv("TESTES_PRONTOS_PATH", DEFAULT_QUESTIONS_PATH),
+                        help="Caminho do testes_prontos.py")
+    parser.add_argument("--student", type=int, default=2, help="Aluno das fixtures usado nas perguntas")
+    parser.add_argument("--profile", default=ACTIVE_PROFILE, help="Perfil do platform_config para carregar o modelo")
+    parser.add_argument("--max-tokens", type=int, default=None, help="Limite de tokens gerados (padrão: o do perfil)")
+    parser.add_argument("--json", dest="json_path", default=None, help="Arquivo JSON de saída")
+    args = parser.parse_args()
+
+    runner = (GPT4AllRunner if args.model.endswith(".bin") else ModelRunner)(args.model, args.profile)
+    max_tokens = args.max_tokens or get_model_config("gguf", args.profile).get("max_tokens", 500)
+    questions = load_questions(os.path.abspath(args.questions))
+    results = []
+    for context_format in FORMATS:
+        print(f"Avaliando o formato {context_format}...", flush=True)
+        results.append(evaluate_format(runner, context_format, questions, args.student, max_tokens))
+    print_table(results)
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"suite": "prompt_encoding", "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                       "profile": args.profile, "model": os.path.basename(args.model), "student": args.student,
+                       "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"Resultados salvos em {args.json_path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+Servidor de arquivos com suporte a Range, substituto do host do modelo nos
+testes do provisionamento (app.model_download).
+
+Serve um único arquivo (ou bytes em memória) em qualquer caminho, com
+Accept-Ranges, ETag, If-Range e respostas 206. Pode limitar a banda por
+conexão (para que o ganho das conexões paralelas apareça) e encerrar uma
+fração das respostas no meio da transferência. Os sorteios usam uma semente
+fixa.
+
+    python -m benchmarks.range_server /app/models/modelo.gguf --port 8002
+    python -m benchmarks.range_server modelo.gguf --mbps 20 --abort-rate 0.1
+"""
+import argparse
+import hashlib
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+class RangeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "RangeServer._Server"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self._serve(body=False)
+
+    def do_GET(self):
+        try:
+            self._serve(body=True)
+        except (BrokenPipeError, ConnectionResetError):
+            # Cliente desistiu da resposta (ex.: sondagem sem suporte a Range)
+            self.close_connection = True
+
+    def _serve(self, body: bool) -> None:
+        srv = self.server
+        data = srv.data
+        size = len(data)
+        start, end, status = 0, size - 1, 200
+        match = _RANGE_RE.match(self.headers.get("Range", ""))
+        if_range = self.headers.get("If-Range")
+        if match and srv.ranges and (if_range is None or if_range == srv.etag):
+            first, last = match.groups()
+            if first:
+                start, end = int(first), min(int(last), size - 1) if last else size - 1
+            else:
+                start = max(size - int(last), 0)
+            if start >= size or start > end:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            status = 206
+        with srv.lock:
+            srv.requests += 1
+            abort = body and srv.rng.random() < srv.abort_rate
+        self.send_response(status)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("ETag", srv.etag)
+        if srv.ranges:
+            self.send_header("Accept-Ranges", "bytes")
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.end_headers()
+        if not body:
+            return
+        # Encerra a conexão na metade do trecho
+        stop = start + (end - start + 1) // 2 if abort else end + 1
+        piece = 64 * 1024
+        offset = start
+        while offset < stop:
+            chunk = data[offset:min(offset + piece, stop)]
+            self.wfile.write(chunk)
+            offset += len(chunk)
+            if srv.bytes_per_s:
+                time.sleep(len(chunk) / srv.bytes_per_s)
+        if abort:
+            with srv.lock:
+                srv.aborted += 1
+            self.close_connection = True
+
+class RangeServer:
+    """Servidor do arquivo rodando em uma thread (use como context manager)."""
+
+    class _Server(ThreadingHTTPServer):
+        daemon_threads = True
+
+        def handle_error(self, request, client_address):
+            # Clientes que desistem da conexão (sondagem, downloads cancelados) não são erros do servidor
+            if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+                super().handle_error(request, client_address)
+
+    def __init__(self, data: bytes, host: str = "127.0.0.1", port: int = 0, mbps: float = 0.0,
+                 abort_rate: float = 0.0, ranges: bool = True, seed: int = 0):
+        self.server = self._Server((host, port), RangeHandler)
+        self.server.lock = threading.Lock()
+        self.server.rng = random.Random(seed)
+        self.server.bytes_per_s = mbps * 1024 * 1024
+        self.server.abort_rate = abort_rate
+        self.server.ranges = ranges
+        self.server.requests = 0
+        self.server.aborted = 0
+        self.set_data(data)
+        self._thread: Optional[threading.Thread] = None
+
+    def set_data(self, data: bytes) -> None:
+        """Troca o conteúdo servido (e o ETag), simulando uma nova versão do arquivo."""
+        self.server.data = data
+        self.server.etag = f'"{hashlib.sha256(data).hexdigest()[:16]}"'
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/modelo.gguf"
+
+    @property
+    def requests(self) -> int:
+        return self.server.requests
+
+    @property
+    def aborted(self) -> int:
+        return self.server.aborted
+
+    def start(self) -> "RangeServer":
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self) -> "RangeServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor de arquivo com suporte a Range")
+    parser.add_argument("path", help="Arquivo a servir")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8002)
+    parser.add_argument("--mbps", type=float, default=0.0, help="Banda por conexão em MB/s (0 = sem limite)")
+    parser.add_argument("--abort-rate", type=float, default=0.0, help="Fração de respostas encerradas no meio")
+    parser.add_argument("--no-ranges", action="store_true", help="Ignora Range (sempre 200)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    with open(args.path, "rb") as f:
+        data = f.read()
+    server = RangeServer(data, args.host, args.port, args.mbps, args.abort_rate, not args.no_ranges, args.seed)
+    print(f"Servindo {args.path} em {server.url}")
+    server.server.serve_forever()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""
+Teste de longa duração (soak) para vazamentos de memória do serviço LLM.
+
+Executa consultas continuamente pelo caminho real do serviço (generate_response
+e stream_response, incluindo streams interrompidos pelo cliente) contra o
+backend substituto, com o modelo simulado ou um GGUF real. Periodicamente
+registra o RSS e um snapshot do tracemalloc; ao final, calcula a inclinação
+(MB/h) do RSS e da memória rastreada após o aquecimento, lista os locais de
+alocação que mais cresceram e falha se a inclinação passar do limite.
+
+Uso (a partir do diretório llm):
+
+    python -m benchmarks.soak --duration 4h --interval 5m --max-slope 5 --json soak.json
+    LLM_BACKEND=llama_cpp python -m benchmarks.soak --duration 12h --tracemalloc-frames 0
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import platform
+import random
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+os.environ.setdefault("LLM_BACKEND", "fake")
+
+from app import llm_service, metrics
+from app.scheduler import CancelToken
+
+from .fixtures import FIXTURE_NAMES, QUESTIONS
+from .stub_backend import StubBackend
+
+# Alocações do próprio tracemalloc e do carregamento de módulos não interessam
+_TRACE_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+]
+
+def parse_duration(text: str) -> float:
+    """Converte "90", "90s", "15m" ou "4h" em segundos."""
+    units = {"s": 1, "m": 60, "h": 3600}
+    if text and text[-1] in units:
+        return float(text[:-1]) * units[text[-1]]
+    return float(text)
+
+def slope_per_hour(points: List[Dict[str, Any]], key: str) -> Optional[float]:
+    """Inclinação (por hora) da regressão linear de key em função do tempo."""
+    xs = [p["t_s"] / 3600 for p in points if p.get(key) is not None]
+    ys = [p[key] for p in points if p.get(key) is not None]
+    if len(xs) < 3:
+        return None
+    mean_x, mean_y = sum(xs) / len(xs), sum(ys) / len(ys)
+    var_x = sum((x - mean_x) ** 2 for x in xs)
+    if var_x == 0:
+        return None
+    return sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / var_x
+
+def top_growth(baseline: tracemalloc.Snapshot, current: tracemalloc.Snapshot, limit: int,
+               group_by: str) -> List[Dict[str, Any]]:
+    """Locais de alocação com maior crescimento desde o snapshot de referência."""
+    stats = current.filter_traces(_TRACE_FILTERS).compare_to(baseline.filter_traces(_TRACE_FILTERS), group_by)
+    return [
+        {"site": [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback],
+         "size_diff_kb": stat.size_diff / 1024, "size_kb": stat.size / 1024, "count_diff": stat.count_diff}
+        for stat in stats[:limit] if stat.size_diff > 0
+    ]
+
+class Driver:
+    """Gera carga contínua no serviço com um número fixo de clientes simultâneos."""
+
+    def __init__(self, concurrency: int, cancel_rate: float, seed: int):
+        self.concurrency = concurrency
+        self.cancel_rate = cancel_rate
+        self.rng = random.Random(seed)
+        self.requests = 0
+        self.errors = 0
+        self._stop = asyncio.Event()
+
+    async def one(self) -> None:
+        question = self.rng.choice(QUESTIONS)
+        student_id = self.rng.choice(list(FIXTURE_NAMES))
+        roll = self.rng.random()
+        if roll < self.cancel_rate:
+            # Cliente que desiste no meio do stream
+            token = CancelToken()
+            async for i, _ in _aenumerate(llm_service.stream_response(question, student_id, cancel_token=token)):
+                if i >= 3:
+                    token.cancel("disconnect")
+                    break
+        elif roll < 0.5:
+            async for _ in llm_service.stream_response(question, student_id):
+                pass
+        else:
+            await llm_service.generate_response(question, student_id)
+
+    async def client(self) -> None:
+        while not self._stop.is_set():
+            try:
+                await self.one()
+            except Exception:
+                self.errors += 1
+            self.requests += 1
+
+    async def run(self, duration: float, checkpoint, interval: float) -> None:
+        clients = [asyncio.create_task(self.client()) for _ in range(self.concurrency)]
+        started = time.monotonic()
+        try:
+            while True:
+                elapsed = time.monotonic() - started
+                checkpoint(elapsed)
+                if elapsed >= duration:
+                    break
+                await asyncio.sleep(min(interval, duration - elapsed))
+        finally:
+            self._stop.set()
+            await asyncio.gather(*clients, return_exceptions=True)
+
+async def _aenumerate(iterator):
+    i = 0
+    async for item in iterator:
+        yield i, item
+        i += 1
+
+def main():
+    parser = argparse.ArgumentParser(description="Teste de longa duração para vazamentos de memória")
+    parser.add_argument("--duration", default="1h", help="Duração total (ex.: 90s, 30m, 4h)")
+    parser.add_argument("--warmup", default="5m", help="Aquecimento excluído do cálculo da inclinação")
+    parser.add_argument("--interval", default="1m", help="Intervalo entre snapshots")
+    parser.add_argument("--concurrency", type=int, default=4, help="Clientes simultâneos")
+    parser.add_argument("--cancel-rate", type=float, default=0.1, help="Fração de streams interrompidos")
+    parser.add_argument("--max-slope", type=float, default=5.0, help="Crescimento máximo do RSS em MB/h")
+    parser.add_argument("--max-traced-slope", type=float, default=None,
+                        help="Crescimento máximo da memória rastreada pelo tracemalloc em MB/h")
+    parser.add_argument("--tracemalloc-frames", type=int, default=5,
+                        help="Profundidade das pilhas do tracemalloc (0 desativa)")
+    parser.add_argument("--top", type=int, default=15, help="Locais de alocação listados")
+    parser.add_argument("--backend-url", default=None, help="URL do backend (padrão: backend substituto local)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", dest="json_path", default=None, help="Arquivo JSON de saída")
+    args = parser.parse_args()
+
+    duration = parse_duration(args.duration)
+    warmup = min(parse_duration(args.warmup), duration)
+    interval = parse_duration(args.interval)
+    group_by = "traceback" if args.tracemalloc_frames > 1 else "lineno"
+
+    llm_service.setup_llm()
+    if args.tracemalloc_frames > 0:
+        tracemalloc.start(args.tracemalloc_frames)
+
+    driver = Driver(args.concurrency, args.cancel_rate, args.seed)
+    points: List[Dict[str, Any]] = []
+    state: Dict[str, Any] = {"baseline": None, "last": None}
+
+    def checkpoint(elapsed: float) -> None:
+        gc.collect()
+        point = {"t_s": elapsed, "requests": driver.requests, "errors": driver.errors,
+                 "rss_mb": llm_service.get_memory_usage(), "traced_mb": None}
+        if tracemalloc.is_tracing():
+            point["traced_mb"] = tracemalloc.get_traced_memory()[0] / 1024 / 1024
+            if elapsed >= warmup:
+                snapshot = tracemalloc.take_snapshot()
+                if state["baseline"] is None:
+                    state["baseline"] = snapshot
+                state["last"] = snapshot
+        points.append(point)
+        traced = "-" if point["traced_mb"] is None else f"{point['traced_mb']:.1f}"
+        print(f"[{elapsed / 60:7.1f} min] requisições={driver.requests:<7} erros={driver.errors:<4} "
+              f"rss={point['rss_mb']:.1f} MB rastreada={traced} MB", flush=True)
+
+    def run() -> None:
+        asyncio.run(driver.run(duration, checkpoint, interval))
+
+    if args.backend_url:
+        llm_service.set_backend_urls([args.backend_url])
+        run()
+    else:
+        with StubBackend() as stub:
+            llm_service.set_backend_urls([stub.url])
+            run()
+
+    measured = [p for p in points if p["t_s"] >= warmup]
+    rss_slope = slope_per_hour(measured, "rss_mb")
+    traced_slope = slope_per_hour(measured, "traced_mb")
+    growth = []
+    if state["baseline"] is not None and state["last"] is not state["baseline"]:
+        growth = top_growth(state["baseline"], state["last"], args.top, group_by)
+
+    failures = []
+    if rss_slope is not None and rss_slope > args.max_slope:
+        failures.append(f"RSS cresce {rss_slope:.2f} MB/h (limite {args.max_slope})")
+    if args.max_traced_slope is not None and traced_slope is not None and traced_slope > args.max_traced_slope:
+        failures.append(f"memória rastreada cresce {traced_slope:.2f} MB/h (limite {args.max_traced_slope})")
+
+    print()
+    print(f"Inclinação do RSS: {'-' if rss_slope is None else f'{rss_slope:.2f}'} MB/h; "
+          f"memória rastreada: {'-' if traced_slope is None else f'{traced_slope:.2f}'} MB/h")
+    if growth:
+        print("Maiores crescimentos desde o fim do aquecimento:")
+        for g in growth:
+            print(f"  {g['size_diff_kb']:>10.1f} KB  {g['count_diff']:>+8} objetos  {g['site'][-1]}")
+            for frame in reversed(g["site"][:-1]):
+                print(f"  {'':>30}{frame}")
+    for failure in failures:
+        print(f"FALHA: {failure}")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "suite": "soak",
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "host": platform.node(),
+                "model": llm_service.model_path if llm_service.llm_backend != "fake" else "fake",
+                "config": {"duration_s": duration, "warmup_s": warmup, "interval_s": interval,
+                           "concurrency": args.concurrency, "cancel_rate": args.cancel_rate,
+                           "tracemalloc_frames": args.tracemalloc_frames},
+                "rss_slope_mb_per_h": rss_slope,
+                "traced_slope_mb_per_h": traced_slope,
+                "top_growth": growth,
+                "counters": metrics.snapshot()["counters"],
+                "points": points,
+                "passed": not failures,
+                "failures": failures,
+            }, f, ensure_ascii=False, indent=2)
+        print(f"Resultados salvos em {args.json_path}")
+    raise SystemExit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""
+Micro-benchmark por etapa do serviço LLM.
+
+Mede separadamente, para cada aluno das fixtures e cada perfil do
+platform_config: busca de contexto, create_system_prompt, tokenização,
+prefill (tempo até o primeiro token), decode (tempo por token) e
+pós-processamento (o que o serviço faz depois do último token: junção do
+texto, contagem dos tokens do prompt para a cota, registro do uso e log da
+resposta). Assim é possível saber se uma mudança afetou o prefill, o decode
+ou o overhead em Python.
+
+Uso (a partir do diretório llm):
+
+    python -m benchmarks.stages --backend fake --repeat 5 --json stages.json
+    python -m benchmarks.stages --backend llama_cpp --model /app/models/modelo.gguf
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from app import llm_service
+from app.fake_llama import FakeLlama, fake_config_from_env
+from app.platform_config import get_model_config, get_profile_names
+from app.quota import QuotaTracker, Usage
+
+from .fixtures import FIXTURE_NAMES, QUESTIONS, STUDENTS
+from .stats import summarize
+from .stub_backend import StubBackend
+
+STAGES = ["context_fetch", "system_prompt", "tokenize", "prefill", "decode_per_token", "postprocess"]
+
+def load_model(backend: str, profile: str, model_path: Optional[str]):
+    """Carrega o modelo do backend informado com a configuração do perfil."""
+    config = get_model_config("gguf", profile)
+    if backend == "fake":
+        return FakeLlama(model_path=model_path, n_ctx=config.get("n_ctx", 4096), **fake_config_from_env())
+    import llama_cpp
+    kwargs = llm_service.llama_kwargs(config)
+    kwargs["verbose"] = False
+    return llama_cpp.Llama(model_path=model_path, **kwargs)
+
+def time_generation(model, prompt: str, max_tokens: int):
+    """Retorna (prefill_ms, [ms por token], trechos gerados) para uma geração do zero."""
+    if hasattr(model, "reset"):
+        # Descarta o cache de KV para medir o prefill completo
+        model.reset()
+    pieces = []
+    intervals = []
+    started = time.perf_counter()
+    prefill_ms = None
+    last = started
+    for chunk in model(prompt, max_tokens=max_tokens, stop=["<|end|>"], temperature=0.7, stream=True):
+        text = chunk["choices"][0]["text"]
+        if not text:
+            continue
+        now = time.perf_counter()
+        if prefill_ms is None:
+            prefill_ms = (now - started) * 1000
+        else:
+            intervals.append((now - last) * 1000)
+        last = now
+        pieces.append(text)
+    return prefill_ms, intervals, pieces
+
+def postprocess(model, prompt: str, pieces: List[str], student_id: int, tracker: QuotaTracker,
+                started: float) -> str:
+    """Trabalho de _generate_gguf e _stream_answer depois do último token (sem a geração)."""
+    usage = Usage()
+    usage.add(len(model.tokenize(prompt.encode("utf-8"))), len(pieces), time.perf_counter() - started)
+    text = "".join(pieces).strip()
+    tracker.record(student_id, usage)
+    llm_service._log_response("gguf", student_id, text, started)
+    return text
+
+def bench_python_stages(backend_url: str, repeat: int, warmup: int) -> List[Dict[str, Any]]:
+    """Mede as etapas que não dependem do modelo."""
+    llm_service.set_backend_urls([backend_url])
+    loop = asyncio.new_event_loop()
+    results = []
+    try:
+        for student_id, fixture in FIXTURE_NAMES.items():
+            samples = {"context_fetch": [], "system_prompt": []}
+            for i in range(warmup + repeat):
+                started = time.perf_counter()
+                data = loop.run_until_complete(llm_service.fetch_student_data(student_id))
+                fetch_ms = (time.perf_counter() - started) * 1000
+
+                started = time.perf_counter()
+                llm_service.create_system_prompt(data)
+                prompt_ms = (time.perf_counter() - started) * 1000
+
+                if i >= warmup:
+                    samples["context_fetch"].append(fetch_ms)
+                    samples["system_prompt"].append(prompt_ms)
+            for stage, values in samples.items():
+                results.append(_result("-", "-", fixture, stage, values))
+    finally:
+        loop.close()
+    return results
+
+def bench_model_stages(model, backend: str, profile: str, repeat: int, warmup: int,
+                       max_tokens: Optional[int]) -> List[Dict[str, Any]]:
+    """Mede tokenização, prefill, decode e pós-processamento de um modelo carregado com o perfil informado."""
+    config = get_model_config("gguf", profile)
+    max_tokens = max_tokens or config.get("max_tokens", 500)
+    tracker = QuotaTracker()
+    results = []
+    for student_id, fixture in FIXTURE_NAMES.items():
+        system_prompt = llm_service.create_system_prompt(STUDENTS[student_id])
+        samples = {"tokenize": [], "prefill": [], "decode_per_token": [], "postprocess": []}
+        for i in range(warmup + repeat):
+            prompt = llm_service.build_prompt(system_prompt, QUESTIONS[i % len(QUESTIONS)])
+            started = time.perf_counter()
+            model.tokenize(prompt.encode("utf-8"))
+            tokenize_ms = (time.perf_counter() - started) * 1000
+            prefill_ms, intervals, pieces = time_generation(model, prompt, max_tokens)
+            started = time.perf_counter()
+            postprocess(model, prompt, pieces, student_id, tracker, started)
+            post_ms = (time.perf_counter() - started) * 1000
+            if i >= warmup:
+                samples["postprocess"].append(post_ms)
+                samples["tokenize"].append(tokenize_ms)
+                if prefill_ms is not None:
+                    samples["prefill"].append(prefill_ms)
+                samples["decode_per_token"].extend(intervals)
+        for stage, values in samples.items():
+            results.append(_result(backend, profile, fixture, stage, values))
+    return results
+
+def _result(backend: str, profile: str, fixture: str, stage: str, samples: List[float]) -> Dict[str, Any]:
+    return {"backend": backend, "profile": profile, "fixture": fixture, "stage": stage, "unit": "ms",
+            **summarize(samples), "samples": samples}
+
+def print_table(results: List[Dict[str, Any]]) -> None:
+    """Imprime os resultados em uma tabela de ordem estável."""
+    order = {stage: i for i, stage in enumerate(STAGES)}
+    fixtures = {name: i for i, name in enumerate(FIXTURE_NAMES.values())}
+    rows = sorted(results, key=lambda r: (order[r["stage"]], r["backend"], r["profile"], fixtures[r["fixture"]]))
+    # Colunas de texto com a largura do maior valor (ex.: perfil low_memory)
+    columns = [("etapa", "stage"), ("backend", "backend"), ("perfil", "profile"), ("aluno", "fixture")]
+    widths = [max([len(title)] + [len(str(r[key])) for r in rows]) + 2 for title, key in columns]
+    header = ("".join(f"{title:<{w}}" for (title, _), w in zip(columns, widths))
+              + f"{'n':>6}{'média':>11}{'p50':>11}{'p90':>11}")
+    print(header)
+    print("-" * len(header))
+    for r in rows:
+        labels = "".join(f"{r[key]:<{w}}" for (_, key), w in zip(columns, widths))
+        values = "".join(f"{'-':>11}" if r[k] is None else f"{r[k]:>11.3f}" for k in ("mean", "p50", "p90"))
+        print(f"{labels}{r['n']:>6}{values}")
+    print("(tempos em ms)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark por etapa do serviço LLM")
+    parser.add_argument("--backend", choices=["fake", "llama_cpp", "both"], default="fake",
+                        help="Modelo usado nas etapas de tokenização, prefill e decode")
+    parser.add_argument("--model", default=os.getenv("LLM_MODEL_PATH", "/app/models/Phi-3-mini-4k-instruct-q4.gguf"),
+                        help="Arquivo GGUF para o backend llama_cpp")
+    parser.add_argument("--profiles", default=",".join(get_profile_names()),
+                        help="Perfis do platform_config, separados por vírgula (padrão: todos)")
+    parser.add_argument("--repeat", type=int, default=5, help="Repetições medidas por aluno")
+    parser.add_argument("--warmup", type=int, default=1, help="Repetições de aquecimento descartadas")
+    parser.add_argument("--max-tokens", type=int, default=None, help="Limite de tokens gerados (padrão: o do perfil)")
+    parser.add_argument("--backend-url", default=None,
+                        help="URL do backend para a busca de contexto (padrão: backend substituto local)")
+    parser.add_argument("--json", dest="json_path", default=None, help="Arquivo JSON de saída")
+    args = parser.parse_args()
+
+    results = []
+    if args.backend_url:
+        results.extend(bench_python_stages(args.backend_url, args.repeat, args.warmup))
+    else:
+        with StubBackend() as stub:
+            results.extend(bench_python_stages(stub.url, args.repeat, args.warmup))
+
+    backends = ["fake", "llama_cpp"] if args.backend == "both" else [args.backend]
+    for backend in backends:
+        for profile in args.profiles.split(","):
+            model = load_model(backend, profile, args.model)
+            results.extend(bench_model_stages(model, backend, profile, args.repeat, args.warmup, args.max_tokens))
+            del model
+
+    print_table(results)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "suite": "llm_stages",
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "host": platform.node(),
+                "model": args.model if "llama_cpp" in backends else "fake",
+                "results": results,
+            }, f, ensure_ascii=False, indent=2)
+        print(f"Resultados salvos em {args.json_path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+"""Funções estatísticas compartilhadas pelos benchmarks."""
+from typing import Dict, List, Optional
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    """Percentil p (0-100) com interpolação linear."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * p / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+def summarize(samples: List[float]) -> Dict[str, Optional[float]]:
+    """Resumo de uma série de amostras: n, média, p50, p90, mínimo e máximo."""
+    return {
+        "n": len(samples),
+        "mean": sum(samples) / len(samples) if samples else None,
+        "p50": percentile(samples, 50),
+        "p90": percentile(samples, 90),
+        "min": min(samples) if samples else None,
+        "max": max(samples) if samples else None,
+    }
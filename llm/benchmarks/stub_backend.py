@@ -0,0 +1,250 @@
+"""
+Backend substituto que serve /api/alunos/<id>/detalhes/ a partir das fixtures,
+além do perfil (/api/alunos/<id>/) e dos endpoints por_aluno com os mesmos
+filtros do backend real, usados pela busca seletiva (LLM_FETCH_MODE=tools).
+Aceita também o registro de uso dos alunos (POST /api/uso-llm/registrar/).
+
+Pode injetar latência (com distribuição configurável) e falhas: respostas de
+erro, travamentos mais longos que o timeout do cliente, corpos truncados e
+conexões encerradas no meio da resposta. Os sorteios usam uma semente fixa,
+então um mesmo cenário produz a mesma sequência de falhas.
+
+Pode ser usado em processo (StubBackend) ou como servidor avulso:
+
+    python -m benchmarks.stub_backend --port 8001
+    python -m benchmarks.stub_backend --latency lognormal:80:0.8 --error-rate 0.05 --truncate-rate 0.02
+"""
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs, urlsplit
+
+from .fixtures import STUDENTS
+
+_DETALHES_RE = re.compile(r"^/api/alunos/(\d+)/detalhes/?$")
+_ALUNO_RE = re.compile(r"^/api/alunos/(\d+)/?$")
+# Endpoint por_aluno -> (chave nas fixtures, filtros: parâmetro -> (campo, correspondência parcial))
+_POR_ALUNO = {
+    "/api/notas/por_aluno/": ("notas", {"disciplina": ("disciplina", True), "semestre": ("semestre", False)}),
+    "/api/horarios/por_aluno/": ("horarios", {"disciplina": ("disciplina", True), "dia_semana": ("dia_semana", False)}),
+    "/api/frequencias/por_aluno/": ("frequencias", {"disciplina": ("disciplina", True)}),
+    "/api/financeiro/por_aluno/": ("dados_financeiros", {"status_pagamento": ("status_pagamento", False)}),
+}
+_PERFIL_EXCLUDE = ("notas", "horarios", "frequencias", "dados_financeiros", "matriculas", "historico_chat")
+
+class Latency:
+    """
+    Distribuição de latência em ms, a partir de uma especificação textual:
+
+        const:MS            valor fixo
+        uniform:MIN:MAX     uniforme entre MIN e MAX
+        exp:MEDIA           exponencial com a média informada
+        lognormal:MEDIANA:SIGMA
+                            log-normal (cauda longa), SIGMA em escala log
+        pareto:MIN:ALFA     Pareto (cauda pesada); ALFA menor = cauda mais pesada
+    """
+
+    def __init__(self, spec: str = "const:0"):
+        kind, *params = spec.split(":")
+        self.spec = spec
+        self.kind = kind
+        self.params = [float(p) for p in params]
+        expected = {"const": 1, "uniform": 2, "exp": 1, "lognormal": 2, "pareto": 2}
+        if kind not in expected or len(self.params) != expected[kind]:
+            raise ValueError(f"Especificação de latência inválida: {spec!r}")
+
+    def sample(self, rng: random.Random) -> float:
+        p = self.params
+        if self.kind == "const":
+            return p[0]
+        if self.kind == "uniform":
+            return rng.uniform(p[0], p[1])
+        if self.kind == "exp":
+            return rng.expovariate(1 / p[0]) if p[0] > 0 else 0.0
+        if self.kind == "lognormal":
+            return rng.lognormvariate(math.log(p[0]), p[1])
+        return p[0] * rng.paretovariate(p[1])
+
+class Faults:
+    """
+    Falhas injetadas pelo backend substituto. As taxas são probabilidades por
+    requisição, sorteadas nesta ordem: erro, travamento, conexão encerrada,
+    corpo truncado.
+    """
+
+    def __init__(self, latency: str = "const:0", error_rate: float = 0.0, error_status: int = 503,
+                 hang_rate: float = 0.0, hang_s: float = 30.0, reset_rate: float = 0.0,
+                 truncate_rate: float = 0.0, seed: int = 0):
+        self.latency = Latency(latency)
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.hang_rate = hang_rate
+        self.hang_s = hang_s
+        self.reset_rate = reset_rate
+        self.truncate_rate = truncate_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats: Counter = Counter()
+
+    def draw(self):
+        """Sorteia (atraso em s, desfecho) para uma requisição."""
+        with self._lock:
+            delay = self.latency.sample(self._rng) / 1000
+            roll = self._rng.random()
+        outcome = "ok"
+        for name, rate in (("error", self.error_rate), ("hang", self.hang_rate),
+                           ("reset", self.reset_rate), ("truncate", self.truncate_rate)):
+            if roll < rate:
+                outcome = name
+                break
+            roll -= rate
+        with self._lock:
+            self.stats[outcome] += 1
+        return delay, outcome
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Responde às rotas do backend usadas pelo serviço LLM."""
+
+    students: Dict[int, Dict[str, Any]] = STUDENTS
+    faults: Optional[Faults] = None
+    usage_records: List[Dict[str, Any]] = []
+
+    def resolve(self, path: str, query: Dict[str, str]) -> Optional[Any]:
+        """Dados da rota (como o backend os serializaria), ou None se não existir."""
+        match = _DETALHES_RE.match(path) or _ALUNO_RE.match(path)
+        if match:
+            student = self.students.get(int(match.group(1)))
+            if student is None or match.re is _DETALHES_RE:
+                return student
+            return {k: v for k, v in student.items() if k not in _PERFIL_EXCLUDE}
+        if path == "/api/alunos/ativos/":
+            # Todos os alunos das fixtures contam como ativos
+            limit = int(query.get("limite", len(self.students)))
+            return [{"id": sid, "nome": s.get("nome"), "perguntas": 1} for sid, s in self.students.items()][:limit]
+        if path in _POR_ALUNO and query.get("aluno_id", "").isdigit():
+            key, filters = _POR_ALUNO[path]
+            records = (self.students.get(int(query["aluno_id"])) or {}).get(key, [])
+            for param, (field, partial) in filters.items():
+                value = query.get(param)
+                if value and partial:
+                    records = [r for r in records if value.lower() in r[field].lower()]
+                elif value:
+                    records = [r for r in records if r[field] == value.upper()]
+            return records
+        return None
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        data = self.resolve(url.path, {k: v[0] for k, v in parse_qs(url.query).items()})
+        if data is None:
+            self._send(404, b'{"detail": "Not found."}')
+            return
+        body = json.dumps(data).encode("utf-8")
+        if self.faults is None:
+            self._send(200, body)
+            return
+
+        delay, outcome = self.faults.draw()
+        try:
+            time.sleep(delay + (self.faults.hang_s if outcome == "hang" else 0))
+            if outcome == "error":
+                self._send(self.faults.error_status, b'{"detail": "Service unavailable."}')
+            elif outcome == "reset":
+                # Anuncia o corpo inteiro, envia metade e encerra a conexão
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body[:len(body) // 2])
+                self.close_connection = True
+            elif outcome == "truncate":
+                # Resposta 200 completa do ponto de vista HTTP, mas com JSON cortado
+                self._send(200, body[:len(body) // 2])
+            else:
+                self._send(200, body)
+        except (BrokenPipeError, ConnectionResetError):
+            # O cliente desistiu (timeout) antes da resposta
+            pass
+
+    def do_POST(self):
+        # Registro de uso enviado pelo serviço LLM (/api/uso-llm/registrar/): guarda em usage_records
+        length = int(self.headers.get("Content-Length", 0))
+        records = json.loads(self.rfile.read(length) or b"null")
+        if urlsplit(self.path).path.rstrip("/") != "/api/uso-llm/registrar" or not isinstance(records, list):
+            self._send(404, b'{"detail": "Not found."}')
+            return
+        known = [r for r in records if r.get("aluno") in self.students]
+        self.usage_records.extend(known)
+        self._send(201, json.dumps({"registrados": len(known), "ignorados": len(records) - len(known)}).encode("utf-8"))
+
+    def _send(self, status: int, body: bytes) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Sem log por requisição para não interferir nas medições
+        pass
+
+class StubBackend:
+    """Servidor do backend substituto rodando em uma thread (use como context manager)."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, handler=StubHandler,
+                 faults: Optional[Faults] = None):
+        if faults is not None:
+            handler = type(handler.__name__, (handler,), {"faults": faults})
+        self.faults = faults
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/api"
+
+    def start(self) -> "StubBackend":
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self) -> "StubBackend":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description="Backend substituto com dados fixos de alunos")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", default="const:0", help="Distribuição de latência (ex.: lognormal:80:0.8)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fração de respostas de erro")
+    parser.add_argument("--error-status", type=int, default=503, help="Status HTTP das respostas de erro")
+    parser.add_argument("--hang-rate", type=float, default=0.0, help="Fração de requisições travadas")
+    parser.add_argument("--hang-s", type=float, default=30.0, help="Duração do travamento, em segundos")
+    parser.add_argument("--reset-rate", type=float, default=0.0, help="Fração de conexões encerradas no meio")
+    parser.add_argument("--truncate-rate", type=float, default=0.0, help="Fração de corpos JSON truncados")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    faults = Faults(args.latency, args.error_rate, args.error_status, args.hang_rate, args.hang_s,
+                    args.reset_rate, args.truncate_rate, args.seed)
+    backend = StubBackend(args.host, args.port, faults=faults)
+    print(f"Backend substituto em {backend.url}")
+    backend.server.serve_forever()
+
+if __name__ == "__main__":
+    main()
@@ -3,9 +3,14 @@ set -e
 
 # Verifica se o modelo existe
 MODEL_PATH=${LLM_MODEL_PATH:-/app/models/Phi-3-mini-4k-instruct-q4.gguf}
+if [ ! -f "$MODEL_PATH" ] && [ "${LLM_MODEL_AUTO_DOWNLOAD:-0}" = "1" ] && [ -n "$LLM_MODEL_URL" ]; then
+    # Download paralelo e retomável; um .part de uma tentativa anterior é aproveitado
+    python -m app.model_download --dest "$MODEL_PATH" || echo "AVISO: Falha ao baixar o modelo"
+fi
 if [ ! -f "$MODEL_PATH" ]; then
     echo "AVISO: Modelo não encontrado em $MODEL_PATH"
     echo "Certifique-se de que o modelo foi copiado corretamente para o volume de modelos"
+    echo "ou baixe-o com: python -m app.model_download (ou LLM_MODEL_AUTO_DOWNLOAD=1)"
 fi
 
 # Inicia o servidor
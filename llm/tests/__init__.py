@@ -0,0 +1,16 @@
+"""
+Testes de unidade do serviço LLM (a partir do diretório llm):
+
+    python -m unittest discover -s tests -t .
+
+Usam o modelo simulado (FakeLlama) e os substitutos de benchmarks/ (backend
+e servidor de arquivos com Range); nenhum teste depende do modelo real.
+"""
+import os
+
+os.environ.setdefault("LLM_BACKEND", "fake")
+os.environ.setdefault("LLM_LOG_FILE", "")
+os.environ.setdefault("LLM_LOG_LEVEL", "ERROR")
+# Modelo simulado sem atrasos de prefill/decode (os testes medem comportamento, não tempo)
+os.environ.setdefault("LLM_FAKE_PREFILL_TPS", "1000000")
+os.environ.setdefault("LLM_FAKE_DECODE_TPS", "1000000")
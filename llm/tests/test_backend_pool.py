@@ -0,0 +1,167 @@
+import asyncio
+import time
+import unittest
+
+from app import metrics
+from app.backend_pool import BackendError, BackendPool
+from benchmarks.stub_backend import Faults, Latency, StubBackend
+
+PATH = "/alunos/1/detalhes/"
+
+def counter(name: str) -> int:
+    return metrics.snapshot()["counters"].get(name, 0)
+
+class BackendPoolTestCase(unittest.TestCase):
+    """Testes da reserva, do disjuntor e dos dados antigos do BackendPool, com o backend substituto"""
+
+    def setUp(self):
+        self.stubs = []
+
+    def tearDown(self):
+        for stub in self.stubs:
+            stub.stop()
+
+    def start(self, **faults) -> StubBackend:
+        stub = StubBackend(faults=Faults(**faults)).start()
+        self.stubs.append(stub)
+        return stub
+
+    def requests(self, stub: StubBackend) -> int:
+        return sum(stub.faults.stats.values())
+
+    def test_reserva_apos_o_atraso(self):
+        """Testar que a reserva vai ao segundo endpoint após o atraso e vence a chamada lenta"""
+        slow, fast = self.start(latency="const:500"), self.start()
+        pool = BackendPool([slow.url, fast.url], hedge_delay_s=0.05)
+        hedged, wins = counter("backend_hedged"), counter("backend_hedge_wins")
+        started = time.perf_counter()
+        status, data = asyncio.run(pool.get(PATH))
+        elapsed = time.perf_counter() - started
+        self.assertEqual((status, data["id"]), (200, 1))
+        self.assertGreaterEqual(elapsed, 0.05)
+        self.assertLess(elapsed, 0.4)
+        self.assertEqual(counter("backend_hedged"), hedged + 1)
+        self.assertEqual(counter("backend_hedge_wins"), wins + 1)
+        self.assertEqual(self.requests(fast), 1)
+
+    def test_sem_reserva_antes_do_atraso(self):
+        """Testar que uma resposta dentro do atraso não dispara a reserva"""
+        first, second = self.start(latency="const:10"), self.start()
+        pool = BackendPool([first.url, second.url], hedge_delay_s=0.5)
+        hedged = counter("backend_hedged")
+        asyncio.run(pool.get(PATH))
+        self.assertEqual(counter("backend_hedged"), hedged)
+        self.assertEqual(self.requests(second), 0)
+
+    def test_atraso_pelo_percentil_das_medicoes(self):
+        """Testar que, com medições suficientes, o atraso da reserva é o percentil do endpoint"""
+        stub = self.start()
+        pool = BackendPool([stub.url], hedge_percentile=50, hedge_delay_s=9, hedge_min_samples=3)
+        endpoint = pool.endpoints[0]
+        self.assertEqual(pool._hedge_delay(endpoint), 9)
+        endpoint.latencies.extend([0.01, 0.02, 0.03])
+        self.assertEqual(pool._hedge_delay(endpoint), 0.02)
+
+    def test_endpoint_unico_nao_recebe_reserva(self):
+        """Testar que a reserva nunca vai ao endpoint que já está com a chamada em andamento"""
+        slow = self.start(latency="const:200")
+        # URLs repetidas contam como um único endpoint
+        pool = BackendPool([slow.url, f"{slow.url}/"], hedge_delay_s=0.02)
+        self.assertEqual(len(pool.endpoints), 1)
+        hedged = counter("backend_hedged")
+        status, _ = asyncio.run(pool.get(PATH))
+        self.assertEqual(status, 200)
+        self.assertEqual(counter("backend_hedged"), hedged)
+        self.assertEqual(self.requests(slow), 1)
+
+    def test_falha_rapida_vai_ao_proximo_endpoint(self):
+        """Testar que um 5xx leva ao próximo endpoint sem esperar o atraso da reserva"""
+        failing, healthy = self.start(error_rate=1.0), self.start()
+        pool = BackendPool([failing.url, healthy.url], hedge_delay_s=5)
+        failover = counter("backend_failover")
+        started = time.perf_counter()
+        status, _ = asyncio.run(pool.get(PATH))
+        self.assertEqual(status, 200)
+        self.assertLess(time.perf_counter() - started, 1)
+        self.assertEqual(counter("backend_failover"), failover + 1)
+
+    def test_disjuntor_abre_testa_e_fecha(self):
+        """Testar o disjuntor: abre após falhas seguidas, meio-aberto com uma única chamada de teste, fecha"""
+        stub = self.start(error_rate=1.0)
+        pool = BackendPool([stub.url], breaker_failures=2, breaker_open_s=0.2)
+        endpoint = pool.endpoints[0]
+        opened, closed = counter("backend_breaker_opened"), counter("backend_breaker_closed")
+        for _ in range(2):
+            with self.assertRaises(BackendError) as ctx:
+                asyncio.run(pool.get(PATH))
+            self.assertEqual(ctx.exception.reason, "status")
+        self.assertEqual(endpoint.state, "aberto")
+        self.assertEqual(counter("backend_breaker_opened"), opened + 1)
+
+        # Aberto: rejeita sem chamar o backend
+        with self.assertRaises(BackendError) as ctx:
+            asyncio.run(pool.get(PATH))
+        self.assertEqual(ctx.exception.reason, "circuito")
+        self.assertEqual(self.requests(stub), 2)
+
+        time.sleep(0.25)
+        stub.faults.error_rate = 0.0
+        stub.faults.latency = Latency("const:200")
+
+        async def probe_and_concurrent():
+            probe = asyncio.ensure_future(pool.get(PATH))
+            await asyncio.sleep(0.05)
+            # Meio-aberto: só a chamada de teste passa
+            self.assertEqual(endpoint.state, "meio-aberto")
+            with self.assertRaises(BackendError) as concurrent:
+                await pool.get(PATH)
+            self.assertEqual(concurrent.exception.reason, "circuito")
+            return await probe
+
+        status, _ = asyncio.run(probe_and_concurrent())
+        self.assertEqual(status, 200)
+        self.assertEqual(endpoint.state, "fechado")
+        self.assertEqual(counter("backend_breaker_closed"), closed + 1)
+
+    def test_chamada_de_teste_falha_reabre(self):
+        """Testar que a falha da chamada de teste mantém o disjuntor aberto por outro período"""
+        stub = self.start(error_rate=1.0)
+        pool = BackendPool([stub.url], breaker_failures=1, breaker_open_s=0.1)
+        endpoint = pool.endpoints[0]
+        with self.assertRaises(BackendError):
+            asyncio.run(pool.get(PATH))
+        first_open = endpoint.opened_at
+        time.sleep(0.15)
+        with self.assertRaises(BackendError) as ctx:
+            asyncio.run(pool.get(PATH))
+        self.assertEqual(ctx.exception.reason, "status")
+        self.assertEqual(endpoint.state, "aberto")
+        self.assertGreater(endpoint.opened_at, first_open)
+        with self.assertRaises(BackendError) as ctx:
+            asyncio.run(pool.get(PATH))
+        self.assertEqual(ctx.exception.reason, "circuito")
+
+    def test_dados_antigos_quando_todos_falham(self):
+        """Testar que a última resposta válida é usada quando todos os endpoints falham"""
+        stub = self.start()
+        pool = BackendPool([stub.url], breaker_failures=100)
+        fresh = asyncio.run(pool.get_json(PATH))
+        stub.faults.error_rate = 1.0
+        stale = counter("fetch_stale")
+        self.assertEqual(asyncio.run(pool.get_json(PATH)), fresh)
+        self.assertEqual(counter("fetch_stale"), stale + 1)
+        # Outro caminho não tem dados guardados
+        missing = counter("fetch_stale_missing")
+        with self.assertRaises(BackendError):
+            asyncio.run(pool.get_json("/alunos/2/detalhes/"))
+        self.assertEqual(counter("fetch_stale_missing"), missing + 1)
+
+    def test_dados_antigos_expirados(self):
+        """Testar que dados mais antigos que BACKEND_STALE_TTL_S não são usados"""
+        stub = self.start()
+        pool = BackendPool([stub.url], breaker_failures=100, stale_ttl_s=0.05)
+        asyncio.run(pool.get_json(PATH))
+        stub.faults.error_rate = 1.0
+        time.sleep(0.1)
+        with self.assertRaises(BackendError):
+            asyncio.run(pool.get_json(PATH))
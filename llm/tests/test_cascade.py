@@ -0,0 +1,44 @@
+import unittest
+
+from app import cascade
+
+CONTEXT = "Notas: Cálculo I = 6.40; Física I = 8,5. Aula de Cálculo I às 08:00. Mensalidade R$1250.00."
+
+class CascadeTestCase(unittest.TestCase):
+    """Testes dos sinais de escalonamento da cascata de modelos"""
+
+    def reason(self, answer: str, logprobs=(-0.1, -0.2), min_logprob: float = -1.0):
+        return cascade.escalation_reason(answer, list(logprobs), CONTEXT, min_logprob)
+
+    def test_resposta_aceita(self):
+        """Testar que uma resposta fundamentada e confiante não é escalonada"""
+        self.assertIsNone(self.reason("Sua nota em Cálculo I é 6.4, e a aula começa às 8:00."))
+
+    def test_resposta_vazia(self):
+        self.assertEqual(self.reason("  \n"), "vazia")
+
+    def test_recusa(self):
+        """Testar as recusas do modelo pequeno"""
+        for answer in ("Não sei responder isso.", "Desculpe, não tenho essa informação.",
+                       "Como um modelo de linguagem, não posso ajudar."):
+            self.assertEqual(self.reason(answer), "recusa", answer)
+
+    def test_numeros_sem_fundamentacao(self):
+        """Testar que números ausentes dos dados do aluno levam ao modelo principal"""
+        self.assertEqual(self.reason("Sua nota em Cálculo I é 7.5."), "fundamentacao")
+        self.assertEqual(cascade.ungrounded_numbers("Nota 8.50 às 08:00 e 9.0", CONTEXT), ["9.0"])
+
+    def test_logprob_baixo(self):
+        """Testar o limite da média dos log-probs (tokens sem log-prob são ignorados)"""
+        self.assertEqual(self.reason("Sua aula é de manhã.", logprobs=(-2.0, None, -1.5)), "logprob")
+        self.assertIsNone(self.reason("Sua aula é de manhã.", logprobs=(-0.5, None, -0.5)))
+        self.assertIsNone(self.reason("Sua aula é de manhã.", logprobs=(None,)))
+
+    def test_ordem_dos_sinais(self):
+        """Testar que a recusa é informada antes da fundamentação e do log-prob"""
+        self.assertEqual(self.reason("Desculpe, a nota é 3.3.", logprobs=(-5.0,)), "recusa")
+        self.assertEqual(self.reason("A nota é 3.3.", logprobs=(-5.0,)), "fundamentacao")
+
+    def test_media_dos_logprobs(self):
+        self.assertAlmostEqual(cascade.mean_logprob([-1.0, None, -0.5]), -0.75)
+        self.assertIsNone(cascade.mean_logprob([]))
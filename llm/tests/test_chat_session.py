@@ -0,0 +1,197 @@
+import asyncio
+import copy
+import unittest
+
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from app import chat_session, llm_service, main, metrics
+from app.chat_session import ChatSession, release_kv, switch_kv
+from app.fake_llama import FakeLlama
+from app.scheduler import GenerationCancelled
+from benchmarks.fixtures import STUDENTS
+from benchmarks.stub_backend import StubBackend, StubHandler
+
+def counter(name: str) -> int:
+    return metrics.snapshot()["counters"].get(name, 0)
+
+class ChatSessionKVTestCase(unittest.TestCase):
+    """Testes do estado KV fixado das sessões de chat, com o modelo simulado"""
+
+    def setUp(self):
+        self.model = FakeLlama(prefill_tps=1e6, decode_tps=1e6, jitter=0)
+        self.sessions = []
+
+    def tearDown(self):
+        for session in self.sessions:
+            session.close()
+
+    def session(self, name: str) -> ChatSession:
+        session = ChatSession(len(self.sessions) + 1, {}, f"Contexto do aluno {name}. " * 20)
+        self.sessions.append(session)
+        return session
+
+    def turn(self, session: ChatSession, question: str, max_bytes: int = 1 << 40, max_chars=None) -> bool:
+        """Executa um turno como stream_chat_turn: monta o prompt, troca o cache KV e gera; retorna se restaurou."""
+        prompt = session.build_prompt(question, max_chars)
+        restored = switch_kv(self.model, session.kv_slot, max_bytes)
+        answer = self.model(prompt, max_tokens=8)["choices"][0]["text"]
+        session.add_turn(question, answer)
+        return restored
+
+    def test_estado_salvo_e_restaurado(self):
+        """Testar que o prefixo da sessão é salvo quando outra geração ocupa o modelo e restaurado depois"""
+        a, b = self.session("A"), self.session("B")
+        self.assertFalse(self.turn(a, "Qual é a minha nota?"))
+        tokens_a = list(self.model.save_state().input_ids)
+        self.assertFalse(self.turn(b, "Quando é a minha aula?"))
+        self.assertEqual(a.kv_slot.state.input_ids, tokens_a)
+        self.assertEqual(chat_session.saved_bytes(), chat_session.state_bytes(a.kv_slot.state))
+        self.assertTrue(self.turn(a, "E a de Física?"))
+        # Depois de restaurado, o estado vive no modelo; o de B foi salvo no lugar
+        self.assertIsNone(a.kv_slot.state)
+        self.assertIsNotNone(b.kv_slot.state)
+        self.assertEqual(chat_session.saved_bytes(), chat_session.state_bytes(b.kv_slot.state))
+
+    def test_limite_de_bytes_descarta_o_mais_antigo(self):
+        """Testar que os estados salvos respeitam o limite de bytes, descartando o salvo há mais tempo"""
+        a, b, c, d = (self.session(name) for name in "ABCD")
+        self.turn(a, "Qual é a minha nota?")
+        # Cabem dois estados do tamanho do de A (todas as sessões têm prompts do mesmo tamanho)
+        budget = int(chat_session.state_bytes(self.model.save_state()) * 2.5)
+        evicted = counter("chat_kv_evicted")
+        self.turn(b, "Qual é a minha nota?", budget)
+        self.turn(c, "Qual é a minha nota?", budget)
+        self.turn(d, "Qual é a minha nota?", budget)
+        self.assertEqual(counter("chat_kv_evicted"), evicted + 1)
+        self.assertIsNone(a.kv_slot.state)
+        self.assertIsNotNone(b.kv_slot.state)
+        self.assertIsNotNone(c.kv_slot.state)
+        self.assertLessEqual(chat_session.saved_bytes(), budget)
+        # O estado que vai ser restaurado não é descartado para abrir espaço ao da sessão dona
+        self.assertTrue(self.turn(b, "E a de Física?", budget))
+        self.assertEqual(counter("chat_kv_evicted"), evicted + 1)
+        self.assertIsNotNone(d.kv_slot.state)
+        self.assertFalse(self.turn(a, "E a de Física?", budget))
+
+    def test_estado_maior_que_o_limite_nao_e_salvo(self):
+        """Testar que um estado maior que o limite inteiro não é guardado"""
+        a, b = self.session("A"), self.session("B")
+        self.turn(a, "Qual é a minha nota?")
+        self.turn(b, "Qual é a minha nota?", max_bytes=1)
+        self.assertIsNone(a.kv_slot.state)
+        self.assertEqual(chat_session.saved_bytes(), 0)
+
+    def test_historico_truncado_descarta_o_estado(self):
+        """Testar que, quando os turnos antigos saem do prompt, o estado salvo não é restaurado"""
+        a, b = self.session("A"), self.session("B")
+        self.turn(a, "Qual é a minha nota?")
+        self.turn(a, "E a de Física?")
+        self.turn(b, "Quando é a minha aula?")
+        self.assertIsNotNone(a.kv_slot.state)
+        truncated = counter("chat_turns_truncated")
+        max_chars = len(a.build_prompt("E a de Química?")) - 1
+        self.assertFalse(self.turn(a, "E a de Química?", max_chars=max_chars))
+        self.assertEqual(counter("chat_turns_truncated"), truncated + 1)
+        self.assertEqual([q for q, _ in a.turns], ["E a de Física?", "E a de Química?"])
+        self.assertIsNone(a.kv_slot.state)
+        # Só o estado de B (que cedeu o modelo) continua salvo
+        self.assertEqual(chat_session.saved_bytes(), chat_session.state_bytes(b.kv_slot.state))
+
+    def test_sessao_encerrada_libera_o_estado(self):
+        """Testar que o encerramento da sessão libera o estado salvo"""
+        a, b = self.session("A"), self.session("B")
+        self.turn(a, "Qual é a minha nota?")
+        self.turn(b, "Quando é a minha aula?")
+        release_kv(a.kv_slot)
+        self.assertIsNone(a.kv_slot.state)
+        self.assertEqual(chat_session.saved_bytes(), 0)
+
+class ChatSocketTestCase(unittest.TestCase):
+    """Testes do endpoint /ws/chat, com o modelo simulado e o backend substituto"""
+
+    @classmethod
+    def setUpClass(cls):
+        llm_service.setup_llm()
+
+    def setUp(self):
+        handler = type("Handler", (StubHandler,), {"students": copy.deepcopy(STUDENTS), "usage_records": []})
+        self.backend = StubBackend(handler=handler).start()
+        self.previous_urls = [e.url for e in llm_service.backend_pool.endpoints]
+        llm_service.set_backend_urls([self.backend.url])
+        self.saved = (main.CHAT_MAX_SESSIONS, main.open_chat_session, main.stream_chat_turn)
+        self.client = TestClient(main.app)
+
+    def tearDown(self):
+        main.CHAT_MAX_SESSIONS, main.open_chat_session, main.stream_chat_turn = self.saved
+        llm_service.set_backend_urls(self.previous_urls)
+        self.backend.stop()
+        self.assertEqual(main.chat_sessions, 0)
+
+    def receive_turn(self, websocket) -> list:
+        """Mensagens de um turno, até {"done": true} ou {"error": ...}."""
+        messages = []
+        while not messages or "token" in messages[-1]:
+            messages.append(websocket.receive_json())
+        return messages
+
+    def test_pronto_tokens_e_fim(self):
+        """Testar a sequência ready, tokens e done em dois turnos da mesma sessão"""
+        with self.client.websocket_connect("/ws/chat?student_id=1") as websocket:
+            self.assertEqual(websocket.receive_json(), {"ready": True, "student_id": 1})
+            for question in ("Qual foi minha última nota?", "E a anterior?"):
+                websocket.send_json({"question": question})
+                messages = self.receive_turn(websocket)
+                self.assertEqual(messages[-1], {"done": True})
+                self.assertTrue("".join(m["token"] for m in messages[:-1]))
+            websocket.send_json({"question": "  "})
+            self.assertEqual(websocket.receive_json(), {"error": "Mensagem sem pergunta"})
+
+    def test_cancelamento_do_turno(self):
+        """Testar que {"cancel": true} interrompe o turno e a sessão continua aberta"""
+        async def slow_turn(session, question, cancel_token):
+            yield "Sua "
+            while not cancel_token.cancelled:
+                await asyncio.sleep(0.01)
+            raise GenerationCancelled(cancel_token.reason)
+
+        main.stream_chat_turn = slow_turn
+        with self.client.websocket_connect("/ws/chat?student_id=1") as websocket:
+            websocket.receive_json()
+            websocket.send_json({"question": "Qual foi minha última nota?"})
+            self.assertEqual(websocket.receive_json(), {"token": "Sua "})
+            websocket.send_json({"cancel": True})
+            self.assertEqual(websocket.receive_json(), {"error": "Geração cancelada", "reason": "client_cancel"})
+            main.stream_chat_turn = self.saved[2]
+            websocket.send_json({"question": "Qual foi minha última nota?"})
+            self.assertEqual(self.receive_turn(websocket)[-1], {"done": True})
+
+    def test_limite_de_sessoes(self):
+        """Testar que a conexão acima de LLM_CHAT_MAX_SESSIONS é fechada com 1013"""
+        main.CHAT_MAX_SESSIONS = 1
+        with self.client.websocket_connect("/ws/chat?student_id=1") as first:
+            first.receive_json()
+            with self.client.websocket_connect("/ws/chat?student_id=2") as second:
+                with self.assertRaises(WebSocketDisconnect) as closed:
+                    second.receive_json()
+            self.assertEqual(closed.exception.code, 1013)
+        # Com a primeira sessão encerrada, a vaga volta a ficar livre
+        with self.client.websocket_connect("/ws/chat?student_id=2") as websocket:
+            self.assertTrue(websocket.receive_json()["ready"])
+
+    def test_falha_ao_abrir_a_sessao_libera_a_vaga(self):
+        """Testar que o erro ao abrir a sessão fecha a conexão com 1011 sem ocupar vaga"""
+        async def failing(student_id):
+            raise RuntimeError("falha simulada")
+
+        main.CHAT_MAX_SESSIONS = 1
+        main.open_chat_session = failing
+        for _ in range(2):
+            with self.assertLogs("app.main", "ERROR"):
+                with self.client.websocket_connect("/ws/chat?student_id=1") as websocket:
+                    with self.assertRaises(WebSocketDisconnect) as closed:
+                        websocket.receive_json()
+            self.assertEqual(closed.exception.code, 1011)
+        main.open_chat_session = self.saved[1]
+        with self.client.websocket_connect("/ws/chat?student_id=1") as websocket:
+            self.assertTrue(websocket.receive_json()["ready"])
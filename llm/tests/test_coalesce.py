@@ -0,0 +1,97 @@
+import asyncio
+import unittest
+
+from app.coalesce import SingleFlight, StreamFlight
+from app.scheduler import CancelToken, GenerationCancelled
+
+class SingleFlightTestCase(unittest.TestCase):
+    """Testes do agrupamento de chamadas idênticas simultâneas"""
+
+    def test_chamadas_simultaneas_compartilham_o_resultado(self):
+        """Testar que chamadas simultâneas da mesma chave executam uma vez e recebem o mesmo resultado"""
+        calls = []
+
+        async def fetch(key):
+            calls.append(key)
+            await asyncio.sleep(0.02)
+            return {"key": key}
+
+        async def scenario():
+            flight = SingleFlight("teste")
+            results = await asyncio.gather(*(flight.do("a", lambda: fetch("a")) for _ in range(5)),
+                                           flight.do("b", lambda: fetch("b")))
+            # Terminada a chamada, nada fica guardado
+            await flight.do("a", lambda: fetch("a"))
+            return results
+
+        results = asyncio.run(scenario())
+        self.assertEqual(calls, ["a", "b", "a"])
+        self.assertTrue(all(r is results[0] for r in results[:5]))
+
+    def test_erro_chega_a_todos(self):
+        """Testar que o erro da chamada compartilhada chega a todos os participantes"""
+        async def failing():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("backend fora")
+
+        async def scenario():
+            flight = SingleFlight("teste")
+            return await asyncio.gather(flight.do("a", failing), flight.do("a", failing), return_exceptions=True)
+
+        self.assertTrue(all(isinstance(r, RuntimeError) for r in asyncio.run(scenario())))
+
+class StreamFlightTestCase(unittest.TestCase):
+    """Testes do compartilhamento de streams de geração"""
+
+    def setUp(self):
+        self.started = 0
+        self.tokens = []
+
+    def factory(self, token: CancelToken):
+        self.started += 1
+        self.tokens.append(token)
+
+        async def stream():
+            for piece in ("Olá", " ", "mundo"):
+                if token.cancelled:
+                    raise GenerationCancelled(token.reason)
+                await asyncio.sleep(0.02)
+                yield piece
+        return stream()
+
+    def test_quem_chega_depois_recebe_o_stream_inteiro(self):
+        """Testar que quem se junta no meio recebe os trechos já produzidos e o restante"""
+        async def collect(flight, delay):
+            await asyncio.sleep(delay)
+            return "".join([p async for p in flight.subscribe("k", self.factory)])
+
+        async def scenario():
+            flight = StreamFlight("teste")
+            return await asyncio.gather(collect(flight, 0), collect(flight, 0.03))
+
+        self.assertEqual(asyncio.run(scenario()), ["Olá mundo", "Olá mundo"])
+        self.assertEqual(self.started, 1)
+
+    def test_geracao_so_para_quando_todos_desistem(self):
+        """Testar que a desistência de um participante não interrompe o stream dos demais"""
+        async def scenario():
+            flight = StreamFlight("teste")
+            first, second = CancelToken(), CancelToken()
+
+            async def collect(token):
+                return [p async for p in flight.subscribe("k", self.factory, token)]
+
+            tasks = [asyncio.ensure_future(collect(first)), asyncio.ensure_future(collect(second))]
+            await asyncio.sleep(0.01)
+            first.cancel("disconnect")
+            await asyncio.sleep(0.02)
+            self.assertFalse(self.tokens[0].cancelled)
+            second.cancel("deadline")
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+            await asyncio.sleep(0.05)
+            return results
+
+        results = asyncio.run(scenario())
+        self.assertTrue(all(isinstance(r, GenerationCancelled) for r in results))
+        self.assertTrue(self.tokens[0].cancelled)
+        self.assertEqual(self.tokens[0].reason, "deadline")
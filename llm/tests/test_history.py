@@ -0,0 +1,53 @@
+import unittest
+
+from benchmarks import history
+
+def entry(commit: str, metric: str, samples, direction: str = "lower"):
+    return {"suite": "llm_stages", "commit": commit, "metric": metric, "host": "h", "profile": "default",
+            "model": "fake", "unit": "ms", "direction": direction, "samples": list(samples)}
+
+class HistoryCompareTestCase(unittest.TestCase):
+    """Testes da comparação entre commits do histórico de benchmarks"""
+
+    def status(self, rows, metric):
+        return next(r["status"] for r in rows if r["metric"] == metric)
+
+    def test_regressao_e_melhora(self):
+        """Testar regressão e melhora significativas e variações dentro do limiar"""
+        entries = [
+            entry("aaaa1111", "lenta", [10, 11, 10, 12, 11, 10, 11, 12]),
+            entry("aaaa1111", "rapida", [10, 11, 10, 12, 11, 10, 11, 12]),
+            entry("aaaa1111", "estavel", [10, 11, 10, 12, 11, 10, 11, 12]),
+            entry("bbbb2222", "lenta", [20, 21, 22, 20, 21, 22, 20, 21]),
+            entry("bbbb2222", "rapida", [5, 6, 5, 6, 5, 6, 5, 6]),
+            entry("bbbb2222", "estavel", [10, 11, 10, 12, 11, 10, 11, 12]),
+        ]
+        rows = history.compare(entries)
+        self.assertEqual(self.status(rows, "lenta"), "regressão")
+        self.assertEqual(self.status(rows, "rapida"), "melhora")
+        self.assertEqual(self.status(rows, "estavel"), "ok")
+
+    def test_poucas_amostras_nao_sao_regressao(self):
+        """Testar que séries com menos de 3 amostras são informadas como amostras insuficientes"""
+        entries = [entry("aaaa1111", "peak_rss", [100]), entry("bbbb2222", "peak_rss", [200]),
+                   entry("aaaa1111", "load", [1, 1]), entry("bbbb2222", "load", [1.01, 1])]
+        rows = history.compare(entries)
+        self.assertEqual(self.status(rows, "peak_rss"), "amostras insuficientes")
+        self.assertIsNone(rows[0]["p_value"])
+        self.assertEqual(self.status(rows, "load"), "ok")
+
+    def test_commit_por_prefixo(self):
+        """Testar a escolha dos commits por hash exato ou prefixo único"""
+        commits = ["abc123def456", "abd999000111", "abc123"]
+        self.assertEqual(history._resolve("abc123", commits), "abc123")
+        self.assertEqual(history._resolve("abd", commits), "abd999000111")
+        self.assertEqual(history._resolve("abd999000111ffffffff", commits), "abd999000111")
+        with self.assertRaises(ValueError):
+            history._resolve("ab", commits)
+
+    def test_linha_de_base_ambigua(self):
+        """Testar que compare recusa um prefixo ambíguo"""
+        entries = [entry("abc1", "m", [1, 2, 3]), entry("abc2", "m", [1, 2, 3]), entry("ffff", "m", [1, 2, 3])]
+        with self.assertRaises(ValueError):
+            history.compare(entries, baseline="abc", candidate="ffff")
+        self.assertEqual(history.compare(entries, baseline="abc1", candidate="ffff")[0]["baseline"], "abc1")
@@ -0,0 +1,92 @@
+import asyncio
+import unittest
+
+from app.jobs import JobConflict, JobStore
+from app.scheduler import GenerationCancelled
+
+PARAMS = {"question": "Qual foi minha última nota?", "student_id": 1, "context_data": None, "mode": None}
+
+class JobStoreTestCase(unittest.TestCase):
+    """Testes dos jobs assíncronos e da chave de idempotência"""
+
+    def setUp(self):
+        self.runs = 0
+
+    async def runner(self, question, student_id, context_data, mode, cancel_token):
+        self.runs += 1
+        for piece in ("Sua", " nota", " é 9."):
+            await asyncio.sleep(0.01)
+            if cancel_token.cancelled:
+                raise GenerationCancelled(cancel_token.reason)
+            yield piece
+
+    def store(self, ttl: float = 60) -> JobStore:
+        return JobStore(self.runner, ttl=ttl, timeout=30)
+
+    def test_job_concluido(self):
+        """Testar o job do envio até a resposta completa"""
+        async def scenario():
+            store = self.store()
+            job, created = store.submit(dict(PARAMS))
+            self.assertTrue(created)
+            self.assertEqual(store.active, 1)
+            pieces = [p async for p in store.follow(job)]
+            return store, job, pieces
+
+        store, job, pieces = asyncio.run(scenario())
+        self.assertEqual("".join(pieces), "Sua nota é 9.")
+        self.assertEqual(job.to_dict()["status"], "done")
+        self.assertEqual(job.to_dict()["answer"], "Sua nota é 9.")
+        self.assertEqual(store.active, 0)
+
+    def test_nova_tentativa_com_a_mesma_chave(self):
+        """Testar que a nova tentativa com a mesma chave se junta ao job, sem gerar de novo"""
+        async def scenario():
+            store = self.store()
+            job, _ = store.submit(dict(PARAMS), "chave")
+            again, created = store.submit(dict(PARAMS), "chave")
+            self.assertIs(again, job)
+            self.assertFalse(created)
+            await job.task
+            # Concluído: ainda reaproveitado
+            self.assertIs(store.submit(dict(PARAMS), "chave")[0], job)
+            # A chave é do aluno: outro aluno com a mesma chave tem outro job
+            other, created = store.submit({**PARAMS, "student_id": 2}, "chave")
+            self.assertTrue(created)
+            await other.task
+            with self.assertRaises(JobConflict):
+                store.submit({**PARAMS, "question": "Outra pergunta"}, "chave")
+
+        asyncio.run(scenario())
+        self.assertEqual(self.runs, 2)
+
+    def test_cancelado_gera_de_novo(self):
+        """Testar o cancelamento e que a nova tentativa após o cancelamento gera novamente"""
+        async def scenario():
+            store = self.store()
+            job, _ = store.submit(dict(PARAMS), "chave")
+            await asyncio.sleep(0.015)
+            store.cancel(job.id)
+            await job.task
+            self.assertEqual((job.status, job.error), ("cancelled", "job_cancelled"))
+            self.assertTrue(job.to_dict()["partial"].startswith("Sua"))
+            retry, created = store.submit(dict(PARAMS), "chave")
+            self.assertTrue(created)
+            self.assertIsNot(retry, job)
+            await retry.task
+
+        asyncio.run(scenario())
+
+    def test_jobs_terminados_expiram(self):
+        """Testar que jobs terminados há mais de LLM_JOB_TTL saem do armazenamento"""
+        async def scenario():
+            store = self.store(ttl=0.01)
+            job, _ = store.submit(dict(PARAMS), "chave")
+            await job.task
+            await asyncio.sleep(0.02)
+            self.assertIsNone(store.get(job.id))
+            retry, created = store.submit(dict(PARAMS), "chave")
+            self.assertTrue(created)
+            await retry.task
+
+        asyncio.run(scenario())
@@ -0,0 +1,79 @@
+import unittest
+
+from app import llm_service, metrics
+from app.load_profile import PROFILES, LoadGovernor
+
+class LoadGovernorTestCase(unittest.TestCase):
+    """Testes dos limites de fila e da histerese do LoadGovernor"""
+
+    def setUp(self):
+        self.depth = 0
+        self.governor = LoadGovernor(lambda: self.depth, [2, 4, 8], recover_s=5)
+
+    def test_limites_da_fila(self):
+        """Testar o perfil escolhido em cada limite de fila (subida imediata)"""
+        for depth, expected in ((0, "normal"), (1, "normal"), (2, "ocupado"), (4, "sobrecarga"),
+                                (7, "sobrecarga"), (8, "critico"), (50, "critico")):
+            self.depth = depth
+            self.assertEqual(self.governor.update(now=0), expected, depth)
+
+    def test_subida_pula_niveis(self):
+        """Testar que a fila acima de vários limites sobe direto para o nível correspondente"""
+        self.depth = 9
+        self.assertEqual(self.governor.update(now=0), "critico")
+
+    def test_histerese_na_descida(self):
+        """Testar que a descida espera LLM_LOAD_RECOVER_S e desce um nível por período"""
+        self.depth = 8
+        self.governor.update(now=0)
+        self.depth = 0
+        self.assertEqual(self.governor.update(now=1), "critico")
+        self.assertEqual(self.governor.update(now=5.9), "critico")
+        self.assertEqual(self.governor.update(now=6), "sobrecarga")
+        # O próximo degrau espera outro período completo
+        self.assertEqual(self.governor.update(now=10), "sobrecarga")
+        self.assertEqual(self.governor.update(now=11), "ocupado")
+        self.assertEqual(self.governor.update(now=16), "normal")
+
+    def test_fila_volta_a_subir_reinicia_a_espera(self):
+        """Testar que a fila de volta ao limite do nível reinicia a contagem da descida"""
+        self.depth = 4
+        self.governor.update(now=0)
+        self.depth = 0
+        self.governor.update(now=1)
+        self.depth = 4
+        self.assertEqual(self.governor.update(now=3), "sobrecarga")
+        self.depth = 0
+        self.assertEqual(self.governor.update(now=4), "sobrecarga")
+        self.assertEqual(self.governor.update(now=8.5), "sobrecarga")
+        self.assertEqual(self.governor.update(now=9), "ocupado")
+
+    def test_desativado_mantem_normal(self):
+        """Testar que LLM_LOAD_ADAPTIVE=0 mantém sempre o perfil normal"""
+        governor = LoadGovernor(lambda: 100, [2, 4, 8], enabled=False)
+        self.assertEqual(governor.update(), "normal")
+        self.assertEqual(governor.current(), {"name": "normal", **PROFILES["normal"]})
+        self.assertEqual(governor.active, "normal")
+
+    def test_limites_invalidos(self):
+        """Testar que o número de limites precisa ser um por nível acima do normal"""
+        with self.assertRaises(ValueError):
+            LoadGovernor(lambda: 0, [2, 4])
+
+    def test_leitura_nao_altera_o_nivel(self):
+        """Testar que active e o gauge load_profile não reavaliam a fila"""
+        self.depth = 8
+        self.governor.update(now=0)
+        self.depth = 0
+        self.assertEqual(self.governor.active, "critico")
+        self.assertEqual(self.governor.level, 3)
+        self.assertIsNone(self.governor._below_since)
+
+        governor = llm_service.load_governor
+        depth, level = governor.depth, governor.level
+        governor.depth = lambda: 100
+        try:
+            self.assertEqual(metrics.snapshot()["gauges"]["load_profile"], governor.active)
+            self.assertEqual(governor.level, level)
+        finally:
+            governor.depth = depth
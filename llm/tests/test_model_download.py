@@ -0,0 +1,100 @@
+import hashlib
+import os
+import random
+import struct
+import tempfile
+import unittest
+
+from app import model_loader
+from app.model_download import ChunkedDownload, DownloadError
+from benchmarks.range_server import RangeServer
+
+CHUNK = 64 * 1024
+
+def gguf_payload(size: int = 20 * CHUNK + 123, seed: int = 0) -> bytes:
+    """Cabeçalho GGUF válido seguido de bytes aleatórios (último bloco incompleto)."""
+    header = model_loader.GGUF_MAGIC + struct.pack("<IQQ", 3, 1, 1)
+    return header + random.Random(seed).randbytes(size - len(header))
+
+class ModelDownloadTestCase(unittest.TestCase):
+    """Testes do download do modelo contra o servidor substituto com Range"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dest = os.path.join(self.tmp.name, "modelo.gguf")
+        self.data = gguf_payload()
+        self.sha256 = hashlib.sha256(self.data).hexdigest()
+        self.server = RangeServer(self.data).start()
+
+    def tearDown(self):
+        self.server.stop()
+        self.tmp.cleanup()
+
+    def download(self, **kwargs) -> ChunkedDownload:
+        return ChunkedDownload(self.server.url, self.dest, **{"connections": 4, "chunk_size": CHUNK,
+                                                              "retries": 0, "timeout": 5, **kwargs})
+
+    def read_dest(self) -> bytes:
+        with open(self.dest, "rb") as f:
+            return f.read()
+
+    def test_download_paralelo_por_blocos(self):
+        """Testar o download em blocos paralelos, a verificação e o arquivo lateral"""
+        result = self.download().run(self.sha256)
+        self.assertTrue(result["ranges"])
+        self.assertEqual(self.read_dest(), self.data)
+        self.assertEqual(result["sha256"], self.sha256)
+        # Sondagem + um pedido por bloco
+        self.assertEqual(self.server.requests, 1 + 21)
+        self.assertFalse(os.path.exists(f"{self.dest}.part"))
+        self.assertFalse(os.path.exists(f"{self.dest}.part.json"))
+        self.assertTrue(model_loader.validate(self.dest, self.sha256)["cached"])
+
+    def test_retoma_download_interrompido(self):
+        """Testar que um download interrompido reaproveita os blocos já gravados"""
+        self.server.server.abort_rate = 0.5
+        with self.assertRaises(DownloadError):
+            self.download().run(self.sha256)
+        self.assertFalse(os.path.exists(self.dest))
+        self.server.server.abort_rate = 0.0
+        result = self.download().run(self.sha256)
+        self.assertGreater(result["resumed_bytes"], 0)
+        self.assertEqual(self.read_dest(), self.data)
+
+    def test_part_truncado_recomeca(self):
+        """Testar que um .part truncado é baixado de novo, sem confiar no estado salvo"""
+        self.server.server.abort_rate = 0.5
+        with self.assertRaises(DownloadError):
+            self.download().run(self.sha256)
+        with open(f"{self.dest}.part", "r+b") as f:
+            f.truncate(CHUNK)
+        self.server.server.abort_rate = 0.0
+        result = self.download().run(self.sha256)
+        self.assertEqual(result["resumed_bytes"], 0)
+        self.assertEqual(self.read_dest(), self.data)
+
+    def test_sha256_divergente(self):
+        """Testar que o SHA-256 divergente descarta o .part e não cria o destino"""
+        with self.assertRaises(DownloadError):
+            self.download().run("0" * 64)
+        for path in (self.dest, f"{self.dest}.part", f"{self.dest}.part.json"):
+            self.assertFalse(os.path.exists(path))
+
+    def test_arquivo_que_nao_e_gguf(self):
+        """Testar que um artefato que não é GGUF nunca chega ao destino"""
+        self.server.set_data(b"ggml" + self.data[4:])
+        with self.assertRaises(DownloadError):
+            self.download().run()
+        self.assertFalse(os.path.exists(self.dest))
+        self.assertFalse(os.path.exists(f"{self.dest}.part"))
+
+    def test_servidor_sem_range(self):
+        """Testar o download em um único stream quando o servidor ignora Range"""
+        self.server.server.ranges = False
+        result = self.download().run(self.sha256)
+        self.assertFalse(result["ranges"])
+        self.assertEqual(self.read_dest(), self.data)
+        self.assertEqual(self.server.requests, 2)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+import hashlib
+import json
+import os
+import struct
+import tempfile
+import unittest
+
+from app import model_loader
+from app.fake_llama import FakeLlama
+
+def gguf_payload(size: int = 4096) -> bytes:
+    """Cabeçalho GGUF válido (versão 3, 2 tensores, 5 metadados) seguido de zeros."""
+    header = model_loader.GGUF_MAGIC + struct.pack("<IQQ", 3, 2, 5)
+    return header + bytes(size - len(header))
+
+class ValidateTestCase(unittest.TestCase):
+    """Testes da validação do arquivo do modelo e do arquivo lateral"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "modelo.gguf")
+        self.write(gguf_payload())
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, data: bytes) -> None:
+        with open(self.path, "wb") as f:
+            f.write(data)
+        self.sha256 = hashlib.sha256(data).hexdigest()
+
+    def test_arquivo_lateral_reaproveitado(self):
+        """Testar que a validação é pulada enquanto tamanho e mtime não mudam"""
+        first = model_loader.validate(self.path, self.sha256)
+        self.assertFalse(first["cached"])
+        self.assertEqual((first["gguf_version"], first["tensor_count"], first["kv_count"]), (3, 2, 5))
+        with open(model_loader.sidecar_path(self.path), encoding="utf-8") as f:
+            self.assertEqual(json.load(f)["sha256"], self.sha256)
+
+        second = model_loader.validate(self.path, self.sha256.upper())
+        self.assertTrue(second["cached"])
+        self.assertEqual(second["sha256"], self.sha256)
+        # Sem hash esperado, o arquivo lateral também vale
+        self.assertTrue(model_loader.validate(self.path)["cached"])
+
+    def test_valida_de_novo_apos_mudanca(self):
+        """Testar que a mudança de tamanho ou de mtime refaz a validação"""
+        model_loader.validate(self.path, self.sha256)
+        self.write(gguf_payload(8192))
+        result = model_loader.validate(self.path, self.sha256)
+        self.assertFalse(result["cached"])
+        self.assertEqual(result["size"], 8192)
+
+        stat = os.stat(self.path)
+        os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+        self.assertFalse(model_loader.validate(self.path, self.sha256)["cached"])
+        self.assertTrue(model_loader.validate(self.path, self.sha256)["cached"])
+
+    def test_sha256_divergente(self):
+        """Testar que o SHA-256 diferente do esperado gera ValueError, mesmo com arquivo lateral válido"""
+        model_loader.validate(self.path)
+        with self.assertRaises(ValueError):
+            model_loader.validate(self.path, "0" * 64)
+
+    def test_cabecalho_nao_gguf(self):
+        """Testar que um arquivo sem o cabeçalho GGUF é rejeitado"""
+        self.write(b"<html>Not Found</html>" + bytes(100))
+        with self.assertRaises(ValueError):
+            model_loader.validate(self.path)
+        self.write(model_loader.GGUF_MAGIC + b"\x03\x00")
+        with self.assertRaises(ValueError):
+            model_loader.validate(self.path)
+        self.assertFalse(os.path.exists(model_loader.sidecar_path(self.path)))
+
+class WarmupTestCase(unittest.TestCase):
+    """Testes do aquecimento do modelo com o modelo simulado"""
+
+    def test_tempos_do_aquecimento(self):
+        """Testar que o aquecimento mede o primeiro token e a velocidade plena e limpa o cache KV"""
+        model = FakeLlama(prefill_tps=20000, decode_tps=500, jitter=0)
+        result = model_loader.warmup(model, tokens=8)
+        self.assertIsNotNone(result["first_token_s"])
+        self.assertIsNotNone(result["full_speed_s"])
+        self.assertGreaterEqual(result["full_speed_s"], result["first_token_s"])
+        self.assertGreater(result["decode_tps"], 0)
+        self.assertEqual(list(model.save_state().input_ids), [])
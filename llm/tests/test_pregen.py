@@ -0,0 +1,171 @@
+import asyncio
+import copy
+import datetime
+import unittest
+
+from app import llm_service, metrics, pregen
+from app.load_profile import LoadGovernor
+from benchmarks.fixtures import STUDENTS
+from benchmarks.stub_backend import StubBackend, StubHandler
+
+QUESTION = "Qual foi minha última nota?"
+
+class PregenStoreTestCase(unittest.TestCase):
+    """Testes da versão dos dados e do armazenamento das respostas pré-geradas"""
+
+    def test_versao_ignora_historico_do_chat(self):
+        """Testar que o histórico do chat não muda a versão, mas as notas mudam"""
+        student = copy.deepcopy(STUDENTS[2])
+        version = pregen.data_version(student)
+        student["historico_chat"].append({"pergunta": "Oi", "resposta": "Olá"})
+        self.assertEqual(pregen.data_version(student), version)
+        student["notas"][0]["nota_final"] = "0.00"
+        self.assertNotEqual(pregen.data_version(student), version)
+
+    def test_resposta_vale_para_versao_e_variante(self):
+        """Testar que a resposta só vale para a mesma versão dos dados e variante do prompt"""
+        store = pregen.PregenStore()
+        store.put(1, QUESTION, "v1", "Sua última nota foi 9.", pregen.variant("verbose", "normal"))
+        self.assertTrue(store.has(1, "qual foi minha ULTIMA nota"))
+        self.assertEqual(store.get(1, "qual foi minha ULTIMA nota", "v1", "verbose:normal"), "Sua última nota foi 9.")
+        self.assertIsNone(store.get(1, QUESTION, "v2", "verbose:normal"))
+        self.assertIsNone(store.get(1, QUESTION, "v1", "verbose:ocupado"))
+        self.assertIsNone(store.get(1, QUESTION, "v1", "compact:normal"))
+
+    def test_janela_que_passa_da_meia_noite_vale_no_dia_seguinte(self):
+        """Testar que as respostas geradas antes da meia-noite valem no dia em que a janela termina"""
+        window = pregen.parse_window("23:00-05:00")
+        evening = datetime.datetime(2026, 3, 9, 23, 30)
+        self.assertEqual(pregen.serving_day(evening, window), datetime.date(2026, 3, 10))
+        self.assertEqual(pregen.serving_day(datetime.datetime(2026, 3, 10, 1, 0), window), datetime.date(2026, 3, 10))
+        # Fora da janela (execução manual), vale no próprio dia
+        self.assertEqual(pregen.serving_day(datetime.datetime(2026, 3, 10, 14, 0), window), datetime.date(2026, 3, 10))
+        self.assertEqual(pregen.serving_day(evening, pregen.parse_window("02:00-06:00")), datetime.date(2026, 3, 9))
+
+    def test_resposta_do_dia_seguinte_sobrevive_a_limpeza(self):
+        """Testar que prune mantém as respostas do dia seguinte e remove as de dias anteriores"""
+        store = pregen.PregenStore()
+        today = datetime.date.today()
+        store.put(1, QUESTION, "v1", "amanhã", "verbose:normal", day=today + datetime.timedelta(days=1))
+        store.put(2, QUESTION, "v1", "ontem", "verbose:normal", day=today - datetime.timedelta(days=1))
+        self.assertEqual(store.prune(), 1)
+        self.assertIsNone(store.get(1, QUESTION, "v1", "verbose:normal"))
+        self.assertEqual(store.get(1, QUESTION, "v1", "verbose:normal", day=today + datetime.timedelta(days=1)), "amanhã")
+        self.assertFalse(store.has(2, QUESTION))
+
+class PregenServiceTestCase(unittest.TestCase):
+    """Testes da pré-geração no serviço, com o modelo simulado e o backend substituto"""
+
+    @classmethod
+    def setUpClass(cls):
+        llm_service.setup_llm()
+
+    def setUp(self):
+        self.handler = type("Handler", (StubHandler,), {"students": copy.deepcopy(STUDENTS), "usage_records": []})
+        self.backend = StubBackend(handler=self.handler).start()
+        self.previous_urls = [e.url for e in llm_service.backend_pool.endpoints]
+        llm_service.set_backend_urls([self.backend.url])
+        self.previous_questions = llm_service.pregen_questions
+        llm_service.pregen_questions = [QUESTION]
+        llm_service.pregen_store = pregen.PregenStore()
+        self.previous_enabled = llm_service.pregen_enabled
+        llm_service.pregen_enabled = True
+
+    def tearDown(self):
+        llm_service.set_backend_urls(self.previous_urls)
+        llm_service.pregen_questions = self.previous_questions
+        llm_service.pregen_enabled = self.previous_enabled
+        self.backend.stop()
+
+    def counter(self, name: str) -> int:
+        return metrics.snapshot()["counters"].get(name, 0)
+
+    def test_pregeracao_e_acerto(self):
+        """Testar que a resposta pré-gerada é servida à pergunta equivalente em prosa"""
+        summary = asyncio.run(llm_service.pregenerate())
+        self.assertEqual(summary["status"], "concluida")
+        self.assertEqual(summary["generated"], len(STUDENTS))
+        self.assertEqual(summary["errors"], 0)
+        stored = llm_service.pregen_store.get(1, QUESTION, pregen.data_version(self.handler.students[1]),
+                                              pregen.variant(llm_service.prompt_context_format, "normal"))
+        self.assertTrue(stored)
+
+        hits = self.counter("pregen_hits")
+        answer = asyncio.run(llm_service.generate_response("qual foi minha ultima nota", 1, mode="prose"))
+        self.assertEqual(answer, stored)
+        self.assertEqual(self.counter("pregen_hits"), hits + 1)
+
+        # Segunda execução no mesmo dia, sem mudanças: nada a gerar
+        summary = asyncio.run(llm_service.pregenerate())
+        self.assertEqual(summary["kept"], len(STUDENTS))
+        self.assertEqual(summary["generated"], 0)
+
+    def test_resposta_pregerada_servida_sob_carga(self):
+        """Testar que a resposta pré-gerada é servida também fora do perfil de carga normal"""
+        asyncio.run(llm_service.pregenerate())
+        previous = llm_service.load_governor
+        llm_service.load_governor = LoadGovernor(lambda: 2, [2, 4, 8])
+        try:
+            self.assertEqual(llm_service.load_governor.current()["name"], "ocupado")
+            hits, outdated = self.counter("pregen_hits"), self.counter("pregen_outdated")
+            answer = asyncio.run(llm_service.generate_response(QUESTION, 1, mode="prose"))
+        finally:
+            llm_service.load_governor = previous
+        self.assertEqual(self.counter("pregen_hits"), hits + 1)
+        self.assertEqual(self.counter("pregen_outdated"), outdated)
+        self.assertEqual(answer, llm_service.pregen_store.get(
+            1, QUESTION, pregen.data_version(self.handler.students[1]),
+            pregen.variant(llm_service.prompt_context_format, llm_service.PREGEN_PROFILE)))
+
+    def test_dados_alterados_invalidam_a_resposta(self):
+        """Testar que a mudança dos dados do aluno invalida a resposta pré-gerada"""
+        asyncio.run(llm_service.pregenerate())
+        self.handler.students[1]["notas"][0]["nota_final"] = "0.00"
+        hits, outdated = self.counter("pregen_hits"), self.counter("pregen_outdated")
+        asyncio.run(llm_service.generate_response(QUESTION, 1, mode="prose"))
+        self.assertEqual(self.counter("pregen_hits"), hits)
+        self.assertEqual(self.counter("pregen_outdated"), outdated + 1)
+
+        summary = asyncio.run(llm_service.pregenerate())
+        self.assertEqual(summary["generated"], 1)
+        self.assertEqual(summary["kept"], len(STUDENTS) - 1)
+
+    def test_pergunta_sem_resposta_pregerada_conta_falta(self):
+        """Testar que a consulta elegível sem resposta guardada conta em pregen_misses"""
+        misses = self.counter("pregen_misses")
+        asyncio.run(llm_service.generate_response("Quais são minhas faltas?", 1, mode="prose"))
+        self.assertEqual(self.counter("pregen_misses"), misses + 1)
+
+    def test_pregeracao_desativada_nao_conta_faltas(self):
+        """Testar que, com LLM_PREGEN=0, as consultas não contam faltas de resposta pré-gerada"""
+        llm_service.pregen_enabled = False
+        misses = self.counter("pregen_misses")
+        asyncio.run(llm_service.generate_response(QUESTION, 1, mode="prose"))
+        self.assertEqual(self.counter("pregen_misses"), misses)
+
+    def test_modo_estruturado_nao_usa_resposta_pregerada(self):
+        """Testar que o modo estruturado gera a resposta em vez de usar a pré-gerada"""
+        asyncio.run(llm_service.pregenerate())
+        hits = self.counter("pregen_hits")
+        asyncio.run(llm_service.generate_response(QUESTION, 1, mode="structured"))
+        self.assertEqual(self.counter("pregen_hits"), hits)
+
+    def test_falha_de_um_aluno_nao_interrompe_o_lote(self):
+        """Testar que o erro na geração de um aluno é registrado e o lote continua"""
+        original = llm_service._pregenerate_answer
+
+        async def failing(student_data, question, until):
+            if student_data.get("id") == 2:
+                raise RuntimeError("falha simulada")
+            return await original(student_data, question, until)
+
+        llm_service._pregenerate_answer = failing
+        try:
+            with self.assertLogs("app.llm_service", "ERROR") as logs:
+                summary = asyncio.run(llm_service.pregenerate())
+        finally:
+            llm_service._pregenerate_answer = original
+        self.assertEqual(summary["status"], "concluida")
+        self.assertEqual(summary["errors"], 1)
+        self.assertEqual(summary["generated"], len(STUDENTS) - 1)
+        self.assertIn("falha simulada", logs.output[0])
@@ -0,0 +1,146 @@
+import asyncio
+import copy
+import unittest
+
+from fastapi.testclient import TestClient
+
+from app import llm_service, main
+from app.quota import QuotaTracker, Usage
+from benchmarks.fixtures import STUDENTS
+from benchmarks.stub_backend import StubBackend, StubHandler
+
+def usage(tokens: int, compute_s: float = 0.0) -> Usage:
+    u = Usage()
+    u.add(tokens // 2, tokens - tokens // 2, compute_s)
+    return u
+
+class QuotaTrackerTestCase(unittest.TestCase):
+    """Testes da janela de uso e das decisões do QuotaTracker"""
+
+    def setUp(self):
+        self.tracker = QuotaTracker(window_s=60, bucket_s=10, student_tokens=100, soft=0.8, hard=2.0)
+
+    def test_limites_do_aluno(self):
+        """Testar as decisões conforme a fração usada da cota do aluno"""
+        self.assertEqual(self.tracker.check(1, now=0), "ok")
+        self.tracker.record(1, usage(79), now=0)
+        self.assertEqual(self.tracker.check(1, now=1), "ok")
+        self.tracker.record(1, usage(1), now=1)
+        self.assertEqual(self.tracker.check(1, now=2), "reduzida")
+        self.tracker.record(1, usage(20), now=2)
+        self.assertEqual(self.tracker.check(1, now=3), "regras")
+        self.tracker.record(1, usage(100), now=3)
+        self.assertEqual(self.tracker.check(1, now=4), "bloqueada")
+        # Os outros alunos não são afetados
+        self.assertEqual(self.tracker.check(2, now=4), "ok")
+
+    def test_cota_de_computacao(self):
+        """Testar que a cota de tempo de computação também conta"""
+        tracker = QuotaTracker(window_s=60, bucket_s=10, student_compute_s=10)
+        tracker.record(1, usage(1, compute_s=10), now=0)
+        self.assertEqual(tracker.check(1, now=1), "regras")
+
+    def test_janela_deslizante(self):
+        """Testar que o uso sai da janela balde a balde"""
+        self.tracker.record(1, usage(100), now=5)
+        self.tracker.record(1, usage(10), now=25)
+        self.assertEqual(self.tracker.usage(1, now=30)["tokens"], 110)
+        self.assertEqual(self.tracker.usage(1, now=30)["requests"], 2)
+        self.assertEqual(self.tracker.check(1, now=30), "regras")
+        # O balde [0, 10) sai da janela quando now - 60 passa do início dele
+        self.assertAlmostEqual(self.tracker.retry_after(1, now=30), 30 + 10)
+        self.assertEqual(self.tracker.check(1, now=60), "regras")
+        self.assertEqual(self.tracker.check(1, now=61), "ok")
+        self.assertEqual(self.tracker.usage(1, now=61)["tokens"], 10)
+        self.assertEqual(self.tracker.usage(1, now=81)["tokens"], 0)
+        self.assertEqual(self.tracker.students, 0)
+
+    def test_uso_global_rebaixa_os_mais_pesados(self):
+        """Testar que a capacidade global esgotada rebaixa só os alunos com grande parte do uso"""
+        tracker = QuotaTracker(window_s=60, bucket_s=10, global_tokens=1000, heavy_share=0.2)
+        tracker.record(1, usage(900), now=0)
+        for student_id in range(2, 12):
+            tracker.record(student_id, usage(10), now=0)
+        self.assertEqual(tracker.check(1, now=1), "regras")
+        self.assertEqual(tracker.check(2, now=1), "ok")
+
+    def test_reset(self):
+        """Testar que o reset zera a janela do aluno, mas não o uso global nem o acumulado"""
+        self.tracker.record(1, usage(300), now=0)
+        self.assertEqual(self.tracker.check(1, now=1), "bloqueada")
+        self.assertTrue(self.tracker.reset(1))
+        self.assertEqual(self.tracker.check(1, now=1), "ok")
+        self.assertFalse(self.tracker.reset(1))
+        self.assertEqual(self.tracker._global.totals()["tokens"], 300)
+        record = self.tracker.take_pending()[0]
+        self.assertEqual(record["tokens_prompt"] + record["tokens_resposta"], 300)
+
+    def test_acumulado_para_o_backend(self):
+        """Testar o formato do acumulado e a devolução após falha no envio"""
+        self.tracker.record(1, usage(10, 0.5), now=0)
+        self.tracker.record(1, usage(20, 0.25), now=1)
+        records = self.tracker.take_pending()
+        self.assertEqual(len(records), 1)
+        self.assertEqual((records[0]["aluno"], records[0]["tokens_prompt"], records[0]["tokens_resposta"],
+                          records[0]["tempo_computo"], records[0]["requisicoes"]), (1, 15, 15, 0.75, 2))
+        self.assertEqual(self.tracker.take_pending(), [])
+        self.tracker.restore_pending(records)
+        self.assertEqual(self.tracker.take_pending()[0]["requisicoes"], 2)
+
+class QuotaServiceTestCase(unittest.TestCase):
+    """Testes da cota no serviço: recusa com 429, endpoints administrativos e envio ao backend"""
+
+    def setUp(self):
+        self.tracker = llm_service.quota_tracker
+        self.saved = (self.tracker.student_tokens, main.ADMIN_TOKEN)
+        self.tracker.student_tokens = 100
+        main.ADMIN_TOKEN = "segredo"
+        self.client = TestClient(main.app)
+        self.tracker.take_pending()
+
+    def tearDown(self):
+        self.tracker.student_tokens, main.ADMIN_TOKEN = self.saved
+        self.tracker.reset(1)
+        self.tracker.take_pending()
+
+    def admin(self, method: str, token: str = "segredo"):
+        return self.client.request(method, "/admin/quota/1", headers={"X-Admin-Token": token})
+
+    def test_consulta_bloqueada_e_reset(self):
+        """Testar a recusa com 429 e Retry-After e a liberação por DELETE /admin/quota/{id}"""
+        self.tracker.record(1, usage(250))
+        response = self.client.post("/api/query", json={"question": "Qual foi minha última nota?", "student_id": 1})
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response.headers["Retry-After"]), 0)
+        self.assertEqual(self.admin("GET").json()["decision"], "bloqueada")
+
+        self.assertEqual(self.admin("DELETE", token="errado").status_code, 403)
+        self.assertEqual(self.tracker.check(1), "bloqueada")
+        response = self.admin("DELETE")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"student_id": 1, "reset": True, "decision": "ok"})
+        self.assertEqual(self.admin("GET").json()["usage"]["tokens"], 0)
+
+    def test_envio_do_uso_ao_backend(self):
+        """Testar o envio do uso acumulado ao registrar do backend e a nova tentativa após falha"""
+        handler = type("Handler", (StubHandler,), {"students": copy.deepcopy(STUDENTS), "usage_records": []})
+        previous_urls = [e.url for e in llm_service.backend_pool.endpoints]
+        backend = StubBackend(handler=handler).start()
+        try:
+            llm_service.set_backend_urls([backend.url])
+            self.tracker.record(1, usage(40, 1.5))
+            self.assertEqual(asyncio.run(llm_service.flush_usage()), 1)
+            self.assertEqual(len(handler.usage_records), 1)
+            self.assertEqual(handler.usage_records[0]["aluno"], 1)
+            self.assertEqual(handler.usage_records[0]["tempo_computo"], 1.5)
+            self.assertEqual(asyncio.run(llm_service.flush_usage()), 0)
+
+            self.tracker.record(1, usage(10))
+            backend.stop()
+            self.assertEqual(asyncio.run(llm_service.flush_usage()), 0)
+            # O uso volta ao acumulado para a próxima tentativa
+            self.assertEqual(self.tracker.take_pending()[0]["tokens_prompt"], 5)
+        finally:
+            llm_service.set_backend_urls(previous_urls)
+            if backend._thread.is_alive():
+                backend.stop()
@@ -0,0 +1,67 @@
+import json
+import unittest
+
+from app import structured
+from app.fake_llama import FakeLlama
+from benchmarks.fixtures import STUDENTS
+
+STUDENT = STUDENTS[2]
+
+class StructuredTestCase(unittest.TestCase):
+    """Testes da interpretação e da montagem das respostas do modo estruturado"""
+
+    def test_indice_dos_registros(self):
+        """Testar os identificadores curtos e o limite de registros por tipo"""
+        index = structured.record_index(STUDENT)
+        self.assertIs(index["N1"], STUDENT["notas"][0])
+        self.assertIs(index["H2"], STUDENT["horarios"][1])
+        self.assertEqual(sum(1 for r in index if r.startswith("F")),
+                         min(len(STUDENT["dados_financeiros"]), structured.MAX_RECORDS["F"]))
+        self.assertEqual(structured.record_index({}), {})
+
+    def test_prompt_lista_os_registros(self):
+        """Testar que o prompt lista os registros com os ids usados na validação"""
+        prompt = structured.build_structured_prompt(STUDENT, "Qual é a minha nota?")
+        self.assertIn(f"N1: nota {STUDENT['notas'][0]['disciplina']} = {STUDENT['notas'][0]['nota_final']}", prompt)
+        self.assertTrue(prompt.endswith("Pergunta: Qual é a minha nota?<|end|>\n<|assistant|>"))
+        self.assertIn("(nenhum registro)", structured.build_structured_prompt({}, "Oi"))
+
+    def test_json_invalido(self):
+        """Testar que JSON inválido ou com intenção desconhecida é recusado"""
+        for text in ('{"intencao": "nota", "registros": [', '[]', '{"intencao": "outra", "registros": []}'):
+            self.assertEqual(structured.parse_structured(text, STUDENT), (None, []), text)
+
+    def test_registros_desconhecidos_sao_removidos(self):
+        """Testar que ids inexistentes são removidos e informados, e os repetidos aparecem uma vez"""
+        text = json.dumps({"intencao": "nota", "registros": ["N1", "N99", "N1", 7], "texto": "  Boa sorte!  "})
+        answer, unknown = structured.parse_structured(text, STUDENT)
+        self.assertEqual(answer["registros"], ["N1"])
+        self.assertEqual(unknown, ["N99"])
+        self.assertEqual(answer["texto"], "Boa sorte!")
+
+    def test_resposta_montada_pelos_templates(self):
+        """Testar a resposta montada com uma nota, vários horários e a mensalidade"""
+        nota, horario, mensalidade = STUDENT["notas"][0], STUDENT["horarios"][0], STUDENT["dados_financeiros"][0]
+        text = structured.render_answer({"intencao": "nota", "registros": ["N1"], "texto": ""}, STUDENT)
+        self.assertEqual(text, f"Olá {STUDENT['nome']}! Sua nota em {nota['disciplina']} é {nota['nota_final']}.")
+        text = structured.render_answer({"intencao": "horario", "registros": ["H1", "H2"], "texto": ""}, STUDENT)
+        self.assertIn(f"Seus horários: {horario['disciplina']}: {horario['dia_semana_display']}", text)
+        text = structured.render_answer({"intencao": "financeiro", "registros": ["F1"], "texto": "Ok."}, STUDENT)
+        self.assertIn(f"R${mensalidade['mensalidade']} vence em {mensalidade['data_vencimento']}", text)
+        self.assertTrue(text.endswith(" Ok."))
+
+    def test_sem_registros_nem_texto(self):
+        """Testar a resposta padrão quando o modelo não cita registros nem texto"""
+        text = structured.render_answer({"intencao": "geral", "registros": [], "texto": ""}, None)
+        self.assertEqual(text, "Olá Aluno! Não encontrei essa informação nos seus dados. Se precisar, procure a coordenação.")
+
+    def test_saida_do_modelo_simulado(self):
+        """Testar o ciclo completo com o JSON gerado pelo modelo simulado"""
+        model = FakeLlama(prefill_tps=1e6, decode_tps=1e6)
+        prompt = structured.build_structured_prompt(STUDENT, "Qual é a minha nota em Cálculo I?")
+        text = model(prompt, max_tokens=64, grammar=structured.GRAMMAR)["choices"][0]["text"]
+        answer, unknown = structured.parse_structured(text, STUDENT)
+        self.assertEqual(answer["intencao"], "nota")
+        self.assertEqual(unknown, [])
+        self.assertTrue(answer["registros"])
+        self.assertIn("Cálculo I", structured.render_answer(answer, STUDENT))
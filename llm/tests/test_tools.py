@@ -0,0 +1,55 @@
+import datetime
+import unittest
+
+from app import tools
+from app.tools import ToolCall
+
+# Uma quarta-feira
+TODAY = datetime.date(2024, 5, 15)
+
+class ToolsRouteTestCase(unittest.TestCase):
+    """Testes do roteador de ferramentas da busca seletiva (LLM_FETCH_MODE=tools)"""
+
+    def route(self, question: str):
+        return tools.route(question, today=TODAY)
+
+    def test_nota_de_uma_disciplina(self):
+        """Testar a nota de uma disciplina citada na pergunta"""
+        self.assertEqual(self.route("Qual é a minha nota em Cálculo I?"),
+                         [ToolCall("notas", {"disciplina": "Cálculo I"})])
+
+    def test_horarios_por_dia(self):
+        """Testar os horários de um dia, inclusive hoje e amanhã"""
+        self.assertEqual(self.route("Quais são minhas aulas na sexta?"),
+                         [ToolCall("horarios", {"dia_semana": "SEX"})])
+        self.assertEqual(self.route("Tenho aula hoje?"), [ToolCall("horarios", {"dia_semana": "QUA"})])
+        self.assertEqual(self.route("E amanhã, qual a sala?"), [ToolCall("horarios", {"dia_semana": "QUI"})])
+
+    def test_disciplina_prevalece_sobre_o_dia(self):
+        """Testar que, com disciplina citada, os horários filtram só pela disciplina"""
+        self.assertEqual(self.route("Qual o horário de Física II na segunda?"),
+                         [ToolCall("horarios", {"disciplina": "Física II"})])
+
+    def test_financeiro_por_status(self):
+        """Testar o filtro de status das mensalidades"""
+        self.assertEqual(self.route("Tenho mensalidade atrasada?"),
+                         [ToolCall("financeiro", {"status_pagamento": "ATRASADO"})])
+        self.assertEqual(self.route("Quando vence minha próxima mensalidade?"),
+                         [ToolCall("financeiro", {"status_pagamento": "PENDENTE"})])
+        self.assertEqual(self.route("Quanto paguei de mensalidade?"), [ToolCall("financeiro", {})])
+
+    def test_varias_ferramentas(self):
+        """Testar a pergunta que precisa de mais de uma ferramenta"""
+        calls = self.route("Quantas faltas e qual a nota em Banco de Dados?")
+        self.assertEqual(calls, [ToolCall("notas", {"disciplina": "Banco de Dados"}),
+                                 ToolCall("frequencias", {"disciplina": "Banco de Dados"})])
+
+    def test_sem_palavras_chave(self):
+        """Testar que a pergunta sem correspondência usa as ferramentas padrão"""
+        self.assertEqual([c.name for c in self.route("Oi, tudo bem?")], list(tools.DEFAULT_TOOLS))
+
+    def test_extracao_de_disciplina(self):
+        """Testar que dias e "hoje" não são tomados por nomes de disciplina"""
+        self.assertEqual(tools.extract_disciplina("nota de Estruturas de Dados"), "Estruturas de Dados")
+        self.assertIsNone(tools.extract_disciplina("aula na Segunda"))
+        self.assertIsNone(tools.extract_disciplina("qual a minha nota?"))